@@ -1,8 +1,11 @@
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import asyncio
+import asyncio, json
+from contextlib import asynccontextmanager
 from src.empowering_agents.personalities.learning_navigator import LearningNavigator
 from src.empowering_agents.personalities.fitness_coach import FitnessCoach
+from src.empowering_agents.utils.llm_utils import close_http_clients
 
 app = FastAPI(title="Empowering Agents API")
 
@@ -10,6 +13,14 @@ app = FastAPI(title="Empowering Agents API")
 learning_agent = LearningNavigator(llm_config={"temperature": 0.3})
 fitness_agent = FitnessCoach(llm_config={"temperature": 0.2})
 
+@asynccontextmanager
+async def aclosing(agen):
+    # contextlib.aclosing is 3.10+; this package supports 3.9
+    try:
+        yield agen
+    finally:
+        await agen.aclose()
+
 class ChatRequest(BaseModel):
     user_id: str
     message: str
@@ -24,8 +35,34 @@ async def chat(req: ChatRequest):
         "actions": resp.actions,
         "goal_updates": resp.goal_updates,
         "personalization_learned": resp.personalization_learned,
+        "timed_out_tools": resp.timed_out_tools,
     }
 
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """Server-sent events: one `data: {"delta": ...}` per chunk, then `data: [DONE]`."""
+    agent = learning_agent if req.persona == "learning" else fitness_agent
+
+    async def events():
+        # aclosing: on client disconnect the turn is finished and the user lock released now, not at GC
+        async with aclosing(agent.interact_stream(req.user_id, req.message)) as stream:
+            async for chunk in stream:
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    # persist queued memory writes, then release pooled LLM connections
+    await learning_agent.aclose()
+    await fitness_agent.aclose()
+    await close_http_clients()
+
 @app.get("/healthz")
 def healthz():
     return {"ok": True}
@@ -1,14 +1,19 @@
 import asyncio
-from typing import Dict, List, Any, Optional
+import os
+from typing import Dict, List, Any, Optional, Tuple, AsyncIterator
 from datetime import datetime
 import json
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
 
 from .memory import UserMemorySystem, GoalTracker
 from .planning import GoalPlanner, ActionPlanner
 from .tools import ToolRegistry
-from ..utils.llm_utils import LLMClient
+from .intent import get_intent_classifier, append_intent_log, LABELS as INTENT_FLAGS
+from ..utils.llm_utils import LLMClient, JSONFieldStream
+from ..utils.env import load_env
+from ..integrations.notifications import get_notification_dispatcher
 
 @dataclass
 class UserGoal:
@@ -31,6 +36,7 @@ class AgentResponse:
     actions: List[Dict[str, Any]] = None
     goal_updates: List[Dict[str, Any]] = None
     personalization_learned: Dict[str, Any] = None
+    timed_out_tools: List[str] = None
 
     def __post_init__(self):
         if self.actions is None:
@@ -39,6 +45,19 @@ class AgentResponse:
             self.goal_updates = []
         if self.personalization_learned is None:
             self.personalization_learned = {}
+        if self.timed_out_tools is None:
+            self.timed_out_tools = []
+
+TWO_PASS = "two_pass"
+SINGLE_PASS = "single_pass"
+
+@dataclass
+class PreparedTurn:
+    """State carried from turn preparation to the final reply."""
+    user_memory: Dict[str, Any]
+    response_prompt: Optional[str] = None
+    raw_response: Optional[str] = None  # already-complete reply (single-pass, no tools)
+    timed_out_tools: List[str] = field(default_factory=list)
 
 class EmpoweringAgent(ABC):
     def __init__(
@@ -46,19 +65,46 @@ class EmpoweringAgent(ABC):
         agent_id: str,
         personality_config: Dict[str, Any],
         llm_config: Dict[str, Any],
-        tools: Optional[List[str]] = None
+        tools: Optional[List[str]] = None,
+        tool_timeouts: Optional[Dict[str, float]] = None,
+        interaction_mode: Optional[str] = None
     ):
+        load_env()
         self.agent_id = agent_id
         self.personality_config = personality_config
         self.llm_config = llm_config
+        # "two_pass" (intent call + reply call) or "single_pass" (one merged call)
+        self.interaction_mode = (
+            interaction_mode
+            or personality_config.get("interaction_mode")
+            or os.getenv("AGENT_INTERACTION_MODE", TWO_PASS)
+        ).lower()
+        if self.interaction_mode not in (TWO_PASS, SINGLE_PASS):
+            raise ValueError(f"Unknown interaction_mode: {self.interaction_mode}")
 
         self.llm = LLMClient.from_env(llm_config)
 
         self.memory_system = UserMemorySystem()
-        self.goal_tracker = GoalTracker()
+        # Turns for one user are serialized (process-wide, or across workers
+        # with USER_LOCKS=file); different users run concurrently
+        self.locks = self.memory_system.locks
+        self.goal_tracker = GoalTracker(
+            backend=self.memory_system.backend, io_executor=self.memory_system.io_executor,
+            locks=self.locks
+        )
         self.goal_planner = GoalPlanner(self.llm)
         self.action_planner = ActionPlanner(self.llm)
         self.tool_registry = ToolRegistry(tools or [])
+        # Per-tool deadline in seconds; tools not listed use the default
+        self.default_tool_timeout = float(os.getenv("TOOL_TIMEOUT_SECONDS", "5.0"))
+        self.tool_timeouts = dict(tool_timeouts or {})
+        # Local intent fast-path: the LLM intent call is skipped when the
+        # classifier is at least this confident (set above 1.0 to disable)
+        self.intent_classifier = get_intent_classifier()
+        self.intent_confidence_threshold = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.9"))
+        self.intent_log_path = os.getenv("INTENT_LOG_PATH")
+        self.recall_top_k = int(os.getenv("RECALL_TOP_K", "3"))
+        self.notifier = get_notification_dispatcher()
 
         self.interaction_count = 0
         self.goals_helped_complete = 0
@@ -70,32 +116,163 @@ class EmpoweringAgent(ABC):
         message: str,
         context: Optional[Dict[str, Any]] = None
     ) -> AgentResponse:
+        async with self._user_turn(user_id):
+            turn = await self._prepare_turn(user_id, message, context)
+
+            raw_response = turn.raw_response
+            if raw_response is None:
+                raw_response = await self.llm.generate(turn.response_prompt)
+
+            return await self._finish_turn(user_id, message, raw_response, turn)
+
+    async def interact_stream(
+        self,
+        user_id: str,
+        message: str,
+        context: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Like interact(), but yields the reply message text as the LLM
+        produces it: the "message" field is decoded out of the streamed JSON
+        (plain-text replies and errors pass through). Memory and goals are
+        updated once the stream completes; if the caller stops early (client
+        disconnect) the turn is recorded with the text shown so far. Close
+        the generator promptly (contextlib.aclosing) so the user lock is
+        released. In single-pass mode a reply that needed no tools is already
+        complete after preparation and is yielded as one chunk.
+        """
+        async with self._user_turn(user_id):
+            turn = await self._prepare_turn(user_id, message, context)
+
+            if turn.raw_response is not None:
+                try:
+                    yield str(self._parse_agent_response(turn.raw_response).get("message", ""))
+                finally:
+                    await self._finish_turn(user_id, message, turn.raw_response, turn)
+                return
+
+            reply = JSONFieldStream("message")
+            completed = False
+            try:
+                async for chunk in self.llm.stream(turn.response_prompt):
+                    text = reply.feed(chunk)
+                    if text:
+                        yield text
+                completed = True
+                tail = reply.finish()
+                if tail:
+                    yield tail
+            finally:
+                await self._finish_turn(user_id, message, reply.raw if completed else reply.text, turn)
+
+    @asynccontextmanager
+    async def _user_turn(self, user_id: str):
+        """Hold the user's lock for a whole turn (read memory -> reply -> write memory)."""
+        async with self.locks.lock(user_id):
+            if self.locks.cross_process:
+                # another worker may have served this user since we cached it
+                await self.memory_system.refresh(user_id)
+                self.goal_tracker.invalidate(user_id)
+            try:
+                yield
+            finally:
+                if self.locks.cross_process:
+                    # make the writes visible before the next worker takes the lock
+                    await self.memory_system.flush(user_id)
+
+    async def _prepare_turn(
+        self,
+        user_id: str,
+        message: str,
+        context: Optional[Dict[str, Any]]
+    ) -> PreparedTurn:
         self.interaction_count += 1
 
         user_memory = await self.memory_system.load_user_memory(user_id)
+        recalled = await self.memory_system.recall_relevant(user_id, message, self.recall_top_k)
+        if recalled:
+            user_memory = {**user_memory, "recalled": recalled}
         user_goals = await self.goal_tracker.get_active_goals(user_id)
+        personality_context = self._get_personality_context()
 
-        intent = await self._analyze_user_intent(message, user_memory, context)
+        if self.interaction_mode == SINGLE_PASS:
+            # One call returns intent + reply; only pay a second call for tools
+            single_pass_prompt = self._build_single_pass_prompt(
+                message, user_memory, user_goals, personality_context
+            )
+            raw = await self.llm.generate(single_pass_prompt)
+            intent, reply = self._split_single_pass_response(raw, message)
+            if not await self._identify_tools_needed(intent):
+                return PreparedTurn(user_memory=user_memory, raw_response=reply)
+        else:
+            intent = await self._analyze_user_intent(message, user_memory, context)
 
         tools_needed = await self._identify_tools_needed(intent)
-        tool_results = {}
-        for tool_name in tools_needed:
-            tool_result = await self.tool_registry.use_tool(
-                tool_name, user_id, intent, context or {}
-            )
-            tool_results[tool_name] = tool_result
+        tool_results, timed_out = await self._run_tools(tools_needed, user_id, intent, context)
 
-        personality_context = self._get_personality_context()
         response_prompt = self._build_response_prompt(
             message, intent, user_memory, user_goals, personality_context, tool_results
         )
+        return PreparedTurn(
+            user_memory=user_memory, response_prompt=response_prompt, timed_out_tools=timed_out
+        )
 
-        raw_response = await self.llm.generate(response_prompt)
+    async def _run_tools(
+        self,
+        tools_needed: List[str],
+        user_id: str,
+        intent: Dict[str, Any],
+        context: Optional[Dict[str, Any]]
+    ) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Run all needed tools concurrently, each under its own deadline.
+        A tool that times out or raises contributes an error entry instead of
+        failing the turn; the names of timed-out tools are returned separately.
+        """
+        async def _run_one(tool_name: str):
+            timeout = self.tool_timeouts.get(tool_name, self.default_tool_timeout)
+            return await asyncio.wait_for(
+                self.tool_registry.use_tool(tool_name, user_id, intent, context or {}),
+                timeout=timeout,
+            )
 
+        outcomes = await asyncio.gather(
+            *(_run_one(name) for name in tools_needed), return_exceptions=True
+        )
+        tool_results: Dict[str, Any] = {}
+        timed_out: List[str] = []
+        for tool_name, outcome in zip(tools_needed, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                timed_out.append(tool_name)
+                tool_results[tool_name] = {"error": "timeout"}
+            elif isinstance(outcome, Exception):
+                tool_results[tool_name] = {"error": str(outcome)}
+            else:
+                tool_results[tool_name] = outcome
+        return tool_results, timed_out
+
+    async def _finish_turn(
+        self,
+        user_id: str,
+        message: str,
+        raw_response: str,
+        turn: PreparedTurn
+    ) -> AgentResponse:
         structured = self._parse_agent_response(raw_response)
         agent_response = AgentResponse(**structured)
+        agent_response.timed_out_tools = list(turn.timed_out_tools)
+
+        await self._update_user_state(user_id, message, agent_response, turn.user_memory)
 
-        await self._update_user_state(user_id, message, agent_response, user_memory)
+        # "notify" actions are queued; delivery happens after the turn returns.
+        # The channel comes from the LLM, so an unknown one falls back to the default.
+        for action in agent_response.actions:
+            if isinstance(action, dict) and action.get("type") == "notify":
+                text = str(action.get("details") or action.get("message") or "").strip()
+                if not text:
+                    continue
+                channel = action.get("channel")
+                self.notifier.enqueue(user_id, text, channel if channel in self.notifier.channels else None)
 
         return agent_response
 
@@ -105,6 +282,12 @@ class EmpoweringAgent(ABC):
         user_memory: Dict[str, Any],
         context: Optional[Dict[str, Any]]
     ) -> Dict[str, Any]:
+        local = self.intent_classifier.classify(message)
+        if local["confidence"] >= self.intent_confidence_threshold:
+            intent = self._fallback_intent(message, local)
+            intent["intent_source"] = "local"
+            return intent
+
         prompt = f'''
 You are an intent analyzer for empowerment-focused agents.
 
@@ -122,18 +305,86 @@ Return JSON with keys:
 '''
         analysis = await self.llm.generate(prompt)
         try:
-            return json.loads(analysis)
+            intent = json.loads(analysis)
         except Exception:
-            # Simple fallback
-            return {
-                "surface_intent": message,
-                "deeper_needs": "help user progress toward their goal",
-                "goal_relevance": "unknown",
-                "empowerment_opportunity": "provide next steps and resources",
-                "needs_scheduling": "schedule" in message.lower(),
-                "needs_data_lookup": any(k in message.lower() for k in ["what", "how", "resource", "find"]),
-                "needs_external_service": False,
-            }
+            return self._fallback_intent(message, local)
+        if self.intent_log_path and isinstance(intent, dict) and any(f in intent for f in INTENT_FLAGS):
+            # LLM-labelled examples for retraining the local classifier
+            await asyncio.to_thread(append_intent_log, self.intent_log_path, message, intent)
+        return intent
+
+    def _fallback_intent(self, message: str, flags: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Generic intent with tool flags from the local classifier
+        flags = flags or self.intent_classifier.classify(message)
+        return {
+            "surface_intent": message,
+            "deeper_needs": "help user progress toward their goal",
+            "goal_relevance": "unknown",
+            "empowerment_opportunity": "provide next steps and resources",
+            "needs_scheduling": flags["needs_scheduling"],
+            "needs_data_lookup": flags["needs_data_lookup"],
+            "needs_external_service": flags["needs_external_service"],
+            "confidence": flags["confidence"],
+        }
+
+    @staticmethod
+    def _format_recalled(user_memory: Dict[str, Any], max_chars: int = 200) -> str:
+        """Older exchanges pulled back in by recall_relevant(), for the prompt."""
+        recalled = user_memory.get("recalled") or []
+        if not recalled:
+            return ""
+        lines = [
+            f"- ({r.get('timestamp', '')[:10]}) user: {r.get('user_message', '')[:max_chars]}"
+            f" | you: {r.get('agent_response', '')[:max_chars]}"
+            for r in recalled
+        ]
+        return "Relevant past exchanges:\n" + "\n".join(lines) + "\n"
+
+    def _build_single_pass_prompt(
+        self,
+        message: str,
+        user_memory: Dict[str, Any],
+        user_goals: List[UserGoal],
+        personality_context: str
+    ) -> str:
+        goals_ctx = "\n".join(
+            f"- {g.get('description','')} ({int(g.get('current_progress',0.0)*100)}%)"
+            for g in user_goals
+        )
+        return f'''
+{personality_context}
+
+User Summary: {json.dumps(user_memory.get("summary", {}))}
+Active goals:
+{goals_ctx or "- none"}
+{self._format_recalled(user_memory)}
+User says: "{message}"
+
+First analyze the intent, then reply. If answering properly needs a tool
+(scheduling, a knowledge lookup or an external service), set the matching
+flag and keep "message" short; the reply will be regenerated with tool results.
+
+Return JSON with keys:
+- "intent": {{"surface_intent", "deeper_needs", "goal_relevance", "empowerment_opportunity",
+  "needs_scheduling" (bool), "needs_data_lookup" (bool), "needs_external_service" (bool)}}
+- "message": a helpful reply
+- "actions": list of suggested actions
+- "goal_updates": optional updates (goal_id, progress)
+- "personalization_learned": new prefs
+'''
+
+    def _split_single_pass_response(self, response: str, message: str) -> Tuple[Dict[str, Any], str]:
+        """Separate the intent block from the reply; the reply is re-serialized for _parse_agent_response."""
+        try:
+            data = json.loads(response)
+        except Exception:
+            return self._fallback_intent(message), response
+        if not isinstance(data, dict):
+            return self._fallback_intent(message), response
+        intent = data.pop("intent", None)
+        if not isinstance(intent, dict):
+            intent = self._fallback_intent(message)
+        return intent, json.dumps(data)
 
     @abstractmethod
     def _get_personality_context(self) -> str:
@@ -191,12 +442,19 @@ Return JSON with keys:
             tools.append("external_api")
         return tools
 
+    async def aclose(self):
+        """Flush pending memory writes and notifications and release storage; call on app shutdown."""
+        await self.notifier.flush()
+        await self.goal_tracker.close()
+        await self.memory_system.close()
+
     def get_empowerment_metrics(self) -> Dict[str, Any]:
         avg_sat = (
             sum(self.user_satisfaction_scores) / len(self.user_satisfaction_scores)
             if self.user_satisfaction_scores else 0.0
         )
         return {
+            "interaction_mode": self.interaction_mode,
             "total_interactions": self.interaction_count,
             "goals_helped_complete": self.goals_helped_complete,
             "average_satisfaction": avg_sat,
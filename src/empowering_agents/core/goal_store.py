@@ -0,0 +1,161 @@
+import os
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .storage import MemoryBackend, DURABILITY_FSYNC, DURABILITY_RELAXED
+
+
+class GoalJournal:
+    """
+    Durable goal store for every user: goals.snapshot.json plus an
+    append-only goals.journal.jsonl of upserts.
+
+    load_all() reads the snapshot in one json.load and replays the journal
+    on top, which is what makes restoring millions of goals at boot fast.
+    Journal records carry a sequence number assigned by the caller on the
+    event loop (reserve()), so the newest record for a goal wins even if
+    two writer threads append out of order. To compact, rotate() the
+    journal, then write_snapshot() the caller's state as of that point.
+    Single-process: share goals across workers with GOAL_STORE=backend.
+    """
+    def __init__(self, storage_dir: str = "./.mem/goals", compact_every: int = 10000, fsync: bool = False):
+        self.storage_dir = storage_dir
+        self.compact_every = compact_every
+        self.fsync = fsync
+        os.makedirs(storage_dir, exist_ok=True)
+        self.snapshot_path = os.path.join(storage_dir, "goals.snapshot.json")
+        self.journal_path = os.path.join(storage_dir, "goals.journal.jsonl")
+        self.seq = 0                 # last sequence number handed out
+        self.journal_records = 0     # records since the last snapshot
+        self._lock = threading.Lock()
+        self._journal = None
+
+    def load_all(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """{user_id: {goal_id: goal}} as of the last durable write."""
+        users: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        snap_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            snap_seq = data.get("seq", 0)
+            for user_id, goals in data.get("users", {}).items():
+                users[user_id] = {g["id"]: g for g in goals}
+        latest: Dict[Tuple[str, str], int] = {}
+        seq = snap_seq
+        replayed = 0
+        # ".compacting" holds records of an interrupted compaction; replay it first
+        for path in (self.journal_path + ".compacting", self.journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line after a crash
+                    replayed += 1
+                    rec_seq = rec.get("seq", 0)
+                    seq = max(seq, rec_seq)
+                    if rec_seq <= snap_seq:
+                        continue
+                    goal = rec["goal"]
+                    key = (rec["user_id"], goal["id"])
+                    if latest.get(key, 0) < rec_seq:
+                        latest[key] = rec_seq
+                        users.setdefault(rec["user_id"], {})[goal["id"]] = goal
+        self.seq = seq
+        self.journal_records = replayed
+        return users
+
+    def reserve(self, count: int) -> int:
+        """Hand out count sequence numbers; returns the first. Call from the event loop."""
+        first = self.seq + 1
+        self.seq += count
+        return first
+
+    def save_goals(self, items: Iterable[Tuple[str, Dict[str, Any]]], first_seq: Optional[int] = None):
+        items = list(items)
+        if not items:
+            return
+        if first_seq is None:
+            first_seq = self.reserve(len(items))
+        lines = "".join(
+            json.dumps({"seq": first_seq + i, "user_id": user_id, "goal": goal}, separators=(",", ":")) + "\n"
+            for i, (user_id, goal) in enumerate(items)
+        )
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(lines)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self.journal_records += len(items)
+
+    def needs_compaction(self) -> bool:
+        return self.journal_records >= self.compact_every
+
+    def rotate(self):
+        """Move the live journal aside; every record in it is covered by the next snapshot."""
+        pending = self.journal_path + ".compacting"
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if not os.path.exists(self.journal_path):
+                return
+            if os.path.exists(pending):
+                # left by a crashed compaction: fold the live journal into it
+                with open(self.journal_path, "r", encoding="utf-8") as src, \
+                        open(pending, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, pending)
+            self.journal_records = 0
+
+    def write_snapshot(self, users: Dict[str, List[Dict[str, Any]]], seq: int):
+        """users must include every change up to seq (and may include later ones)."""
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "users": users}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        pending = self.journal_path + ".compacting"
+        if os.path.exists(pending):
+            os.remove(pending)
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+def create_goal_store(backend: Optional[MemoryBackend] = None):
+    """
+    GOAL_STORE=backend (default): goals go to the memory backend when it
+    persists them (SQLite); a backend that cannot (the JSON file backend)
+    gets a GoalJournal under <its storage_dir>/goals instead, so goals
+    always survive a restart. GOAL_STORE=journal: a GoalJournal under
+    GOAL_JOURNAL_DIR. Journals are compacted every GOAL_JOURNAL_COMPACT_EVERY
+    records; MEMORY_DURABILITY=fsync syncs each write. Without a backend
+    (GoalTracker() in scripts and tests) goals stay in memory.
+    """
+    kind = os.getenv("GOAL_STORE", "backend").lower()
+    if kind not in ("backend", "journal"):
+        raise ValueError(f"Unknown GOAL_STORE: {kind}")
+    if kind == "backend" and (backend is None or backend.persists_goals):
+        return backend
+    journal_dir = os.getenv("GOAL_JOURNAL_DIR")
+    if not journal_dir:
+        base = getattr(backend, "storage_dir", None) if kind == "backend" else None
+        journal_dir = os.path.join(base, "goals") if base else "./.mem/goals"
+    durability = os.getenv("MEMORY_DURABILITY", DURABILITY_RELAXED).lower()
+    return GoalJournal(
+        journal_dir,
+        compact_every=int(os.getenv("GOAL_JOURNAL_COMPACT_EVERY", "10000")),
+        fsync=durability == DURABILITY_FSYNC,
+    )
@@ -0,0 +1,167 @@
+import os, re, json, math
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+LABELS = ("needs_scheduling", "needs_data_lookup", "needs_external_service")
+
+# Seed weights: strong cues push a label over the threshold on their own,
+# weak cues ("what", "how") only add evidence and usually leave the
+# decision to the LLM.
+STRONG, WEAK = 6.0, 3.5
+DEFAULT_KEYWORDS: Dict[str, Dict[str, float]] = {
+    "needs_scheduling": {
+        "schedule": STRONG, "reschedule": STRONG, "calendar": STRONG, "book": WEAK,
+        "remind": STRONG, "reminder": STRONG, "appointment": STRONG, "slot": WEAK,
+        "block": WEAK, "tomorrow": WEAK, "tonight": WEAK, "this evening": WEAK, "next week": WEAK,
+    },
+    "needs_data_lookup": {
+        "resource": STRONG, "resources": STRONG, "find": STRONG, "explain": STRONG,
+        "recommend": STRONG, "article": STRONG, "guide": WEAK, "course": WEAK,
+        "what": WEAK, "how": WEAK, "why": WEAK,
+    },
+    "needs_external_service": {
+        "email": STRONG, "crm": STRONG, "sync": STRONG, "webhook": STRONG,
+        "notify": WEAK, "send": WEAK, "export": WEAK, "import": WEAK, "publish": WEAK,
+    },
+}
+DEFAULT_BIAS = -3.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _features(message: str) -> List[str]:
+    tokens = _TOKEN_RE.findall(message.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _sigmoid(x: float) -> float:
+    if x < -30:
+        return 0.0
+    if x > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+class IntentClassifier:
+    """
+    Local fast-path for the tool-routing intent flags.
+
+    A tiny multi-label logistic model over unigram/bigram features: one dict
+    lookup per feature yields the contribution to every label. It starts from
+    keyword seed weights and can be refined with fit() on logged LLM intents.
+    """
+    def __init__(
+        self,
+        weights: Optional[Dict[str, List[float]]] = None,
+        bias: Optional[List[float]] = None,
+    ):
+        if weights is None:
+            weights = {}
+            for i, label in enumerate(LABELS):
+                for kw, w in DEFAULT_KEYWORDS[label].items():
+                    weights.setdefault(kw, [0.0] * len(LABELS))[i] = w
+        self.weights: Dict[str, List[float]] = weights
+        self.bias: List[float] = list(bias) if bias is not None else [DEFAULT_BIAS] * len(LABELS)
+
+    def _probabilities(self, feats: List[str]) -> List[float]:
+        scores = list(self.bias)
+        seen = set()
+        for f in feats:
+            if f in seen:
+                continue
+            seen.add(f)
+            w = self.weights.get(f)
+            if w is not None:
+                for i in range(len(LABELS)):
+                    scores[i] += w[i]
+        return [_sigmoid(s) for s in scores]
+
+    def classify(self, message: str) -> Dict[str, Any]:
+        """
+        Returns the three needs_* flags plus a confidence in [0.5, 1], or 0.0
+        when no feature of the message is known: all-False then only reflects
+        the bias, so the caller should defer to the LLM.
+        """
+        feats = _features(message)
+        probs = self._probabilities(feats)
+        result: Dict[str, Any] = {label: p >= 0.5 for label, p in zip(LABELS, probs)}
+        if not any(f in self.weights for f in feats):
+            result["confidence"] = 0.0
+            return result
+        # the decision is only as certain as its least certain flag
+        result["confidence"] = min(max(p, 1.0 - p) for p in probs)
+        return result
+
+    def fit(self, examples: Iterable[Tuple[str, Dict[str, Any]]], epochs: int = 5, lr: float = 0.3):
+        """SGD logistic regression on (message, intent) pairs, e.g. from an intent log."""
+        data = [(_features(m), [1.0 if intent.get(l) else 0.0 for l in LABELS]) for m, intent in examples]
+        for _ in range(epochs):
+            for feats, target in data:
+                probs = self._probabilities(feats)
+                for i in range(len(LABELS)):
+                    grad = target[i] - probs[i]
+                    if grad == 0.0:
+                        continue
+                    self.bias[i] += lr * grad
+                    for f in set(feats):
+                        self.weights.setdefault(f, [0.0] * len(LABELS))[i] += lr * grad
+        return self
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"labels": list(LABELS), "bias": self.bias, "weights": self.weights}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(weights=data["weights"], bias=data["bias"])
+
+
+def read_intent_log(path: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Reads JSONL records of {"message": ..., "intent": {...}} as training pairs."""
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                examples.append((rec["message"], rec["intent"]))
+            except Exception:
+                continue
+    return examples
+
+
+def append_intent_log(path: str, message: str, intent: Dict[str, Any]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    rec = {"message": message, "intent": {l: bool(intent.get(l)) for l in LABELS}}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(rec) + "\n")
+
+
+_DEFAULT_CLASSIFIER: Optional[IntentClassifier] = None
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """Process-wide classifier; loads INTENT_MODEL_PATH when it exists, else seed weights."""
+    global _DEFAULT_CLASSIFIER
+    if _DEFAULT_CLASSIFIER is None:
+        path = os.getenv("INTENT_MODEL_PATH")
+        if path and os.path.exists(path):
+            try:
+                _DEFAULT_CLASSIFIER = IntentClassifier.load(path)
+            except Exception:
+                _DEFAULT_CLASSIFIER = IntentClassifier()
+        else:
+            _DEFAULT_CLASSIFIER = IntentClassifier()
+    return _DEFAULT_CLASSIFIER
+
+
+if __name__ == "__main__":
+    # python -m src.empowering_agents.core.intent <intent_log.jsonl> <model.json>
+    import sys
+    if len(sys.argv) != 3:
+        print("usage: intent.py <intent_log.jsonl> <model.json>")
+        sys.exit(1)
+    examples = read_intent_log(sys.argv[1])
+    IntentClassifier().fit(examples).save(sys.argv[2])
+    print(f"Trained on {len(examples)} examples -> {sys.argv[2]}")
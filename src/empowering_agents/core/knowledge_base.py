@@ -0,0 +1,337 @@
+import os, re, sys, json, math, mmap, heapq, shutil, struct, asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..utils.lru import LRUCache
+
+
+# On-disk layout (all little-endian, every file memory-mapped read-only):
+#   meta.json      {"version", "docs", "terms", "avgdl", "k1", "b"}
+#   terms.bin      sorted terms, utf-8, concatenated
+#   lexicon.bin    per term: term_off u64, term_len u32, df u32, postings_off u64
+#   postings.bin   per term: df doc ids (u32), then df term frequencies (u32)
+#   doclens.bin    per doc: length in tokens (u32)
+#   docs.bin       per doc: text_off u64, text_len u32, path_off u64, path_len u32
+#   texts.bin      document texts and paths, utf-8
+INDEX_VERSION = 1
+_LEX = struct.Struct("<QIIQ")
+_DOC = struct.Struct("<QIQI")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_LITTLE = sys.byteorder == "little"
+
+DEFAULT_EXTENSIONS = (".txt", ".md")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _u32(buf, offset: int, count: int):
+    """count uint32s at offset, without copying when the host is little-endian."""
+    view = memoryview(buf)[offset:offset + 4 * count]
+    return view.cast("I") if _LITTLE else struct.unpack(f"<{count}I", view)
+
+
+def iter_documents(doc_dir: str, extensions: Iterable[str] = DEFAULT_EXTENSIONS):
+    """(relative path, text) for every matching file under doc_dir, in a stable order."""
+    extensions = tuple(extensions)
+    for root, dirs, files in os.walk(doc_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(extensions):
+                path = os.path.join(root, name)
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    yield os.path.relpath(path, doc_dir), f.read()
+
+
+def build_index(
+    documents: Iterable[Tuple[str, str]],
+    index_dir: str,
+    k1: float = 1.2,
+    b: float = 0.75,
+) -> Dict[str, Any]:
+    """
+    Build a BM25 index from (path, text) pairs into index_dir.
+
+    The index is written to a sibling directory and swapped in at the end,
+    so processes still reading the old index keep their (unlinked) mappings.
+    """
+    postings: Dict[str, List[int]] = {}  # term -> [doc, tf, doc, tf, ...]
+    doc_lens: List[int] = []
+    tmp_dir = index_dir.rstrip(os.sep) + ".building"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    with open(os.path.join(tmp_dir, "texts.bin"), "wb") as texts, \
+            open(os.path.join(tmp_dir, "docs.bin"), "wb") as docs:
+        offset = 0
+        for doc_id, (path, text) in enumerate(documents):
+            counts: Dict[str, int] = {}
+            tokens = tokenize(text)
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                plist = postings.get(tok)
+                if plist is None:
+                    plist = postings[tok] = []
+                plist.append(doc_id)
+                plist.append(tf)
+            doc_lens.append(len(tokens))
+            text_b, path_b = text.encode("utf-8"), path.encode("utf-8")
+            texts.write(text_b)
+            texts.write(path_b)
+            docs.write(_DOC.pack(offset, len(text_b), offset + len(text_b), len(path_b)))
+            offset += len(text_b) + len(path_b)
+
+    with open(os.path.join(tmp_dir, "doclens.bin"), "wb") as f:
+        f.write(struct.pack(f"<{len(doc_lens)}I", *doc_lens))
+
+    terms = sorted(postings)
+    with open(os.path.join(tmp_dir, "terms.bin"), "wb") as tf_, \
+            open(os.path.join(tmp_dir, "lexicon.bin"), "wb") as lex, \
+            open(os.path.join(tmp_dir, "postings.bin"), "wb") as post:
+        term_off = post_off = 0
+        for term in terms:
+            plist = postings[term]
+            df = len(plist) // 2
+            term_b = term.encode("utf-8")
+            tf_.write(term_b)
+            lex.write(_LEX.pack(term_off, len(term_b), df, post_off))
+            post.write(struct.pack(f"<{df}I", *plist[0::2]))
+            post.write(struct.pack(f"<{df}I", *plist[1::2]))
+            term_off += len(term_b)
+            post_off += 8 * df
+
+    meta = {
+        "version": INDEX_VERSION,
+        "docs": len(doc_lens),
+        "terms": len(terms),
+        "avgdl": (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0,
+        "k1": k1,
+        "b": b,
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    old_dir = index_dir.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+class KnowledgeBase:
+    """
+    Read-only BM25 search over an index built by build_index().
+
+    Files are memory-mapped, so every worker process on a host shares the
+    same page-cache pages. search() returns the top-k documents with a
+    snippet around the densest cluster of query terms; results are kept in
+    an LRU keyed on the query's terms. Scoring uses NumPy when installed.
+    """
+    def __init__(self, index_dir: str, cache_size: Optional[int] = None):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported knowledge base index version: {self.meta.get('version')}")
+        self.num_docs = self.meta["docs"]
+        self.num_terms = self.meta["terms"]
+        self.avgdl = self.meta["avgdl"] or 1.0
+        self.k1 = self.meta["k1"]
+        self.b = self.meta["b"]
+        self._maps: Dict[str, Any] = {}
+        for name in ("terms", "lexicon", "postings", "doclens", "docs", "texts"):
+            path = os.path.join(index_dir, f"{name}.bin")
+            with open(path, "rb") as f:
+                # mmap rejects empty files; an empty index maps nothing
+                self._maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        self._doc_lens = _u32(self._maps["doclens"], 0, self.num_docs)
+        self._np_doc_norm = None
+        try:
+            import numpy as np  # vectorized scoring; optional, imported when an index is opened
+        except ImportError:
+            np = None
+        self._np = np
+        if np is not None and self.num_docs:
+            lens = np.frombuffer(self._maps["doclens"], dtype="<u4", count=self.num_docs)
+            self._np_doc_norm = (self.k1 * (1 - self.b + self.b * lens / self.avgdl)).astype(np.float32)
+        self.cache = LRUCache(max_entries=cache_size or int(os.getenv("KB_QUERY_CACHE_SIZE", "1024")))
+
+    def _lookup(self, term: str) -> Optional[Tuple[int, int]]:
+        """(df, postings offset) for term, by binary search over the sorted lexicon."""
+        target = term.encode("utf-8")
+        terms, lex = self._maps["terms"], self._maps["lexicon"]
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t_off, t_len, df, p_off = _LEX.unpack_from(lex, mid * _LEX.size)
+            probe = terms[t_off:t_off + t_len]
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                return df, p_off
+        return None
+
+    def _idf(self, df: int) -> float:
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def _score(self, terms: List[str], k: int) -> List[Tuple[float, int]]:
+        found = [(t, hit) for t in terms for hit in [self._lookup(t)] if hit is not None]
+        if not found or k <= 0:
+            return []
+        postings = self._maps["postings"]
+        if self._np_doc_norm is not None:
+            np = self._np
+            scores = np.zeros(self.num_docs, dtype=np.float32)
+            for _, (df, p_off) in found:
+                ids = np.frombuffer(postings, dtype="<u4", count=df, offset=p_off)
+                tfs = np.frombuffer(postings, dtype="<u4", count=df, offset=p_off + 4 * df).astype(np.float32)
+                # doc ids are unique within a posting list, so fancy-index += is safe
+                scores[ids] += self._idf(df) * tfs * (self.k1 + 1) / (tfs + self._np_doc_norm[ids])
+            k = min(k, self.num_docs)
+            top = np.argpartition(-scores, k - 1)[:k]
+            return [(float(scores[d]), int(d)) for d in top if scores[d] > 0]
+        acc: Dict[int, float] = {}
+        k1, b, avgdl, lens = self.k1, self.b, self.avgdl, self._doc_lens
+        for _, (df, p_off) in found:
+            idf = self._idf(df)
+            ids, tfs = _u32(postings, p_off, df), _u32(postings, p_off + 4 * df, df)
+            for i in range(df):
+                d, tf = ids[i], tfs[i]
+                acc[d] = acc.get(d, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lens[d] / avgdl))
+        return [(s, d) for d, s in heapq.nlargest(k, acc.items(), key=lambda kv: kv[1])]
+
+    def document(self, doc_id: int) -> Dict[str, str]:
+        text_off, text_len, path_off, path_len = _DOC.unpack_from(self._maps["docs"], doc_id * _DOC.size)
+        texts = self._maps["texts"]
+        return {
+            "path": texts[path_off:path_off + path_len].decode("utf-8"),
+            "text": texts[text_off:text_off + text_len].decode("utf-8", errors="replace"),
+        }
+
+    def _uncached_search(self, terms: List[str], k: int) -> List[Dict[str, Any]]:
+        hits = sorted(self._score(terms, k), key=lambda h: (-h[0], h[1]))
+        results = []
+        for score, doc_id in hits:
+            doc = self.document(doc_id)
+            results.append({
+                "doc_id": doc_id,
+                "path": doc["path"],
+                "title": _title(doc["text"], doc["path"]),
+                "score": round(score, 4),
+                "snippet": make_snippet(doc["text"], terms),
+            })
+        return results
+
+    def _cache_key(self, query: str, k: int) -> Tuple[Tuple[str, ...], int]:
+        return tuple(sorted(set(tokenize(query)))), k
+
+    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        key = self._cache_key(query, k)
+        results = self.cache.get(key)
+        if results is None:
+            results = self._uncached_search(list(key[0]), k)
+            self.cache.set(key, results)
+        return results
+
+    async def asearch(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """search() for the event loop: cache hits answer inline, misses score in a thread."""
+        key = self._cache_key(query, k)
+        results = self.cache.get(key)
+        if results is None:
+            results = await asyncio.to_thread(self._uncached_search, list(key[0]), k)
+            self.cache.set(key, results)
+        return results
+
+    def close(self):
+        self._doc_lens = None
+        self._np_doc_norm = None
+        for m in self._maps.values():
+            if isinstance(m, mmap.mmap):
+                try:
+                    m.close()
+                except BufferError:
+                    pass  # a NumPy view still references it; freed with the object
+        self._maps = {}
+
+
+def _title(text: str, path: str) -> str:
+    for line in text.splitlines():
+        line = line.strip().lstrip("#").strip()
+        if line:
+            return line[:120]
+    return os.path.basename(path)
+
+
+def make_snippet(text: str, terms: Iterable[str], width: int = 240) -> str:
+    """The width-character window of text holding the most query-term matches."""
+    wanted = set(terms)
+    positions = [m.start() for m in _TOKEN_RE.finditer(text.lower()) if m.group() in wanted]
+    if not positions:
+        start = 0
+    else:
+        best, best_count, j = positions[0], 0, 0
+        for i, p in enumerate(positions):
+            while positions[j] < p - width + 40:
+                j += 1
+            if i - j + 1 > best_count:
+                best, best_count = positions[j], i - j + 1
+        start = max(0, best - 40)
+        space = text.rfind(" ", 0, start)
+        start = 0 if space < 0 or start == 0 else space + 1
+    end = min(len(text), start + width)
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > start else end
+    snippet = " ".join(text[start:end].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+_KB: Dict[str, Tuple[Tuple[int, int], KnowledgeBase]] = {}  # index_dir -> (meta.json signature, kb)
+
+
+def _index_signature(index_dir: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(os.path.join(index_dir, "meta.json"))
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def get_knowledge_base(index_dir: Optional[str] = None) -> Optional[KnowledgeBase]:
+    """
+    Shared KnowledgeBase for KB_INDEX_DIR, or None when no index is
+    configured/built. A missing index is looked for again on every call,
+    and a rebuilt one (new meta.json) is reopened; the old instance stays
+    valid for searches still using it.
+    """
+    index_dir = index_dir or os.getenv("KB_INDEX_DIR")
+    if not index_dir:
+        return None
+    signature = _index_signature(index_dir)
+    if signature is None:
+        _KB.pop(index_dir, None)
+        return None
+    entry = _KB.get(index_dir)
+    if entry is None or entry[0] != signature:
+        entry = _KB[index_dir] = (signature, KnowledgeBase(index_dir))
+    return entry[1]
+
+
+if __name__ == "__main__":
+    # python -m src.empowering_agents.core.knowledge_base build ./docs ./.kb
+    # python -m src.empowering_agents.core.knowledge_base search ./.kb "correlation vs causation"
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        meta = build_index(iter_documents(sys.argv[2]), sys.argv[3])
+        print(f"Indexed {meta['docs']} documents, {meta['terms']} terms into {sys.argv[3]}")
+    elif len(sys.argv) >= 4 and sys.argv[1] == "search":
+        kb = KnowledgeBase(sys.argv[2])
+        for hit in kb.search(" ".join(sys.argv[3:])):
+            print(f"{hit['score']:8.3f}  {hit['path']}\n          {hit['snippet']}")
+    else:
+        print("usage: knowledge_base.py build <doc_dir> <index_dir> | search <index_dir> <query>")
+        sys.exit(1)
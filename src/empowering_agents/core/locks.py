@@ -0,0 +1,188 @@
+import os
+import asyncio
+import hashlib
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable, Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class _Entry:
+    __slots__ = ("lock", "owner", "depth", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.owner: Optional[asyncio.Task] = None
+        self.depth = 0
+        self.refs = 0  # tasks holding or waiting for the lock
+
+
+class KeyedLockManager:
+    """
+    Async mutual exclusion per key (e.g. per user id).
+
+    Locks are created on first use and dropped as soon as nobody holds or
+    waits for them, so idle users cost nothing. With stripes=N keys are
+    hashed onto N slots instead: memory stays bounded but unrelated keys
+    may occasionally wait on each other.
+
+    Locks are reentrant per task, so a turn that holds a user's lock can
+    call into UserMemorySystem/GoalTracker, which take the same lock.
+    Child tasks (gather, create_task) are separate owners and must not
+    take a lock their parent holds.
+    """
+    cross_process = False
+
+    def __init__(self, stripes: Optional[int] = None):
+        self.stripes = stripes or None
+        self._entries: Dict[Hashable, _Entry] = {}
+        self.acquisitions = 0
+        self.contended = 0
+
+    def _slot(self, key: Hashable) -> Hashable:
+        if self.stripes:
+            # stable across processes (unlike hash()), so file locks agree
+            return zlib.crc32(str(key).encode("utf-8")) % self.stripes
+        return key
+
+    @asynccontextmanager
+    async def lock(self, key: Hashable) -> AsyncIterator[None]:
+        slot = self._slot(key)
+        task = asyncio.current_task()
+        entry = self._entries.get(slot)
+        if entry is not None and entry.owner is task:
+            entry.depth += 1
+            try:
+                yield
+            finally:
+                entry.depth -= 1
+            return
+
+        if entry is None:
+            entry = self._entries[slot] = _Entry()
+        entry.refs += 1
+        try:
+            if entry.lock.locked():
+                self.contended += 1
+            await entry.lock.acquire()
+            try:
+                await self._acquire_slot(slot)
+            except BaseException:
+                entry.lock.release()
+                raise
+            entry.owner, entry.depth = task, 1
+            self.acquisitions += 1
+            try:
+                yield
+            finally:
+                entry.owner, entry.depth = None, 0
+                try:
+                    self._release_slot(slot)
+                finally:
+                    entry.lock.release()
+        finally:
+            entry.refs -= 1
+            if entry.refs == 0 and self._entries.get(slot) is entry:
+                del self._entries[slot]
+
+    async def _acquire_slot(self, slot: Hashable):
+        """Hook run after the in-process lock is held (cross-process variants)."""
+
+    def _release_slot(self, slot: Hashable):
+        """Hook run before the in-process lock is released."""
+
+    def locked(self, key: Hashable) -> bool:
+        entry = self._entries.get(self._slot(key))
+        return entry is not None and entry.lock.locked()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "live_locks": len(self._entries),
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "stripes": self.stripes,
+        }
+
+
+class FileLockManager(KeyedLockManager):
+    """
+    KeyedLockManager that also holds an flock() on a per-slot file, so
+    several worker processes sharing one memory store serialize per user.
+
+    The in-process lock is taken first, so at most one task per process
+    waits on the file lock; a blocking flock() runs in a thread and never
+    stalls the event loop. Striping (default 1024 slots) bounds the number
+    of lock files.
+    """
+    cross_process = True
+
+    def __init__(self, lock_dir: str, stripes: Optional[int] = 1024):
+        if fcntl is None:
+            raise RuntimeError("File locks need fcntl (POSIX); use USER_LOCKS=memory")
+        super().__init__(stripes)
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+        self._fds: Dict[Hashable, int] = {}
+
+    def _path(self, slot: Hashable) -> str:
+        if isinstance(slot, int):
+            name = f"stripe-{slot}"
+        else:
+            name = hashlib.sha1(str(slot).encode("utf-8")).hexdigest()
+        return os.path.join(self.lock_dir, name + ".lock")
+
+    async def _acquire_slot(self, slot: Hashable):
+        fd = os.open(self._path(slot), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fut = asyncio.get_running_loop().run_in_executor(None, fcntl.flock, fd, fcntl.LOCK_EX)
+            try:
+                await asyncio.shield(fut)
+            except BaseException:
+                # cancelled (or failed) while the thread may still get the
+                # lock: closing the fd once it returns releases it
+                fut.add_done_callback(lambda _f: os.close(fd))
+                raise
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fds[slot] = fd
+
+    def _release_slot(self, slot: Hashable):
+        fd = self._fds.pop(slot, None)
+        if fd is not None:
+            os.close(fd)  # closing the descriptor drops the flock
+
+
+_DEFAULT_MANAGER: Optional[KeyedLockManager] = None
+
+
+def create_lock_manager(kind: Optional[str] = None) -> KeyedLockManager:
+    """
+    USER_LOCKS=memory (default, one process) or file (several workers on
+    one host; lock files under USER_LOCK_DIR). USER_LOCK_STRIPES sets the
+    number of slots (0 = one lock per key; file locks default to 1024).
+    """
+    kind = (kind or os.getenv("USER_LOCKS", "memory")).lower()
+    stripes = os.getenv("USER_LOCK_STRIPES")
+    if kind == "file":
+        return FileLockManager(
+            os.getenv("USER_LOCK_DIR", "./.mem/locks"),
+            stripes=int(stripes) if stripes is not None else 1024,
+        )
+    if kind != "memory":
+        raise ValueError(f"Unknown USER_LOCKS: {kind}")
+    return KeyedLockManager(stripes=int(stripes) if stripes else None)
+
+
+def get_lock_manager() -> KeyedLockManager:
+    """Process-wide manager, so every agent and memory system agrees on the same user locks."""
+    global _DEFAULT_MANAGER
+    if _DEFAULT_MANAGER is None:
+        _DEFAULT_MANAGER = create_lock_manager()
+    return _DEFAULT_MANAGER
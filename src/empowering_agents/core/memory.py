@@ -1,9 +1,18 @@
 import json
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 from datetime import datetime
 from dataclasses import dataclass, asdict
+from concurrent.futures import Executor, ThreadPoolExecutor
 import os
+import uuid
+
+from ..utils.lru import LRUCache
+from .topics import TopicMatcher, get_topic_matcher
+from .locks import KeyedLockManager, get_lock_manager
+from .goal_store import GoalJournal, create_goal_store
+from .recall import RecallIndex, create_recall_index
+from .storage import MemoryBackend, create_memory_backend, new_user_memory, MAX_INTERACTIONS
 
 @dataclass
 class Interaction:
@@ -13,26 +22,104 @@ class Interaction:
     context: Dict[str, Any]
 
 class UserMemorySystem:
-    def __init__(self, storage_dir: str = "./.mem"):
+    """
+    Per-user memory (recent interactions, preferences, summary) over a
+    pluggable MemoryBackend. Without an explicit backend one is chosen from
+    the environment: MEMORY_BACKEND=json (files under storage_dir, snapshot or
+    append mode) or MEMORY_BACKEND=sqlite (MEMORY_DB_PATH).
+
+    Backend I/O never runs on the event loop: loads and writes go to a
+    dedicated thread pool. Writes are write-behind and coalesced per user:
+    changes that arrive while a flush is waiting (flush_delay) or in flight
+    are persisted together by the next one. Call flush() to wait for
+    everything queued, and close() on shutdown.
+
+    Loaded users live in a bounded LRU (MEMORY_CACHE_MAX_USERS entries and
+    about MEMORY_CACHE_MAX_BYTES). An evicted user with unflushed changes
+    stays reachable through the pending-write queue until its flush lands.
+
+    Updates for one user are serialized through a KeyedLockManager (the
+    process-wide one by default, shared with EmpoweringAgent/GoalTracker).
+
+    Interactions pushed out of the window are archived in a RecallIndex
+    (MEMORY_RECALL, needs numpy) and can be retrieved by similarity with
+    recall_relevant().
+    """
+    def __init__(
+        self,
+        storage_dir: str = "./.mem",
+        storage_mode: Optional[str] = None,
+        compact_every: Optional[int] = None,
+        backend: Optional[MemoryBackend] = None,
+        flush_delay: Optional[float] = None,
+        durability: Optional[str] = None,
+        io_workers: Optional[int] = None,
+        cache_max_users: Optional[int] = None,
+        cache_max_bytes: Optional[int] = None,
+        topic_matcher: Optional[TopicMatcher] = None,
+        locks: Optional[KeyedLockManager] = None,
+        recall: Optional[RecallIndex] = None
+    ):
         self.storage_dir = storage_dir
-        os.makedirs(self.storage_dir, exist_ok=True)
-        self.user_memories = {}
+        self.backend = backend or create_memory_backend(storage_dir, storage_mode, compact_every, durability)
+        self.user_memories = LRUCache(
+            max_entries=cache_max_users or int(os.getenv("MEMORY_CACHE_MAX_USERS", "10000")),
+            max_bytes=cache_max_bytes or int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            sizeof=_approx_memory_bytes,
+            on_evict=self._on_evict,
+        )
+        self.flush_delay = flush_delay if flush_delay is not None else float(os.getenv("MEMORY_FLUSH_DELAY", "0"))
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=io_workers or int(os.getenv("MEMORY_IO_WORKERS", "4")),
+            thread_name_prefix="memory-io",
+        )
+        # Topic counts decay by topic_decay per interaction and drop out of
+        # common_topics below topic_threshold (0.8**10 ~ "seen in the last 10")
+        self.topic_matcher = topic_matcher or get_topic_matcher()
+        self.topic_decay = float(os.getenv("MEMORY_TOPIC_DECAY", "0.8"))
+        self.topic_threshold = float(os.getenv("MEMORY_TOPIC_THRESHOLD", "0.1"))
+        # a failed batch write is retried this many times with exponential backoff
+        self.write_retries = int(os.getenv("MEMORY_WRITE_RETRIES", "3"))
+        self.retry_backoff = float(os.getenv("MEMORY_WRITE_RETRY_BACKOFF", "0.1"))
+        self.locks = locks or get_lock_manager()
+        self.recall = recall if recall is not None else create_recall_index(storage_dir, self.io_executor)
+        self._pending_ops: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        self._pending_memory: Dict[str, Dict[str, Any]] = {}
+        self._flushers: Dict[str, asyncio.Task] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    async def _run_io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io_executor, fn, *args)
 
     async def load_user_memory(self, user_id: str) -> Dict[str, Any]:
-        if user_id not in self.user_memories:
-            path = os.path.join(self.storage_dir, f"{user_id}.json")
-            if os.path.exists(path):
-                with open(path, "r", encoding="utf-8") as f:
-                    self.user_memories[user_id] = json.load(f)
-            else:
-                self.user_memories[user_id] = {
-                    "user_id": user_id,
-                    "created_at": datetime.now().isoformat(),
-                    "interactions": [],
-                    "preferences": {},
-                    "summary": {}
-                }
-        return self.user_memories[user_id]
+        memory = self.user_memories.get(user_id)
+        if memory is not None:
+            return memory
+        if user_id in self._pending_memory:
+            # evicted before its flush landed: the queued state is newer than the disk
+            memory = self._pending_memory[user_id]
+            self.user_memories.set(user_id, memory)
+            return memory
+        if user_id in self._loading:
+            # another request is already reading this user; share its result
+            return await asyncio.shield(self._loading[user_id])
+        fut = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = fut
+        try:
+            memory = await self._run_io(self.backend.load_user, user_id)
+            if memory is None:
+                memory = new_user_memory(user_id)
+            elif memory.get("interactions") and not (memory.get("summary") and memory.get("summary_state")):
+                await self._update_memory_summary(user_id, memory)
+            self.user_memories.set(user_id, memory)
+            fut.set_result(memory)
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._loading.pop(user_id, None)
+        return memory
 
     async def add_interaction(
         self,
@@ -41,65 +128,372 @@ class UserMemorySystem:
         agent_response: str,
         context: Optional[Dict[str, Any]] = None
     ):
-        memory = await self.load_user_memory(user_id)
-        interaction = Interaction(
-            timestamp=datetime.now().isoformat(),
-            user_message=user_message,
-            agent_response=agent_response,
-            context=context or {}
-        )
-        memory.setdefault("interactions", []).append(asdict(interaction))
-        memory["interactions"] = memory["interactions"][-100:]
-        await self._update_memory_summary(user_id, memory)
-        await self._save_to_storage(user_id, memory)
+        async with self.locks.lock(user_id):
+            memory = await self.load_user_memory(user_id)
+            interaction = Interaction(
+                timestamp=datetime.now().isoformat(),
+                user_message=user_message,
+                agent_response=agent_response,
+                context=context or {}
+            )
+            record = asdict(interaction)
+            interactions = memory.setdefault("interactions", [])
+            interactions.append(record)
+            if len(interactions) > MAX_INTERACTIONS:
+                if self.recall is not None:
+                    await self.recall.archive(user_id, interactions[:-MAX_INTERACTIONS])
+                memory["interactions"] = interactions[-MAX_INTERACTIONS:]
+            self._apply_to_summary(memory, record)
+            self.user_memories.set(user_id, memory)  # refresh recency and size
+            self._schedule_write(user_id, "interaction", record, memory)
 
     async def update_preferences(self, user_id: str, preferences: Dict[str, Any]):
-        memory = await self.load_user_memory(user_id)
-        memory.setdefault("preferences", {}).update(preferences)
-        await self._save_to_storage(user_id, memory)
+        async with self.locks.lock(user_id):
+            memory = await self.load_user_memory(user_id)
+            memory.setdefault("preferences", {}).update(preferences)
+            self.user_memories.set(user_id, memory)
+            self._schedule_write(user_id, "preferences", dict(preferences), memory)
+
+    async def recall_relevant(self, user_id: str, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Archived (out-of-window) interactions most similar to query; [] when recall is off."""
+        if self.recall is None or k <= 0:
+            return []
+        async with self.locks.lock(user_id):
+            return await self.recall.recall(user_id, query, k)
+
+    async def refresh(self, user_id: str):
+        """Write out pending changes and drop the cached copy, so the next load reads the backend."""
+        await self.flush(user_id)
+        self.user_memories.pop(user_id)
 
     async def _update_memory_summary(self, user_id: str, memory: Dict[str, Any]):
-        interactions = memory.get("interactions", [])
-        last10 = interactions[-10:]
-        all_text = " ".join(i["user_message"] for i in last10)
-        topics = []
-        low = all_text.lower()
-        if any(k in low for k in ["fitness", "workout", "gym"]):
-            topics.append("fitness")
-        if any(k in low for k in ["learn", "study", "course"]):
-            topics.append("learning")
-        if any(k in low for k in ["money", "budget", "finance"]):
-            topics.append("finance")
-        avg_len = (sum(len(i["user_message"]) for i in last10)/len(last10)) if last10 else 0
+        """Rebuild the summary and its running aggregates from the stored interactions."""
+        memory["summary_state"] = _new_summary_state()
+        for interaction in memory.get("interactions", []):
+            self._apply_to_summary_state(memory["summary_state"], interaction)
+        self._render_summary(memory)
+
+    def _apply_to_summary(self, memory: Dict[str, Any], interaction: Dict[str, Any]):
+        """O(1) summary update for one new interaction (plus an O(len(message)) topic scan)."""
+        state = memory.get("summary_state")
+        if not state:
+            # older memories without aggregates: build them once
+            memory["summary_state"] = _new_summary_state()
+            for i in memory.get("interactions", []):
+                self._apply_to_summary_state(memory["summary_state"], i)
+        else:
+            self._apply_to_summary_state(state, interaction)
+        self._render_summary(memory)
+
+    def _apply_to_summary_state(self, state: Dict[str, Any], interaction: Dict[str, Any]):
+        message = interaction.get("user_message", "")
+        state["seen"] += 1
+        lengths = state["recent_lengths"]
+        lengths.append(len(message))
+        state["length_sum"] += len(message)
+        if len(lengths) > SUMMARY_WINDOW:
+            state["length_sum"] -= lengths.pop(0)
+        state["last_interaction"] = interaction.get("timestamp")
+        # decayed topic scores, decayed lazily: score is as of interaction "at"
+        scores = state["topic_scores"]
+        for topic in self.topic_matcher.topics_in(message):
+            score, at = scores.get(topic, (0.0, state["seen"]))
+            scores[topic] = (score * self.topic_decay ** (state["seen"] - at) + 1.0, state["seen"])
+
+    def _render_summary(self, memory: Dict[str, Any]):
+        state = memory["summary_state"]
+        scores = state["topic_scores"]
+        current = {}
+        for topic, (score, at) in list(scores.items()):
+            decayed = score * self.topic_decay ** (state["seen"] - at)
+            if decayed < self.topic_threshold:
+                del scores[topic]  # faded out; keeps the map small
+            else:
+                current[topic] = decayed
+        lengths = state["recent_lengths"]
+        avg_len = state["length_sum"] / len(lengths) if lengths else 0
         memory["summary"] = {
-            "interaction_count": len(interactions),
-            "last_interaction": last10[-1]["timestamp"] if last10 else None,
-            "common_topics": topics,
+            "interaction_count": len(memory.get("interactions", [])),
+            "last_interaction": state["last_interaction"],
+            "common_topics": sorted(current, key=lambda t: -current[t])[:MAX_SUMMARY_TOPICS],
             "user_style": {
                 "communication_style": "detailed" if avg_len > 50 else "concise"
             }
         }
 
     async def _save_to_storage(self, user_id: str, memory: Dict[str, Any]):
-        self.user_memories[user_id] = memory
-        path = os.path.join(self.storage_dir, f"{user_id}.json")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(memory, f, indent=2)
+        self.user_memories.set(user_id, memory)
+        await self._run_io(self.backend.save_user, user_id, _detached(memory))
+
+    def _schedule_write(self, user_id: str, op: str, data: Dict[str, Any], memory: Dict[str, Any]):
+        self._pending_ops.setdefault(user_id, []).append((op, data))
+        self._pending_memory[user_id] = memory
+        if user_id not in self._flushers:
+            self._start_flusher(user_id, self.flush_delay)
+
+    def _start_flusher(self, user_id: str, delay: float) -> asyncio.Task:
+        task = self._flushers[user_id] = asyncio.get_running_loop().create_task(self._flush_user(user_id, delay))
+        # a flusher that gives up leaves its ops in _pending_ops for flush();
+        # retrieve the error here so it is not reported as never retrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def _flush_user(self, user_id: str, delay: float = 0.0):
+        failures = 0
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            while self._pending_ops.get(user_id):
+                ops = self._pending_ops.pop(user_id)
+                # copy on the loop thread; the I/O thread must not see later mutations
+                memory = _detached(self._pending_memory[user_id])
+                try:
+                    await self._run_io(self.backend.write_batch, user_id, ops, memory)
+                except BaseException as e:
+                    self._pending_ops[user_id] = ops + self._pending_ops.get(user_id, [])
+                    failures += 1
+                    if not isinstance(e, Exception) or failures > self.write_retries:
+                        raise
+                    await asyncio.sleep(self.retry_backoff * 2 ** (failures - 1))
+                    continue
+                failures = 0
+                if self.backend.needs_compaction(user_id):
+                    await self._run_io(self.backend.compact, user_id, memory)
+            self._pending_memory.pop(user_id, None)
+        finally:
+            self._flushers.pop(user_id, None)
+
+    def _on_evict(self, user_id: str, memory: Dict[str, Any]):
+        # Dirty entries keep their state in _pending_memory; make sure a
+        # flusher owns it so the write-back happens even after eviction.
+        if self._pending_ops.get(user_id) and user_id not in self._flushers:
+            self._start_flusher(user_id, self.flush_delay)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit rate, resident users/bytes and evictions of the in-process cache."""
+        stats = self.user_memories.stats()
+        stats["pending_writes"] = len(self._pending_memory)
+        return stats
+
+    async def flush(self, user_id: Optional[str] = None):
+        """
+        Wait until every queued write (or just user_id's) has reached the
+        backend. Writes a background flusher gave up on get one more round
+        of retries here; if they still fail the error is raised and the
+        writes stay queued.
+        """
+        def _users() -> List[str]:
+            return [user_id] if user_id is not None else list(self._flushers) + list(self._pending_ops)
+
+        while True:
+            running = [self._flushers[u] for u in _users() if u in self._flushers]
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+                continue
+            leftover = [u for u in dict.fromkeys(_users()) if self._pending_ops.get(u)]
+            if not leftover:
+                return
+            results = await asyncio.gather(*(self._start_flusher(u, 0.0) for u in leftover), return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if errors:
+                raise errors[0]
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            if self.recall is not None:
+                await self.recall.close()
+            self.io_executor.shutdown(wait=True)
+            self.backend.close()
+
+    async def compact(self, user_id: str):
+        memory = self._pending_memory.get(user_id) or self.user_memories.get(user_id)
+        if memory is not None:
+            await self._run_io(self.backend.compact, user_id, _detached(memory))
+
+
+SUMMARY_WINDOW = 10
+MAX_SUMMARY_TOPICS = 5
+
+
+def _new_summary_state() -> Dict[str, Any]:
+    return {"seen": 0, "recent_lengths": [], "length_sum": 0, "last_interaction": None, "topic_scores": {}}
+
+
+def _approx_memory_bytes(memory: Dict[str, Any]) -> int:
+    # Rough resident size: text lengths plus a flat per-object overhead
+    size = 1024
+    for i in memory.get("interactions", []):
+        size += len(i.get("user_message", "")) + len(i.get("agent_response", "")) + 400
+    size += 200 * len(memory.get("preferences", {}))
+    return size
+
+
+def _detached(memory: Dict[str, Any]) -> Dict[str, Any]:
+    # Shallow copy that is safe to serialize from another thread: the
+    # containers that get mutated in place are copied, interaction records
+    # and the summary dict are never mutated after creation.
+    detached = {
+        **memory,
+        "interactions": list(memory.get("interactions", [])),
+        "preferences": dict(memory.get("preferences", {})),
+    }
+    if memory.get("summary_state"):
+        # small (<= SUMMARY_WINDOW lengths + live topics) but mutated in place
+        detached["summary_state"] = json.loads(json.dumps(memory["summary_state"]))
+    return detached
 
 class GoalTracker:
-    def __init__(self):
-        self.user_goals = {}
+    """
+    Goals indexed by (user_id, goal_id); each user's active and completed
+    goal ids are kept as ordered sets, so updates and lookups never scan.
+
+    Goals persist to a store chosen by GOAL_STORE (see create_goal_store):
+    the memory backend, loaded per user on first access, or a GoalJournal,
+    restored in one pass on first use and compacted in the background.
+    Stored goal dicts are replaced on update, never mutated, so they can be
+    serialized off the event loop.
+    """
+    def __init__(
+        self,
+        backend: Optional[MemoryBackend] = None,
+        io_executor: Optional[Executor] = None,
+        locks: Optional[KeyedLockManager] = None,
+        store: Optional[Any] = None
+    ):
+        self.backend = backend
+        self.store = store if store is not None else create_goal_store(backend)
+        self.io_executor = io_executor
+        self.locks = locks or get_lock_manager()
+        self.user_goals: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._active: Dict[str, Dict[str, None]] = {}
+        self._completed: Dict[str, Dict[str, None]] = {}
+        self._restoring: Optional[asyncio.Future] = None
+        self._compacting: Optional[asyncio.Task] = None
+
+    async def _run_io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io_executor, fn, *args)
+
+    def _index(self, user_id: str, goal: Dict[str, Any]):
+        goal_id = goal["id"]
+        self.user_goals.setdefault(user_id, {})[goal_id] = goal
+        active = self._active.setdefault(user_id, {})
+        completed = self._completed.setdefault(user_id, {})
+        if goal.get("current_progress", 0.0) >= 1.0:
+            active.pop(goal_id, None)
+            completed[goal_id] = None
+        else:
+            completed.pop(goal_id, None)
+            active[goal_id] = None
+
+    async def _ensure_loaded(self, user_ids: Iterable[str]):
+        if isinstance(self.store, GoalJournal):
+            if self._restoring is None:
+                self._restoring = asyncio.ensure_future(self._run_io(self._restore_all))
+            await asyncio.shield(self._restoring)
+            return
+        if self.store is None:
+            return
+        for user_id in user_ids:
+            if user_id not in self.user_goals:
+                goals = await self._run_io(self.store.load_goals, user_id)
+                if user_id not in self.user_goals:  # unless a concurrent load won
+                    self.user_goals[user_id] = {}
+                    for goal in goals:
+                        self._index(user_id, goal)
+
+    def _restore_all(self):
+        # runs on the I/O thread before anything else may touch the indexes
+        for user_id, goals in self.store.load_all().items():
+            for goal in goals.values():
+                self._index(user_id, goal)
+
+    async def _persist(self, items: List[Tuple[str, Dict[str, Any]]]):
+        if self.store is None or not items:
+            return
+        if isinstance(self.store, GoalJournal):
+            first_seq = self.store.reserve(len(items))
+            await self._run_io(self.store.save_goals, items, first_seq)
+            if self.store.needs_compaction() and (self._compacting is None or self._compacting.done()):
+                self._compacting = asyncio.get_running_loop().create_task(self.compact())
+        else:
+            await self._run_io(self.store.save_goals, items)
+
+    def invalidate(self, user_id: str):
+        """Forget cached goals so the next access reloads them from the backend."""
+        if isinstance(self.store, GoalJournal):
+            return  # the journal is process-local; this process's index is authoritative
+        self.user_goals.pop(user_id, None)
+        self._active.pop(user_id, None)
+        self._completed.pop(user_id, None)
 
     async def add_goal(self, user_id: str, goal: Dict[str, Any]):
-        self.user_goals.setdefault(user_id, []).append(goal)
+        async with self.locks.lock(user_id):
+            await self.add_goals([(user_id, goal)])
+
+    async def add_goals(self, items: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Add (or replace, by id) many goals with one store write, e.g. a campaign-wide import."""
+        goals = []
+        for user_id, goal in items:
+            goal = dict(goal)
+            goal.setdefault("id", uuid.uuid4().hex[:12])
+            goals.append((user_id, goal))
+        await self._ensure_loaded({user_id for user_id, _ in goals})
+        for user_id, goal in goals:
+            self._index(user_id, goal)
+        await self._persist(goals)
 
     async def update_goal_progress(self, user_id: str, goal_id: str, progress: float):
-        for g in self.user_goals.get(user_id, []):
-            if g.get("id") == goal_id:
-                g["current_progress"] = progress
+        async with self.locks.lock(user_id):
+            await self.update_goals([(user_id, goal_id, progress)])
+
+    async def update_goals(self, updates: Iterable[Tuple[str, str, float]]) -> int:
+        """Set progress for many (user_id, goal_id, progress) with one store write; returns goals changed."""
+        updates = list(updates)
+        await self._ensure_loaded({user_id for user_id, _, _ in updates})
+        changed = []
+        for user_id, goal_id, progress in updates:
+            goal = self.user_goals.get(user_id, {}).get(goal_id)
+            if goal is None:
+                continue
+            goal = {**goal, "current_progress": progress}
+            self._index(user_id, goal)
+            changed.append((user_id, goal))
+        await self._persist(changed)
+        return len(changed)
+
+    async def get_goal(self, user_id: str, goal_id: str) -> Optional[Dict[str, Any]]:
+        await self._ensure_loaded((user_id,))
+        return self.user_goals.get(user_id, {}).get(goal_id)
 
     async def get_active_goals(self, user_id: str) -> List[Dict[str, Any]]:
-        return [g for g in self.user_goals.get(user_id, []) if g.get("current_progress", 0.0) < 1.0]
+        await self._ensure_loaded((user_id,))
+        goals = self.user_goals.get(user_id, {})
+        return [goals[g] for g in self._active.get(user_id, ())]
 
     async def get_completed_goals(self, user_id: str) -> List[Dict[str, Any]]:
-        return [g for g in self.user_goals.get(user_id, []) if g.get("current_progress", 0.0) >= 1.0]
+        await self._ensure_loaded((user_id,))
+        goals = self.user_goals.get(user_id, {})
+        return [goals[g] for g in self._completed.get(user_id, ())]
+
+    async def compact(self):
+        """Fold the goal journal into a fresh snapshot (GOAL_STORE=journal only)."""
+        if not isinstance(self.store, GoalJournal):
+            return
+        running = self._compacting
+        if running is not None and not running.done() and running is not asyncio.current_task():
+            await running  # one compaction at a time: they share the rotated journal
+            return
+        await self._ensure_loaded(())
+        await self._run_io(self.store.rotate)
+        # every record handed out so far is reflected in the index right now
+        seq = self.store.seq
+        users = {user_id: list(goals.values()) for user_id, goals in self.user_goals.items() if goals}
+        await self._run_io(self.store.write_snapshot, users, seq)
+
+    async def close(self):
+        if self._compacting is not None:
+            await self._compacting
+        if isinstance(self.store, GoalJournal):
+            self.store.close()
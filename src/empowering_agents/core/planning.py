@@ -1,12 +1,24 @@
-import os, json, asyncio
-from typing import Dict, Any, List
+import os, re, copy, json, asyncio, threading, time
+from typing import Dict, Any, List, Optional, Callable
 
-try:
-    import dspy  # DSPy for declarative planning
-except ImportError:
-    dspy = None
+from ..utils.lru import LRUCache
+from ..utils.executor import BoundedExecutor, WAIT
 
-DEFAULT_HINTS_PATH = os.getenv("COMPILED_HINTS_PATH", "experiments/.artifacts/compiled_hints.json")
+# DSPy for declarative planning; imported on first use (see _import_dspy)
+# since it is optional and slow to import
+dspy = None
+
+DEFAULT_HINTS_PATH = "experiments/.artifacts/compiled_hints.json"
+
+def _import_dspy():
+    global dspy
+    if dspy is None:
+        try:
+            import dspy as _dspy
+        except ImportError:
+            return None
+        dspy = _dspy
+    return dspy
 
 def _load_compiled_hints(path: str = DEFAULT_HINTS_PATH):
     try:
@@ -17,6 +29,166 @@ def _load_compiled_hints(path: str = DEFAULT_HINTS_PATH):
         pass
     return None
 
+def _configure_dspy() -> bool:
+    provider = os.getenv("LLM_PROVIDER", "dummy").lower()
+    if provider != "openai" or _import_dspy() is None:
+        return False
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    try:
+        dspy.configure(lm=dspy.OpenAI(model=model))
+        return True
+    except Exception:
+        return False
+
+class PlannerRuntime:
+    """
+    DSPy state shared by every planner in the process.
+
+    DSPy is configured once, on first use; predictors are built once per
+    signature. Compiled hints are re-read only when the hints file's mtime
+    changes, and the file is stat()ed at most every check_interval seconds
+    (COMPILED_HINTS_CHECK_INTERVAL), so new hints are picked up without
+    restarting workers.
+
+    Blocking DSPy calls run on a dedicated BoundedExecutor ("planner"):
+    PLANNER_WORKERS threads, PLANNER_QUEUE_SIZE queued calls, then
+    PLANNER_QUEUE_POLICY=wait (block up to PLANNER_QUEUE_TIMEOUT seconds)
+    or reject; both raise utils.executor.ExecutorSaturated when there is no room.
+    """
+    def __init__(self, hints_path: Optional[str] = None, check_interval: Optional[float] = None):
+        self.hints_path = hints_path or os.getenv("COMPILED_HINTS_PATH", DEFAULT_HINTS_PATH)
+        self.check_interval = (
+            check_interval if check_interval is not None
+            else float(os.getenv("COMPILED_HINTS_CHECK_INTERVAL", "5"))
+        )
+        self._lock = threading.Lock()
+        self._configured = False
+        self._use_dspy = False
+        self._predictors: Dict[str, Any] = {}
+        self._hints = None
+        self._hints_json = "{}"
+        self._hints_mtime: Optional[int] = None
+        self._next_check = 0.0
+        self.hints_version = 0
+        # Fused goal+steps plans keyed by normalized message + context (PLAN_CACHE_TTL=0 disables)
+        self.plan_cache_ttl = float(os.getenv("PLAN_CACHE_TTL", "3600"))
+        self.plan_cache = LRUCache(
+            max_entries=int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "1024")), ttl=self.plan_cache_ttl or None
+        )
+        self._planning: Dict[str, asyncio.Future] = {}
+        queue_timeout = os.getenv("PLANNER_QUEUE_TIMEOUT", "10")
+        self.executor = BoundedExecutor(
+            "planner",
+            max_workers=int(os.getenv("PLANNER_WORKERS", "4")),
+            max_queue=int(os.getenv("PLANNER_QUEUE_SIZE", "32")),
+            policy=os.getenv("PLANNER_QUEUE_POLICY", WAIT).lower(),
+            queue_timeout=float(queue_timeout) if queue_timeout else None,
+        )
+
+    @property
+    def use_dspy(self) -> bool:
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self._use_dspy = _configure_dspy()
+                    self._configured = True
+        return self._use_dspy
+
+    def predictor(self, name: str, signature_factory: Callable[[], Any]):
+        """dspy.Predict for a signature, built on first request."""
+        pred = self._predictors.get(name)
+        if pred is None:
+            with self._lock:
+                pred = self._predictors.get(name)
+                if pred is None:
+                    pred = self._predictors[name] = dspy.Predict(signature_factory())
+        return pred
+
+    def hints(self) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.stat(self.hints_path).st_mtime_ns if self.hints_path else None
+            except OSError:
+                mtime = None
+            if mtime != self._hints_mtime:
+                self._hints = _load_compiled_hints(self.hints_path) if mtime is not None else None
+                self._hints_json = json.dumps(self._hints or {})
+                self._hints_mtime = mtime
+                self.hints_version += 1
+        return self._hints
+
+    def hints_json(self) -> str:
+        """Current hints, serialized once per reload."""
+        self.hints()
+        return self._hints_json
+
+_RUNTIME: Optional[PlannerRuntime] = None
+
+def get_planner_runtime() -> PlannerRuntime:
+    global _RUNTIME
+    if _RUNTIME is None:
+        _RUNTIME = PlannerRuntime()
+    return _RUNTIME
+
+def _plan_goal_signature():
+    class PlanGoal(dspy.Signature):
+        """Create a SMART learning goal from a user message and context (with optional hints)."""
+        user_message: str
+        context_json: str  # may include {"compiled_hints": {...}}
+        goal_json: str  # JSON with fields: objective, why, timeframe, milestones
+    return PlanGoal
+
+def _plan_with_steps_signature():
+    class PlanWithSteps(dspy.Signature):
+        """Create a SMART learning goal from a user message and context (with optional hints), and 3 concrete next steps toward it."""
+        user_message: str
+        context_json: str  # may include {"compiled_hints": {...}}
+        goal_json: str  # JSON with fields: objective, why, timeframe, milestones
+        steps_json: str  # JSON list of steps
+    return PlanWithSteps
+
+def _plan_actions_signature():
+    class PlanActions(dspy.Signature):
+        """Given a learning goal JSON and hints, return 3 concrete next steps as a JSON list."""
+        goal_json: str
+        hints_json: str
+        steps_json: str  # JSON list of steps
+    return PlanActions
+
+_FILLER_WORDS = frozenset("i i'd want would like to please help me can you a an the my".split())
+
+def normalize_goal_message(message: str) -> str:
+    """Case, punctuation and filler-insensitive form used for plan cache keys."""
+    words = re.findall(r"[\w']+", message.lower())
+    return " ".join(w for w in words if w not in _FILLER_WORDS)
+
+def plan_cache_key(message: str, context: Optional[Dict[str, Any]], hints_version: int) -> str:
+    ctx = json.dumps(context or {}, sort_keys=True, default=str)
+    return f"{hints_version}\x1f{normalize_goal_message(message)}\x1f{ctx}"
+
+def _parse_goal(goal_json: str) -> Dict[str, Any]:
+    try:
+        return json.loads(goal_json)
+    except Exception:
+        return {"raw": goal_json}
+
+def _parse_steps(steps_json: str) -> List[str]:
+    try:
+        data = json.loads(steps_json)
+        if isinstance(data, list):
+            return data
+        return [steps_json]
+    except Exception:
+        return [steps_json]
+
+FALLBACK_STEPS = [
+    "Block 25 minutes today for focused practice",
+    "Complete a bite-sized lesson related to your goal",
+    "Log one takeaway and one question to revisit"
+]
+
 class GoalPlanner:
     """
     DSPy-backed goal planner.
@@ -24,53 +196,38 @@ class GoalPlanner:
     or LLM_PROVIDER=dummy.
 
     If a compiled hints file exists (see experiments/.artifacts/compiled_hints.json),
-    it is injected into the context to influence outputs.
+    it is injected into the context to influence outputs. DSPy setup and
+    the hints live in the shared PlannerRuntime.
     """
-    def __init__(self, llm=None):
-        self.use_dspy: bool = False
-        self.compiled_hints = _load_compiled_hints()
-        self._init_dspy()
+    def __init__(self, llm=None, runtime: Optional[PlannerRuntime] = None):
+        self.runtime = runtime or get_planner_runtime()
 
-        if self.use_dspy:
-            class PlanGoal(dspy.Signature):
-                """Create a SMART learning goal from a user message and context (with optional hints)."""
-                user_message: str
-                context_json: str  # may include {"compiled_hints": {...}}
-                goal_json: str  # JSON with fields: objective, why, timeframe, milestones
-
-            self.plan_goal = dspy.Predict(PlanGoal)
-
-    def _init_dspy(self):
-        provider = os.getenv("LLM_PROVIDER", "dummy").lower()
-        if dspy is None or provider == "dummy":
-            self.use_dspy = False
-            return
-        if provider == "openai":
-            model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-            try:
-                dspy.configure(lm=dspy.OpenAI(model=model))
-                self.use_dspy = True
-            except Exception:
-                self.use_dspy = False
-        else:
-            self.use_dspy = False
+    @property
+    def use_dspy(self) -> bool:
+        return self.runtime.use_dspy
+
+    @property
+    def compiled_hints(self) -> Optional[Dict[str, Any]]:
+        return self.runtime.hints()
 
     async def plan(self, user_message: str, context: Dict[str, Any]) -> Dict[str, Any]:
         # Inject hints if available
         ctx = dict(context or {})
-        if self.compiled_hints:
-            ctx["compiled_hints"] = self.compiled_hints
+        hints = self.compiled_hints
+        if hints:
+            ctx["compiled_hints"] = hints
 
         if self.use_dspy:
+            plan_goal = self.runtime.predictor("plan_goal", _plan_goal_signature)
             def _run():
-                out = self.plan_goal(user_message=user_message, context_json=json.dumps(ctx))
+                out = plan_goal(user_message=user_message, context_json=json.dumps(ctx))
                 return out.goal_json
-            goal_json = await asyncio.get_event_loop().run_in_executor(None, _run)
-            try:
-                return json.loads(goal_json)
-            except Exception:
-                return {"raw": goal_json}
+            goal_json = await self.runtime.executor.run(_run)
+            return _parse_goal(goal_json)
+
+        return self._fallback_goal(user_message, ctx)
 
+    def _fallback_goal(self, user_message: str, ctx: Dict[str, Any]) -> Dict[str, Any]:
         # Fallback: minimal SMART-like structure
         return {
             "objective": user_message,
@@ -79,6 +236,52 @@ class GoalPlanner:
             "milestones": ["Define syllabus", "Schedule weekly sessions", "Complete first project"]
         }
 
+    async def plan_with_steps(self, user_message: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Goal and next steps from a single model call: {"goal": {...}, "steps": [...]}.
+        Replaces plan() followed by ActionPlanner.steps(). Results are cached
+        (PLAN_CACHE_TTL) per normalized message + context + hints version, and
+        identical concurrent requests share one call.
+        """
+        runtime = self.runtime
+        runtime.hints()  # pick up a reload first: new hints must not hit old plans
+        key = plan_cache_key(user_message, context, runtime.hints_version)
+        cached = runtime.plan_cache.get(key) if runtime.plan_cache_ttl else None
+        if cached is None:
+            if key in runtime._planning:
+                cached = await asyncio.shield(runtime._planning[key])
+            else:
+                fut = asyncio.get_event_loop().create_future()
+                runtime._planning[key] = fut
+                try:
+                    cached = await self._plan_with_steps(user_message, context)
+                    if runtime.plan_cache_ttl:
+                        runtime.plan_cache.set(key, cached)
+                    fut.set_result(cached)
+                except BaseException as e:
+                    fut.set_exception(e)
+                    fut.exception()  # mark retrieved when nobody else is waiting
+                    raise
+                finally:
+                    runtime._planning.pop(key, None)
+        return copy.deepcopy(cached)
+
+    async def _plan_with_steps(self, user_message: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        ctx = dict(context or {})
+        hints = self.compiled_hints
+        if hints:
+            ctx["compiled_hints"] = hints
+
+        if self.use_dspy:
+            plan_with_steps = self.runtime.predictor("plan_with_steps", _plan_with_steps_signature)
+            def _run():
+                out = plan_with_steps(user_message=user_message, context_json=json.dumps(ctx))
+                return out.goal_json, out.steps_json
+            goal_json, steps_json = await self.runtime.executor.run(_run)
+            return {"goal": _parse_goal(goal_json), "steps": _parse_steps(steps_json)}
+
+        return {"goal": self._fallback_goal(user_message, ctx), "steps": list(FALLBACK_STEPS)}
+
 class ActionPlanner:
     """
     DSPy-backed action planner that proposes concrete steps.
@@ -86,52 +289,25 @@ class ActionPlanner:
 
     If a compiled hints file exists, it is injected to influence the outputs.
     """
-    def __init__(self, llm=None):
-        self.use_dspy: bool = False
-        self.compiled_hints = _load_compiled_hints()
-        self._init_dspy()
+    def __init__(self, llm=None, runtime: Optional[PlannerRuntime] = None):
+        self.runtime = runtime or get_planner_runtime()
 
-        if self.use_dspy:
-            class PlanActions(dspy.Signature):
-                """Given a learning goal JSON and hints, return 3 concrete next steps as a JSON list."""
-                goal_json: str
-                hints_json: str
-                steps_json: str  # JSON list of steps
-
-            self.plan_actions = dspy.Predict(PlanActions)
-
-    def _init_dspy(self):
-        provider = os.getenv("LLM_PROVIDER", "dummy").lower()
-        if dspy is None or provider == "dummy":
-            self.use_dspy = False
-            return
-        if provider == "openai":
-            model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-            try:
-                dspy.configure(lm=dspy.OpenAI(model=model))
-                self.use_dspy = True
-            except Exception:
-                self.use_dspy = False
-        else:
-            self.use_dspy = False
+    @property
+    def use_dspy(self) -> bool:
+        return self.runtime.use_dspy
+
+    @property
+    def compiled_hints(self) -> Optional[Dict[str, Any]]:
+        return self.runtime.hints()
 
     async def steps(self, goal: Dict[str, Any]) -> List[str]:
         if self.use_dspy:
-            hints = json.dumps(self.compiled_hints or {})
+            hints = self.runtime.hints_json()
+            plan_actions = self.runtime.predictor("plan_actions", _plan_actions_signature)
             def _run():
-                out = self.plan_actions(goal_json=json.dumps(goal), hints_json=hints)
+                out = plan_actions(goal_json=json.dumps(goal), hints_json=hints)
                 return out.steps_json
-            steps_json = await asyncio.get_event_loop().run_in_executor(None, _run)
-            try:
-                data = json.loads(steps_json)
-                if isinstance(data, list):
-                    return data
-                return [steps_json]
-            except Exception:
-                return [steps_json]
+            steps_json = await self.runtime.executor.run(_run)
+            return _parse_steps(steps_json)
         # Fallback
-        return [
-            "Block 25 minutes today for focused practice",
-            "Complete a bite-sized lesson related to your goal",
-            "Log one takeaway and one question to revisit"
-        ]
+        return list(FALLBACK_STEPS)
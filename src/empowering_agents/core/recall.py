@@ -0,0 +1,325 @@
+import os, re, json, math, zlib, asyncio, threading
+from concurrent.futures import Executor
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from ..utils.lru import LRUCache
+
+if TYPE_CHECKING:
+    import numpy as np  # imported on first use (slow to import); recall needs it
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbedder:
+    """
+    Stateless CPU embedding: unigrams and bigrams hashed (crc32) into dim
+    signed buckets, log-scaled counts, L2-normalized. Deterministic across
+    processes, so stored vectors never go stale.
+    """
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        import numpy as np
+
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())
+            counts: Dict[int, float] = {}
+            for feat in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                h = zlib.crc32(feat.encode("utf-8"))
+                idx = h % self.dim
+                counts[idx] = counts.get(idx, 0.0) + (1.0 if (h >> 31) & 1 else -1.0)
+            for idx, c in counts.items():
+                out[row, idx] = math.copysign(math.log1p(abs(c)), c)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def interaction_text(record: Dict[str, Any]) -> str:
+    return f"{record.get('user_message', '')}\n{record.get('agent_response', '')}"
+
+
+class VectorShard:
+    """
+    One user's archived interactions and their vectors.
+
+    Exact mode scores every vector with one matrix product. Once a shard
+    holds ivf_min_size vectors it switches to IVF: k-means centroids over
+    the vectors, int8-quantized codes (4x smaller than float32) and only
+    the nprobe closest lists are scored. Vectors added after the last
+    build are scanned exactly until the shard doubles and is re-clustered.
+    Rows not yet written to the vector file are also kept as float32 until
+    mark_saved(), so the file never holds dequantized codes.
+    """
+    def __init__(self, dim: int, ivf_min_size: int = 4096, nprobe: int = 8):
+        import numpy as np
+
+        self.dim = dim
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.records: List[Dict[str, Any]] = []
+        self._vecs = np.zeros((0, dim), dtype=np.float32)  # exact mode / not yet clustered tail
+        self._tail_start = 0  # first row of _vecs; rows before it live in the IVF
+        self._centroids = None
+        self._codes = None
+        self._scales = None
+        self._lists: List["np.ndarray"] = []
+        self.saved_rows = 0
+        self._unsaved = np.zeros((0, dim), dtype=np.float32)  # rows saved_rows.. as added
+        self._save_lock = threading.Lock()  # records/_unsaved/saved_rows vs. the saving thread
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, records: List[Dict[str, Any]], vectors: "np.ndarray"):
+        import numpy as np
+
+        vectors = vectors.astype(np.float32, copy=False)
+        with self._save_lock:
+            self.records.extend(records)
+            self._unsaved = np.concatenate([self._unsaved, vectors])
+        self._vecs = np.concatenate([self._vecs, vectors])
+        indexed = self._tail_start
+        if len(self) >= self.ivf_min_size and len(self) >= 2 * max(indexed, self.ivf_min_size // 2):
+            self._build_ivf()
+
+    def unsaved(self) -> Tuple[int, "np.ndarray"]:
+        """(first row, float32 vectors) for the rows not yet in the vector file."""
+        with self._save_lock:
+            return self.saved_rows, self._unsaved
+
+    def mark_saved(self, rows: int):
+        with self._save_lock:
+            if rows > self.saved_rows:
+                self._unsaved = self._unsaved[rows - self.saved_rows:].copy()
+                self.saved_rows = rows
+
+    def vectors(self) -> "np.ndarray":
+        """All vectors as float32 (dequantized for the IVF part)."""
+        import numpy as np
+
+        if self._codes is None:
+            return self._vecs
+        return np.concatenate([self._codes.astype(np.float32) / self._scales[:, None], self._vecs])
+
+    def _build_ivf(self, iterations: int = 8, seed: int = 0):
+        import numpy as np
+
+        data = self.vectors()
+        n = len(data)
+        nlist = max(1, int(math.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = data[rng.choice(n, size=min(n, nlist * 40), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        assign = np.argmax(data @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(nlist)]
+        self._centroids = centroids.astype(np.float32)
+        scale = 127.0 / np.maximum(np.abs(data).max(axis=1), 1e-12)
+        self._codes = np.round(data * scale[:, None]).astype(np.int8)
+        self._scales = scale.astype(np.float32)
+        self._vecs = np.zeros((0, self.dim), dtype=np.float32)
+        self._tail_start = n
+
+    def search(self, queries: "np.ndarray", k: int) -> List[List[Tuple[float, int]]]:
+        """Top-k (score, row) per query row; one matrix product per part."""
+        import numpy as np
+
+        results = []
+        if not len(self) or k <= 0:
+            return [[] for _ in range(len(queries))]
+        tail_scores = queries @ self._vecs.T if len(self._vecs) else None
+        if self._centroids is not None:
+            probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :self.nprobe]
+        for qi, q in enumerate(queries):
+            ids_parts, score_parts = [], []
+            if self._centroids is not None:
+                cand = np.concatenate([self._lists[c] for c in probes[qi]])
+                if len(cand):
+                    ids_parts.append(cand)
+                    score_parts.append((self._codes[cand].astype(np.float32) @ q) / self._scales[cand])
+            if tail_scores is not None:
+                ids_parts.append(np.arange(self._tail_start, len(self)))
+                score_parts.append(tail_scores[qi])
+            if not ids_parts:
+                results.append([])
+                continue
+            ids, scores = np.concatenate(ids_parts), np.concatenate(score_parts)
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results.append([(float(scores[i]), int(ids[i])) for i in top])
+        return results
+
+
+class RecallIndex:
+    """
+    Long-term recall for interactions that fall out of the memory window.
+
+    Archived interactions are appended to {user}.jsonl under storage_dir;
+    their float32 vectors are cached in {user}.npy (extended every
+    save_every new rows and on close) so loading a shard only embeds what
+    is newer. Shards are loaded on first recall and kept in a bounded LRU.
+    Callers serialize access per user (UserMemorySystem does, under the
+    user's lock); file I/O runs on io_executor, embedding and clustering
+    in a worker thread.
+    """
+    def __init__(
+        self,
+        storage_dir: str = "./.mem/recall",
+        io_executor: Optional[Executor] = None,
+        dim: Optional[int] = None,
+        max_shards: Optional[int] = None,
+        ivf_min_size: Optional[int] = None,
+        save_every: int = 256,
+    ):
+        if find_spec("numpy") is None:
+            raise RuntimeError("Semantic recall needs numpy (pip install numpy)")
+        self.storage_dir = storage_dir
+        os.makedirs(storage_dir, exist_ok=True)
+        self.io_executor = io_executor
+        self.embedder = HashingEmbedder(dim or int(os.getenv("RECALL_DIM", "256")))
+        self.ivf_min_size = ivf_min_size or int(os.getenv("RECALL_IVF_MIN_SIZE", "4096"))
+        self.save_every = save_every
+        self.min_score = float(os.getenv("RECALL_MIN_SCORE", "0.2"))
+        self.shards = LRUCache(max_entries=max_shards or int(os.getenv("RECALL_MAX_SHARDS", "1000")))
+        self._appends: Dict[str, asyncio.Future] = {}
+
+    async def _run_io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io_executor, fn, *args)
+
+    def _paths(self, user_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.storage_dir, user_id)
+        return base + ".jsonl", base + ".npy"
+
+    def _load_shard(self, user_id: str) -> VectorShard:
+        import numpy as np
+
+        records_path, vec_path = self._paths(user_id)
+        shard = VectorShard(self.embedder.dim, self.ivf_min_size)
+        if not os.path.exists(records_path):
+            return shard
+        records = []
+        with open(records_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # torn final line after a crash
+        cached = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        if os.path.exists(vec_path):
+            cached = np.load(vec_path)
+            if cached.ndim != 2 or cached.shape[1] != self.embedder.dim or len(cached) > len(records):
+                cached = cached[:0].reshape(0, self.embedder.dim)
+        fresh = self.embedder.embed([interaction_text(r) for r in records[len(cached):]])
+        shard.add(records, np.concatenate([cached, fresh]) if len(cached) else fresh)
+        shard.mark_saved(len(cached))
+        return shard
+
+    def _append_records(self, user_id: str, records: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        with open(self._paths(user_id)[0], "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _save_vectors(self, user_id: str, shard: VectorShard):
+        """Extend {user}.npy with the shard's unsaved float32 rows (atomic rewrite)."""
+        import numpy as np
+
+        start, fresh = shard.unsaved()
+        if not len(fresh):
+            return
+        vec_path = self._paths(user_id)[1]
+        existing = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        if os.path.exists(vec_path):
+            existing = np.load(vec_path)
+            if existing.ndim != 2 or existing.shape[1] != self.embedder.dim:
+                existing = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        if len(existing) < start:
+            # file lost or stale: the embedding is deterministic, so rebuild the gap
+            gap = self.embedder.embed([interaction_text(r) for r in shard.records[len(existing):start]])
+            existing = np.concatenate([existing, gap])
+        tmp = vec_path + ".tmp.npy"
+        np.save(tmp, np.concatenate([existing[:start], fresh]))
+        os.replace(tmp, vec_path)
+        shard.mark_saved(start + len(fresh))
+
+    async def _shard(self, user_id: str) -> VectorShard:
+        shard = self.shards.get(user_id)
+        if shard is None:
+            pending = self._appends.get(user_id)
+            if pending is not None:
+                await pending  # the file must include every archived record
+            shard = await self._run_io(self._load_shard, user_id)
+            self.shards.set(user_id, shard)
+        return shard
+
+    async def archive(self, user_id: str, records: List[Dict[str, Any]]):
+        """Add interactions to the user's archive; the file append happens in the background."""
+        if not records:
+            return
+        records = list(records)
+        shard = self.shards.get(user_id)
+        if shard is not None:
+            # CPU-bound (and add() may re-cluster): keep it off the event loop
+            vectors = await asyncio.to_thread(self.embedder.embed, [interaction_text(r) for r in records])
+            await asyncio.to_thread(shard.add, records, vectors)
+        previous = self._appends.get(user_id)
+
+        async def _append():
+            if previous is not None:
+                await previous
+            await self._run_io(self._append_records, user_id, records)
+            if shard is not None and len(shard) - shard.saved_rows >= self.save_every:
+                await self._run_io(self._save_vectors, user_id, shard)
+
+        def _done(task: asyncio.Future):
+            if self._appends.get(user_id) is task:
+                del self._appends[user_id]
+
+        task = asyncio.ensure_future(_append())
+        self._appends[user_id] = task
+        task.add_done_callback(_done)
+
+    async def recall(self, user_id: str, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """The k archived interactions most similar to query (score >= RECALL_MIN_SCORE)."""
+        return (await self.recall_many(user_id, [query], k))[0]
+
+    async def recall_many(self, user_id: str, queries: List[str], k: int = 3) -> List[List[Dict[str, Any]]]:
+        shard = await self._shard(user_id)
+        if not len(shard):
+            return [[] for _ in queries]
+        # CPU-bound like archive(): embedding and the scan run in a worker thread
+        vectors = await asyncio.to_thread(self.embedder.embed, queries)
+        hits = await asyncio.to_thread(shard.search, vectors, k)
+        return [
+            [{**shard.records[row], "score": round(score, 4)} for score, row in per_query if score >= self.min_score]
+            for per_query in hits
+        ]
+
+    async def flush(self):
+        while self._appends:
+            await asyncio.gather(*list(self._appends.values()))
+
+    async def close(self):
+        await self.flush()
+        for user_id, shard in self.shards.items():
+            if len(shard) > shard.saved_rows:
+                await self._run_io(self._save_vectors, user_id, shard)
+
+
+def create_recall_index(storage_dir: str, io_executor: Optional[Executor] = None) -> Optional[RecallIndex]:
+    """Opt-in: MEMORY_RECALL=true (needs numpy) | auto (on when numpy is installed) | false (default)."""
+    setting = os.getenv("MEMORY_RECALL", "false").lower()
+    if setting not in ("true", "auto") or (setting == "auto" and find_spec("numpy") is None):
+        return None
+    return RecallIndex(os.path.join(storage_dir, "recall"), io_executor=io_executor)
@@ -0,0 +1,494 @@
+import os, json, glob
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+
+from ..utils.sqlite_utils import ThreadLocalConnections
+
+MAX_INTERACTIONS = 100
+
+SNAPSHOT_MODE = "snapshot"
+APPEND_MODE = "append"
+
+
+class MemoryBackend(ABC):
+    """
+    Storage interface for UserMemorySystem and GoalTracker.
+
+    Methods are synchronous; callers decide which thread they run on.
+    A memory dict has the shape
+    {"user_id", "created_at", "interactions", "preferences", "summary"}
+    plus an optional "summary_state" holding the summary's running aggregates.
+    A backend may return a memory with an empty "summary" to ask the caller
+    to rebuild it (e.g. after replaying a log).
+    persists_goals is False when load_goals()/save_goals() are no-ops.
+    """
+    persists_goals = False
+
+    @abstractmethod
+    def load_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save_user(self, user_id: str, memory: Dict[str, Any]):
+        ...
+
+    def append_interaction(self, user_id: str, interaction: Dict[str, Any], memory: Dict[str, Any]):
+        self.save_user(user_id, memory)
+
+    def update_preferences(self, user_id: str, preferences: Dict[str, Any], memory: Dict[str, Any]):
+        self.save_user(user_id, memory)
+
+    def write_batch(self, user_id: str, ops: List[Tuple[str, Dict[str, Any]]], memory: Dict[str, Any]):
+        """
+        Persist several coalesced changes for one user. ops are ("interaction", record)
+        or ("preferences", update) in order; memory is the state after all of them.
+        """
+        for op, data in ops:
+            if op == "interaction":
+                self.append_interaction(user_id, data, memory)
+            elif op == "preferences":
+                self.update_preferences(user_id, data, memory)
+
+    def needs_compaction(self, user_id: str) -> bool:
+        return False
+
+    def compact(self, user_id: str, memory: Dict[str, Any]):
+        pass
+
+    def load_goals(self, user_id: str) -> List[Dict[str, Any]]:
+        return []
+
+    def save_goals(self, items: Iterable[Tuple[str, Dict[str, Any]]]):
+        pass
+
+    def close(self):
+        pass
+
+
+def _write_atomic(path: str, text: str):
+    """Replace path with text so a crash leaves either the old or the new file, never a torn one."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class JsonFileBackend(MemoryBackend):
+    """
+    One file per user under storage_dir.
+
+    mode="snapshot" rewrites {user}.json on every change (temp file,
+    fsync, rename, so a crash never leaves a torn snapshot).
+    mode="append" appends one compact record per change to {user}.log.jsonl;
+    compact() folds the log into {user}.json. Records carry a sequence
+    number and the snapshot stores the last one it includes, so a crash
+    mid-compaction never replays a record twice.
+    With fsync=True every write is flushed to stable storage before returning.
+    Goals are not persisted by this backend (create_goal_store() gives
+    GoalTracker a GoalJournal next to it instead).
+    """
+    def __init__(
+        self,
+        storage_dir: str = "./.mem",
+        mode: str = SNAPSHOT_MODE,
+        compact_every: int = 200,
+        fsync: bool = False,
+    ):
+        if mode not in (SNAPSHOT_MODE, APPEND_MODE):
+            raise ValueError(f"Unknown storage_mode: {mode}")
+        self.storage_dir = storage_dir
+        self.mode = mode
+        self.compact_every = compact_every
+        self.fsync = fsync
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self._seq: Dict[str, int] = {}          # last sequence number written per user
+        self._log_records: Dict[str, int] = {}  # records in the live log per user
+
+    def _snapshot_path(self, user_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{user_id}.json")
+
+    def _log_path(self, user_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{user_id}.log.jsonl")
+
+    def load_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        memory = None
+        path = self._snapshot_path(user_id)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                memory = json.load(f)
+        seq = memory.pop("log_seq", 0) if memory else 0
+        self._seq[user_id] = seq
+        if self.mode == APPEND_MODE:
+            memory = self._replay_log(user_id, memory)
+        return memory
+
+    def _replay_log(self, user_id: str, memory: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        applied = 0
+        live = 0
+        log_path = self._log_path(user_id)
+        # ".compacting" holds records of an interrupted compaction; replay it first
+        for path in (log_path + ".compacting", log_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line after a crash
+                    if path == log_path:
+                        live += 1
+                    if rec.get("seq", 0) <= self._seq[user_id]:
+                        continue
+                    self._seq[user_id] = rec["seq"]
+                    if memory is None:
+                        memory = new_user_memory(user_id)
+                    if rec.get("op") == "interaction":
+                        memory.setdefault("interactions", []).append(rec["data"])
+                    elif rec.get("op") == "preferences":
+                        memory.setdefault("preferences", {}).update(rec["data"])
+                    applied += 1
+        self._log_records[user_id] = live
+        if applied:
+            memory["interactions"] = memory.get("interactions", [])[-MAX_INTERACTIONS:]
+            memory["summary"] = {}  # stale: ask the caller to rebuild it
+            memory.pop("summary_state", None)
+        return memory
+
+    def save_user(self, user_id: str, memory: Dict[str, Any]):
+        _write_atomic(self._snapshot_path(user_id), json.dumps(memory, indent=2))
+
+    def _append(self, user_id: str, ops: List[Tuple[str, Dict[str, Any]]]):
+        lines = []
+        for op, data in ops:
+            seq = self._seq.get(user_id, 0) + 1
+            self._seq[user_id] = seq
+            lines.append(json.dumps({"seq": seq, "op": op, "data": data}, separators=(",", ":")) + "\n")
+        with open(self._log_path(user_id), "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._log_records[user_id] = self._log_records.get(user_id, 0) + len(lines)
+
+    def append_interaction(self, user_id: str, interaction: Dict[str, Any], memory: Dict[str, Any]):
+        self.write_batch(user_id, [("interaction", interaction)], memory)
+
+    def update_preferences(self, user_id: str, preferences: Dict[str, Any], memory: Dict[str, Any]):
+        self.write_batch(user_id, [("preferences", preferences)], memory)
+
+    def write_batch(self, user_id: str, ops: List[Tuple[str, Dict[str, Any]]], memory: Dict[str, Any]):
+        if not ops:
+            return
+        if self.mode == APPEND_MODE:
+            self._append(user_id, ops)
+        else:
+            # a snapshot already reflects every coalesced change
+            self.save_user(user_id, memory)
+
+    def needs_compaction(self, user_id: str) -> bool:
+        return self.mode == APPEND_MODE and self._log_records.get(user_id, 0) >= self.compact_every
+
+    def compact(self, user_id: str, memory: Dict[str, Any]):
+        """Fold the user's append log into a fresh snapshot."""
+        log_path = self._log_path(user_id)
+        pending = log_path + ".compacting"
+        if not os.path.exists(log_path) or os.path.exists(pending):
+            return
+        snapshot = json.dumps({**memory, "log_seq": self._seq.get(user_id, 0)}, separators=(",", ":"))
+        os.replace(log_path, pending)
+        self._log_records[user_id] = 0
+        _write_atomic(self._snapshot_path(user_id), snapshot)
+        os.remove(pending)
+
+    def user_ids(self) -> List[str]:
+        ids = set()
+        for path in glob.glob(os.path.join(self.storage_dir, "*.json")):
+            ids.add(os.path.basename(path)[: -len(".json")])
+        for path in glob.glob(os.path.join(self.storage_dir, "*.log.jsonl")):
+            ids.add(os.path.basename(path)[: -len(".log.jsonl")])
+        return sorted(ids)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    user_message TEXT NOT NULL,
+    agent_response TEXT NOT NULL,
+    context TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_user ON interactions (user_id, id);
+CREATE INDEX IF NOT EXISTS idx_interactions_timestamp ON interactions (timestamp);
+CREATE TABLE IF NOT EXISTS preferences (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (user_id, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT '{}',
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS goals (
+    user_id TEXT NOT NULL,
+    goal_id TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0.0,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, goal_id)
+);
+CREATE INDEX IF NOT EXISTS idx_goals_progress ON goals (user_id, progress);
+"""
+
+# Statement texts are constants so sqlite3's statement cache reuses the prepared form
+_SQL_INSERT_USER = "INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)"
+_SQL_SELECT_USER = "SELECT created_at FROM users WHERE user_id = ?"
+_SQL_INSERT_INTERACTION = (
+    "INSERT INTO interactions (user_id, timestamp, user_message, agent_response, context) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+_SQL_SELECT_INTERACTIONS = (
+    "SELECT timestamp, user_message, agent_response, context FROM interactions "
+    "WHERE user_id = ? ORDER BY id DESC LIMIT ?"
+)
+_SQL_TRIM_INTERACTIONS = (
+    "DELETE FROM interactions WHERE user_id = ? AND id <= "
+    "(SELECT id FROM interactions WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)"
+)
+_SQL_DELETE_INTERACTIONS = "DELETE FROM interactions WHERE user_id = ?"
+_SQL_UPSERT_PREFERENCE = (
+    "INSERT INTO preferences (user_id, key, value) VALUES (?, ?, ?) "
+    "ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value"
+)
+_SQL_SELECT_PREFERENCES = "SELECT key, value FROM preferences WHERE user_id = ?"
+_SQL_DELETE_PREFERENCES = "DELETE FROM preferences WHERE user_id = ?"
+_SQL_UPSERT_SUMMARY = (
+    "INSERT INTO summaries (user_id, summary, state, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user_id) DO UPDATE SET summary = excluded.summary, state = excluded.state, "
+    "updated_at = excluded.updated_at"
+)
+_SQL_SELECT_SUMMARY = "SELECT summary, state FROM summaries WHERE user_id = ?"
+_SQL_UPSERT_GOAL = (
+    "INSERT INTO goals (user_id, goal_id, progress, data) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user_id, goal_id) DO UPDATE SET progress = excluded.progress, data = excluded.data"
+)
+_SQL_SELECT_GOALS = "SELECT data FROM goals WHERE user_id = ? ORDER BY rowid"
+
+
+class SQLiteBackend(MemoryBackend):
+    """
+    SQLite (WAL) storage with indexed tables for interactions, preferences,
+    summaries and goals. Safe to share between uvicorn workers: WAL gives
+    concurrent readers, and writes take the lock up front (BEGIN IMMEDIATE)
+    and wait on busy_timeout instead of failing.
+
+    retain_interactions keeps the newest N rows per user (None keeps all;
+    loads always read only the newest MAX_INTERACTIONS).
+    """
+    persists_goals = True
+
+    def __init__(
+        self,
+        db_path: str = "./.mem/memory.db",
+        synchronous: str = "NORMAL",
+        retain_interactions: Optional[int] = MAX_INTERACTIONS,
+    ):
+        self.db_path = db_path
+        self.retain_interactions = retain_interactions
+        self._conns = ThreadLocalConnections(db_path, synchronous=synchronous)
+        with self._conns.transaction() as conn:
+            for stmt in _SCHEMA.split(";"):
+                if stmt.strip():
+                    conn.execute(stmt)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(summaries)")}
+            if "state" not in columns:  # databases created before summary aggregates
+                conn.execute("ALTER TABLE summaries ADD COLUMN state TEXT NOT NULL DEFAULT '{}'")
+
+    def load_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._conns.get()
+        row = conn.execute(_SQL_SELECT_USER, (user_id,)).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(_SQL_SELECT_INTERACTIONS, (user_id, MAX_INTERACTIONS)).fetchall()
+        interactions = [
+            {"timestamp": ts, "user_message": um, "agent_response": ar, "context": json.loads(ctx)}
+            for ts, um, ar, ctx in reversed(rows)
+        ]
+        prefs = {k: json.loads(v) for k, v in conn.execute(_SQL_SELECT_PREFERENCES, (user_id,))}
+        summary_row = conn.execute(_SQL_SELECT_SUMMARY, (user_id,)).fetchone()
+        memory = {
+            "user_id": user_id,
+            "created_at": row[0],
+            "interactions": interactions,
+            "preferences": prefs,
+            "summary": json.loads(summary_row[0]) if summary_row else {},
+        }
+        state = json.loads(summary_row[1]) if summary_row else {}
+        if state:
+            memory["summary_state"] = state
+        return memory
+
+    def _write_user(self, conn, user_id: str, memory: Dict[str, Any]):
+        conn.execute(_SQL_INSERT_USER, (user_id, memory.get("created_at") or datetime.now().isoformat()))
+        conn.execute(_SQL_DELETE_INTERACTIONS, (user_id,))
+        conn.executemany(_SQL_INSERT_INTERACTION, [
+            (user_id, i.get("timestamp", ""), i.get("user_message", ""), i.get("agent_response", ""),
+             json.dumps(i.get("context") or {}))
+            for i in memory.get("interactions", [])
+        ])
+        conn.execute(_SQL_DELETE_PREFERENCES, (user_id,))
+        conn.executemany(_SQL_UPSERT_PREFERENCE, [
+            (user_id, k, json.dumps(v)) for k, v in (memory.get("preferences") or {}).items()
+        ])
+        self._write_summary(conn, user_id, memory)
+
+    def _write_summary(self, conn, user_id: str, memory: Dict[str, Any]):
+        conn.execute(_SQL_UPSERT_SUMMARY, (
+            user_id, json.dumps(memory.get("summary") or {}),
+            json.dumps(memory.get("summary_state") or {}), datetime.now().isoformat()
+        ))
+
+    def save_user(self, user_id: str, memory: Dict[str, Any]):
+        with self._conns.transaction() as conn:
+            self._write_user(conn, user_id, memory)
+
+    def save_users(self, batch: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Write many users in a single transaction (bulk import)."""
+        with self._conns.transaction() as conn:
+            for user_id, memory in batch:
+                self._write_user(conn, user_id, memory)
+
+    def append_interaction(self, user_id: str, interaction: Dict[str, Any], memory: Dict[str, Any]):
+        self.write_batch(user_id, [("interaction", interaction)], memory)
+
+    def update_preferences(self, user_id: str, preferences: Dict[str, Any], memory: Dict[str, Any]):
+        self.write_batch(user_id, [("preferences", preferences)], memory)
+
+    def write_batch(self, user_id: str, ops: List[Tuple[str, Dict[str, Any]]], memory: Dict[str, Any]):
+        """All coalesced changes for a user in one transaction."""
+        interactions = [d for op, d in ops if op == "interaction"]
+        preferences: Dict[str, Any] = {}
+        for op, d in ops:
+            if op == "preferences":
+                preferences.update(d)
+        with self._conns.transaction() as conn:
+            conn.execute(_SQL_INSERT_USER, (user_id, memory.get("created_at") or datetime.now().isoformat()))
+            if interactions:
+                conn.executemany(_SQL_INSERT_INTERACTION, [
+                    (user_id, i["timestamp"], i["user_message"], i["agent_response"],
+                     json.dumps(i.get("context") or {}))
+                    for i in interactions
+                ])
+                if self.retain_interactions:
+                    conn.execute(_SQL_TRIM_INTERACTIONS, (user_id, user_id, self.retain_interactions))
+                self._write_summary(conn, user_id, memory)
+            if preferences:
+                conn.executemany(_SQL_UPSERT_PREFERENCE, [
+                    (user_id, k, json.dumps(v)) for k, v in preferences.items()
+                ])
+
+    def load_goals(self, user_id: str) -> List[Dict[str, Any]]:
+        conn = self._conns.get()
+        return [json.loads(data) for (data,) in conn.execute(_SQL_SELECT_GOALS, (user_id,))]
+
+    def save_goals(self, items: Iterable[Tuple[str, Dict[str, Any]]]):
+        with self._conns.transaction() as conn:
+            conn.executemany(_SQL_UPSERT_GOAL, [
+                (user_id, str(g.get("id", "")), float(g.get("current_progress", 0.0)), json.dumps(g))
+                for user_id, g in items
+            ])
+
+    def close(self):
+        self._conns.close()
+
+
+def new_user_memory(user_id: str) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "created_at": datetime.now().isoformat(),
+        "interactions": [],
+        "preferences": {},
+        "summary": {}
+    }
+
+
+DURABILITY_FSYNC = "fsync"
+DURABILITY_RELAXED = "relaxed"
+
+
+def create_memory_backend(
+    storage_dir: str = "./.mem",
+    storage_mode: Optional[str] = None,
+    compact_every: Optional[int] = None,
+    durability: Optional[str] = None,
+) -> MemoryBackend:
+    """
+    Backend from MEMORY_BACKEND=json|sqlite (default json).
+    durability (MEMORY_DURABILITY): "fsync" syncs every write to disk
+    (SQLite synchronous=FULL); "relaxed" leaves it to the OS (synchronous=NORMAL,
+    which in WAL mode can only lose the last commits on power loss).
+    """
+    durability = (durability or os.getenv("MEMORY_DURABILITY", DURABILITY_RELAXED)).lower()
+    if durability not in (DURABILITY_FSYNC, DURABILITY_RELAXED):
+        raise ValueError(f"Unknown durability: {durability}")
+    kind = os.getenv("MEMORY_BACKEND", "json").lower()
+    if kind == "sqlite":
+        return SQLiteBackend(
+            db_path=os.getenv("MEMORY_DB_PATH", os.path.join(storage_dir, "memory.db")),
+            synchronous="FULL" if durability == DURABILITY_FSYNC else "NORMAL",
+        )
+    if kind != "json":
+        raise ValueError(f"Unknown MEMORY_BACKEND: {kind}")
+    return JsonFileBackend(
+        storage_dir=storage_dir,
+        mode=(storage_mode or os.getenv("MEMORY_STORAGE_MODE", SNAPSHOT_MODE)).lower(),
+        compact_every=compact_every or int(os.getenv("MEMORY_COMPACT_EVERY", "200")),
+        fsync=durability == DURABILITY_FSYNC,
+    )
+
+
+def migrate_json_to_sqlite(json_dir: str, db_path: str, batch_size: int = 500) -> int:
+    """
+    Import every user from a JSON memory directory (snapshots and append logs)
+    into a SQLite database, batch_size users per transaction. Returns the user count.
+    """
+    source = JsonFileBackend(json_dir, mode=APPEND_MODE)
+    target = SQLiteBackend(db_path, retain_interactions=None)
+    count = 0
+    batch: List[Tuple[str, Dict[str, Any]]] = []
+    try:
+        for user_id in source.user_ids():
+            memory = source.load_user(user_id)
+            if memory is None:
+                continue
+            batch.append((user_id, memory))
+            if len(batch) >= batch_size:
+                target.save_users(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            target.save_users(batch)
+            count += len(batch)
+    finally:
+        target.close()
+    return count
+
+
+if __name__ == "__main__":
+    # python -m src.empowering_agents.core.storage migrate ./.mem ./.mem/memory.db
+    import sys
+    if len(sys.argv) != 4 or sys.argv[1] != "migrate":
+        print("usage: storage.py migrate <json_dir> <db_path>")
+        sys.exit(1)
+    n = migrate_json_to_sqlite(sys.argv[2], sys.argv[3])
+    print(f"Migrated {n} users into {sys.argv[3]}")
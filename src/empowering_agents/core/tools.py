@@ -4,6 +4,8 @@ import asyncio
 from typing import Dict, Any
 
 from ..integrations import google_calendar as gcal
+from ..integrations.calendar_sync import get_calendar_sync
+from .knowledge_base import get_knowledge_base
 
 
 class ToolRegistry:
@@ -51,21 +53,38 @@ class ToolRegistry:
             tz = schedule.get("timeZone", os.getenv("GOOGLE_CALENDAR_TIMEZONE", "UTC"))
 
             if start_iso and end_iso:
-                created = gcal.create_event(summary, start_iso, end_iso, tz)
+                # Google client is blocking: keep it off the event loop so tool
+                # deadlines in EmpoweringAgent can actually fire
+                created = await asyncio.to_thread(gcal.create_event, summary, start_iso, end_iso, tz)
                 return {"enabled": True, "result": created}
 
-        # Otherwise, if enabled: list upcoming events and suggest a default block
+        # Otherwise, if enabled: list upcoming events and suggest a free block
         if enabled:
-            listing = gcal.list_upcoming_events(max_results=5)
-            suggestion = gcal.suggest_block_and_optionally_create(create=False)
+            # incremental sync into the user's event cache; slots come from its busy intervals
+            cache = await asyncio.to_thread(get_calendar_sync().sync, user_id)
+            if cache is None:
+                listing = await asyncio.to_thread(gcal.list_upcoming_events, 5)
+                suggestion = gcal.suggest_block_and_optionally_create(create=False)
+            else:
+                listing = {"enabled": True, "events": cache.upcoming(5)}
+                suggestion = gcal.suggest_block_and_optionally_create(create=False, busy=cache.busy())
             return {"enabled": True, "upcoming": listing, "suggestion": suggestion}
 
         # Fallback when not enabled: keep examples working without Google setup
         return {"enabled": False, "suggested_block": {"day": "tomorrow", "time": "18:00-18:30"}}
 
     async def _kb_tool(self, user_id, intent, context):
-        # Minimal mock "KB"
-        query = (intent.get("surface_intent") or "").lower()
+        query = intent.get("surface_intent") or ""
+        # BM25 index built with `python -m src.empowering_agents.core.knowledge_base build`
+        kb = get_knowledge_base()
+        if kb is not None:
+            results = await kb.asearch(query, k=int(os.getenv("KB_TOP_K", "3")))
+            if results:
+                return {"kb": results[0]["snippet"], "source": results[0]["path"], "results": results}
+            return {"kb": "No specific article found; try refining your query.", "results": []}
+
+        # Minimal mock "KB" when no index is configured
+        query = query.lower()
         if "correlation" in query:
             return {"kb": "Correlation ≠ causation; controlled experiments establish causality."}
         return {"kb": "No specific article found; try refining your query."}
@@ -0,0 +1,88 @@
+import os, json
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+# Default taxonomy (the previously hard-coded topics); override via TOPIC_TAXONOMY_PATH
+# (a JSON object of {"topic": ["keyword", ...]}).
+DEFAULT_TAXONOMY: Dict[str, List[str]] = {
+    "fitness": ["fitness", "workout", "gym"],
+    "learning": ["learn", "study", "course"],
+    "finance": ["money", "budget", "finance"],
+}
+
+
+class TopicMatcher:
+    """
+    Aho-Corasick automaton over all taxonomy keywords.
+
+    Built once; topics_in() scans a message in a single pass regardless of
+    how many keywords or topics the taxonomy holds. Matching is on
+    lowercased substrings, like the `keyword in text` checks it replaces.
+    """
+    def __init__(self, taxonomy: Dict[str, List[str]]):
+        self.topics: List[str] = list(taxonomy)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[int]] = [set()]
+        for topic_id, topic in enumerate(self.topics):
+            for keyword in taxonomy[topic]:
+                self._add(keyword.lower(), topic_id)
+        self._build_failure_links()
+
+    def _add(self, keyword: str, topic_id: int):
+        if not keyword:
+            return
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+            state = nxt
+        self._out[state].add(topic_id)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0) if self._goto[f].get(ch, 0) != nxt else 0
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def topics_in(self, text: str) -> Set[str]:
+        found: Set[int] = set()
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return {self.topics[i] for i in found}
+
+
+def load_taxonomy(path: Optional[str] = None) -> Dict[str, List[str]]:
+    path = path or os.getenv("TOPIC_TAXONOMY_PATH")
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_TAXONOMY
+
+
+_DEFAULT_MATCHER: Optional[TopicMatcher] = None
+
+
+def get_topic_matcher() -> TopicMatcher:
+    """Process-wide matcher, compiled once from the configured taxonomy."""
+    global _DEFAULT_MATCHER
+    if _DEFAULT_MATCHER is None:
+        _DEFAULT_MATCHER = TopicMatcher(load_taxonomy())
+    return _DEFAULT_MATCHER
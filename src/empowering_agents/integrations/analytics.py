@@ -1,18 +1,239 @@
-import os, json
+import os, json, gzip, shutil, atexit, threading, time
+from collections import deque
 from datetime import datetime
-from typing import Dict, Any
-from dotenv import load_dotenv
+from typing import Dict, Any, Optional, Tuple
 
-load_dotenv()
+from ..utils.env import load_env
 
-LOG_PATH = os.getenv("ANALYTICS_LOG", "./analytics_events.jsonl")
+DEFAULT_LOG_PATH = "./analytics_events.jsonl"
+
+# Overflow policies when the buffer is full
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+
+def _log_path() -> str:
+    load_env()
+    return os.getenv("ANALYTICS_LOG", DEFAULT_LOG_PATH)
+
+
+class AnalyticsWriter:
+    """
+    Batched JSONL writer. record() only appends to a bounded in-memory
+    buffer; a background thread serializes and writes the buffer every
+    flush_interval seconds or once max_batch events are waiting, through one
+    file handle kept open. When the buffer holds max_queue events the
+    overflow policy drops the oldest or the new event, or blocks the caller
+    up to block_timeout seconds (then drops it).
+
+    The file is rotated once it reaches rotate_bytes or is rotate_seconds
+    old (0 disables either); closed segments are named
+    <path>.<timestamp> and gzipped when compress is set. Recorded data is
+    serialized later, on the writer thread: do not mutate it afterwards.
+    """
+    def __init__(
+        self,
+        path: str = DEFAULT_LOG_PATH,
+        max_batch: int = 500,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        overflow: str = DROP_OLDEST,
+        rotate_bytes: int = 64 * 1024 * 1024,
+        rotate_seconds: float = 0,
+        compress: bool = True,
+        block_timeout: float = 1.0,
+    ):
+        if overflow not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.path = path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.block_timeout = block_timeout
+        self._buffer: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._file = None
+        self._opened_at = 0.0
+        self.recorded = 0
+        self._settled = 0  # recorded events written or dropped since
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self._flush_requested = False
+        self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, event_type: str, data: Dict[str, Any]):
+        payload = (datetime.now(), event_type, data)
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return
+            if len(self._buffer) >= self.max_queue:
+                if self.overflow == DROP_OLDEST:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                    self._settled += 1
+                elif self.overflow == DROP_NEWEST or not self._cond.wait_for(
+                    lambda: len(self._buffer) < self.max_queue or self._closed, self.block_timeout
+                ) or self._closed:
+                    self.dropped += 1
+                    return
+            self._buffer.append(payload)
+            self.recorded += 1
+            if len(self._buffer) >= self.max_batch:
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Wait until everything recorded so far is written; False on timeout."""
+        with self._cond:
+            target = self.recorded
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._settled >= target or not self._thread.is_alive(), timeout)
+
+    def close(self, timeout: Optional[float] = 5.0):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "queue_depth": len(self._buffer),
+                "batches": self.batches,
+                "rotations": self.rotations,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or self._flush_requested or len(self._buffer) >= self.max_batch,
+                    self.flush_interval,
+                )
+                batch = self._buffer
+                self._buffer = deque()
+                self._flush_requested = False
+                closing = self._closed
+                self._cond.notify_all()  # room for blocked producers
+            written = dropped = 0
+            if batch:
+                # analytics must never take the caller (or this thread) down:
+                # whatever fails is counted as dropped and the loop goes on
+                lines, dropped = self._serialize(batch)
+                try:
+                    if lines:
+                        self._write(lines)
+                    written = len(batch) - dropped
+                except Exception:
+                    dropped = len(batch)
+            with self._cond:
+                if batch:
+                    if written:
+                        self.written += written
+                        self.batches += 1
+                    self.dropped += dropped
+                    self._settled += len(batch)
+                self._cond.notify_all()
+            if closing and not self._buffer:
+                if self._file is not None:
+                    try:
+                        self._file.close()
+                    except OSError:
+                        pass
+                    self._file = None
+                return
+
+    @staticmethod
+    def _serialize(batch: deque) -> Tuple[str, int]:
+        """(JSONL text, number of events that could not be serialized, e.g. circular data)."""
+        lines, bad = [], 0
+        for ts, event_type, data in batch:
+            try:
+                lines.append(json.dumps({"ts": ts.isoformat(), "type": event_type, "data": data}, default=str) + "\n")
+            except Exception:
+                bad += 1
+        return "".join(lines), bad
+
+    def _write(self, lines: str):
+        if self._file is None:
+            self._open()
+        self._file.write(lines)
+        self._file.flush()
+        if (self.rotate_bytes and self._file.tell() >= self.rotate_bytes) or (
+            self.rotate_seconds and time.monotonic() - self._opened_at >= self.rotate_seconds
+        ):
+            self._rotate()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        segment = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(self.path, segment)
+        if self.compress:
+            with open(segment, "rb") as src, gzip.open(segment + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(segment)
+        self.rotations += 1
+
+
+_WRITERS: Dict[str, AnalyticsWriter] = {}
+_WRITERS_LOCK = threading.Lock()
+_ATEXIT_REGISTERED = False
+
+def get_analytics_writer(path: Optional[str] = None) -> AnalyticsWriter:
+    """Process-wide writer for path (ANALYTICS_LOG by default), flushed at exit."""
+    global _ATEXIT_REGISTERED
+    path = path or _log_path()
+    writer = _WRITERS.get(path)
+    if writer is None:
+        with _WRITERS_LOCK:
+            writer = _WRITERS.get(path)
+            if writer is None:
+                if not _ATEXIT_REGISTERED:
+                    # only processes that record events pay for the exit hook
+                    atexit.register(close_writers)
+                    _ATEXIT_REGISTERED = True
+                writer = _WRITERS[path] = AnalyticsWriter(
+                    path,
+                    max_batch=int(os.getenv("ANALYTICS_BATCH_SIZE", "500")),
+                    flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "1.0")),
+                    max_queue=int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000")),
+                    overflow=os.getenv("ANALYTICS_OVERFLOW", DROP_OLDEST),
+                    rotate_bytes=int(os.getenv("ANALYTICS_ROTATE_BYTES", str(64 * 1024 * 1024))),
+                    rotate_seconds=float(os.getenv("ANALYTICS_ROTATE_SECONDS", "0")),
+                    compress=os.getenv("ANALYTICS_COMPRESS", "true").lower() == "true",
+                )
+    return writer
+
+def flush_events(timeout: Optional[float] = 5.0):
+    for writer in list(_WRITERS.values()):
+        writer.flush(timeout)
+
+def close_writers(timeout: Optional[float] = 5.0):
+    with _WRITERS_LOCK:
+        writers = list(_WRITERS.values())
+        _WRITERS.clear()
+    for writer in writers:
+        writer.close(timeout)
 
 def record_event(event_type: str, data: Dict[str, Any]):
-    os.makedirs(os.path.dirname(LOG_PATH) or ".", exist_ok=True)
-    payload = {
-        "ts": datetime.now().isoformat(),
-        "type": event_type,
-        "data": data
-    }
-    with open(LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(payload) + "\n")
+    """Queue an event for the batched writer; see flush_events() to wait for it."""
+    get_analytics_writer().record(event_type, data)
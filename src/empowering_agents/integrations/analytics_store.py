@@ -0,0 +1,318 @@
+import os, json, gzip, hashlib, math, sys
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import numpy as np  # columnar chunks and vectorized queries
+except ImportError:
+    np = None
+
+from .analytics import _log_path
+
+DEFAULT_STORE_DIR = "./.analytics"
+CHUNK_ROWS = 65536
+DICT_COLUMNS = ("type", "user", "persona")
+
+TimeArg = Union[None, str, float, datetime]
+
+
+def _to_us(value: TimeArg) -> Optional[int]:
+    """datetime, ISO string or epoch seconds -> epoch microseconds (naive times are local, as logged)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return int(round(float(value) * 1_000_000))
+
+
+def _bucket_us(bucket: Union[str, float]) -> int:
+    """"15m", "1h", "1d", "1w" or seconds -> microseconds."""
+    if isinstance(bucket, str):
+        units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+        return int(float(bucket[:-1]) * units[bucket[-1]] * 1_000_000)
+    return int(bucket * 1_000_000)
+
+
+def _row(line: str, value_field: str) -> Optional[Tuple[int, str, str, str, float]]:
+    try:
+        event = json.loads(line)
+        data = event.get("data") or {}
+        value = data.get(value_field)
+        return (
+            _to_us(event["ts"]),
+            str(event.get("type", "")),
+            str(data.get("user_id", data.get("user", ""))),
+            str(data.get("persona", data.get("agent", ""))),
+            float(value) if isinstance(value, (int, float)) else math.nan,
+        )
+    except (ValueError, KeyError, TypeError):
+        return None  # torn or foreign line
+
+
+class EventStore:
+    """
+    Columnar store for the analytics log.
+
+    ingest() streams the rotated segments (<log>.<timestamp>[.gz]) and the
+    tail of the live log into NumPy chunks of up to CHUNK_ROWS rows: int64
+    timestamps (us), dictionary-encoded type/user/persona codes and a float
+    value column (data[value_field], NaN when absent). manifest.json keeps
+    each chunk's row count and min/max timestamp, so queries skip chunks
+    outside their time range and filter the rest with array masks. Ingestion
+    is incremental: consumed segments and the live log's byte offset are
+    recorded, and the offset carries over when that log is rotated.
+    """
+    def __init__(self, store_dir: Optional[str] = None, log_path: Optional[str] = None, value_field: str = "value"):
+        if np is None:
+            raise RuntimeError("The analytics store needs numpy (pip install numpy)")
+        self.store_dir = store_dir or os.getenv("ANALYTICS_STORE_DIR", DEFAULT_STORE_DIR)
+        self.log_path = log_path or _log_path()
+        self.value_field = value_field
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.manifest = self._read_manifest()
+        self._chunks: Dict[str, Dict[str, Any]] = {}
+
+    # -- ingestion -----------------------------------------------------
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.store_dir, "manifest.json")
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"chunks": [], "segments": [], "live": None, "next_chunk": 0}
+
+    def _write_manifest(self):
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self._manifest_path())
+
+    def _segments(self) -> List[Tuple[str, str]]:
+        """
+        (name, path) of rotated segments, oldest first. While a segment is
+        being gzipped both files exist; the uncompressed one is complete.
+        """
+        directory = os.path.dirname(self.log_path) or "."
+        prefix = os.path.basename(self.log_path) + "."
+        if not os.path.isdir(directory):
+            return []
+        names = set(n for n in os.listdir(directory) if n.startswith(prefix))
+        stems = sorted(set(n[:-3] if n.endswith(".gz") else n for n in names))
+        return [(stem, os.path.join(directory, stem if stem in names else stem + ".gz")) for stem in stems]
+
+    @staticmethod
+    def _open(path: str):
+        return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+    @staticmethod
+    def _head(f) -> Optional[str]:
+        first = f.readline()
+        f.seek(0)
+        return hashlib.sha1(first).hexdigest() if first.endswith(b"\n") else None
+
+    def _lines(self, f, offset: int) -> Iterator[bytes]:
+        if offset:
+            f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # still being written
+            yield line
+
+    def ingest(self) -> int:
+        """Convert new events to chunks; returns the number of rows added."""
+        done = set(self.manifest["segments"])
+        live = self.manifest["live"]
+        rows: List[Tuple[int, str, str, str, float]] = []
+        for name, path in self._segments():
+            if name in done:
+                continue
+            with self._open(path) as f:
+                offset = live["offset"] if live and self._head(f) == live["head"] else 0
+                if offset:
+                    live = None  # the live log we were tailing was rotated into this segment
+                rows.extend(r for r in (_row(l.decode("utf-8"), self.value_field) for l in self._lines(f, offset)) if r)
+            self.manifest["segments"].append(name)
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                head = self._head(f)
+                offset = live["offset"] if live and head == live["head"] else 0
+                consumed = offset
+                for line in self._lines(f, offset):
+                    consumed += len(line)
+                    r = _row(line.decode("utf-8"), self.value_field)
+                    if r:
+                        rows.append(r)
+            live = {"head": head, "offset": consumed} if head else None
+        self.manifest["live"] = live
+        stale = self._append_rows(rows)
+        self._write_manifest()
+        for name in stale:
+            os.remove(os.path.join(self.store_dir, name))
+        return len(rows)
+
+    def _append_rows(self, rows: List[Tuple[int, str, str, str, float]]) -> List[str]:
+        """Write rows as chunks; returns replaced chunk files to delete once the manifest is saved."""
+        if not rows:
+            return []
+        stale = []
+        chunks = self.manifest["chunks"]
+        if chunks and chunks[-1]["rows"] < CHUNK_ROWS // 4:
+            # top up a small trailing chunk instead of piling up tiny ones
+            last = chunks.pop()
+            cols = self._load(last["file"])
+            rows = [
+                (int(ts), cols["type_values"][t], cols["user_values"][u], cols["persona_values"][p], float(v))
+                for ts, t, u, p, v in zip(cols["ts"], cols["type"], cols["user"], cols["persona"], cols["value"])
+            ] + rows
+            self._chunks.pop(last["file"], None)
+            stale.append(last["file"])
+        for start in range(0, len(rows), CHUNK_ROWS):
+            self._write_chunk(rows[start:start + CHUNK_ROWS])
+        return stale
+
+    def _write_chunk(self, rows: List[Tuple[int, str, str, str, float]]):
+        ts, types, users, personas, values = zip(*rows)
+        arrays: Dict[str, Any] = {"ts": np.array(ts, dtype=np.int64), "value": np.array(values, dtype=np.float64)}
+        for name, column in zip(DICT_COLUMNS, (types, users, personas)):
+            uniques, codes = np.unique(np.array(column, dtype=str), return_inverse=True)
+            arrays[name] = codes.astype(np.int32)
+            arrays[name + "_values"] = uniques
+        order = np.argsort(arrays["ts"], kind="stable")
+        for key in ("ts", "value") + DICT_COLUMNS:
+            arrays[key] = arrays[key][order]
+        name = f"chunk-{self.manifest['next_chunk']:06d}.npz"
+        self.manifest["next_chunk"] += 1
+        path = os.path.join(self.store_dir, name)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+        self.manifest["chunks"].append({
+            "file": name, "rows": len(rows),
+            "min_ts": int(arrays["ts"][0]), "max_ts": int(arrays["ts"][-1]),
+        })
+
+    # -- queries -------------------------------------------------------
+
+    def _load(self, name: str) -> Dict[str, Any]:
+        cols = self._chunks.get(name)
+        if cols is None:
+            with np.load(os.path.join(self.store_dir, name), allow_pickle=False) as z:
+                cols = {k: z[k] for k in z.files}
+            self._chunks[name] = cols
+        return cols
+
+    def _scan(self, start: TimeArg = None, end: TimeArg = None, **filters) -> Iterator[Tuple[Dict[str, Any], Any]]:
+        """(chunk columns, row mask) for chunks overlapping [start, end) with filters applied."""
+        lo, hi = _to_us(start), _to_us(end)
+        for meta in self.manifest["chunks"]:
+            if (lo is not None and meta["max_ts"] < lo) or (hi is not None and meta["min_ts"] >= hi):
+                continue
+            cols = self._load(meta["file"])
+            ts = cols["ts"]
+            # rows are sorted by time: the range is a slice
+            a = 0 if lo is None else int(np.searchsorted(ts, lo, "left"))
+            b = len(ts) if hi is None else int(np.searchsorted(ts, hi, "left"))
+            mask = np.zeros(len(ts), dtype=bool)
+            mask[a:b] = True
+            for column, wanted in filters.items():
+                if wanted is None:
+                    continue
+                wanted = [wanted] if isinstance(wanted, str) else list(wanted)
+                codes = np.flatnonzero(np.isin(cols[column + "_values"], wanted))
+                mask &= np.isin(cols[column], codes)
+            if mask.any():
+                yield cols, mask
+
+    def count(self, event_type=None, start: TimeArg = None, end: TimeArg = None, user=None, persona=None) -> int:
+        return sum(int(mask.sum()) for _, mask in self._scan(start, end, type=event_type, user=user, persona=persona))
+
+    def timeseries(
+        self,
+        bucket: Union[str, float] = "1h",
+        agg: str = "count",
+        event_type=None,
+        start: TimeArg = None,
+        end: TimeArg = None,
+        user=None,
+        persona=None,
+    ) -> List[Tuple[str, float]]:
+        """[(bucket start ISO, count | sum | mean of value)] for non-empty buckets, oldest first."""
+        width = _bucket_us(bucket)
+        counts: Dict[int, float] = {}
+        sums: Dict[int, float] = {}
+        for cols, mask in self._scan(start, end, type=event_type, user=user, persona=persona):
+            ts, values = cols["ts"][mask], cols["value"][mask]
+            if agg != "count":
+                valid = ~np.isnan(values)
+                ts, values = ts[valid], values[valid]
+            if not len(ts):
+                continue
+            idx = ts // width
+            base = int(idx.min())
+            n = np.bincount(idx - base)
+            s = np.bincount(idx - base, weights=values) if agg != "count" else n
+            for i in np.flatnonzero(n):
+                key = base + int(i)
+                counts[key] = counts.get(key, 0) + int(n[i])
+                sums[key] = sums.get(key, 0.0) + float(s[i])
+        out = []
+        for key in sorted(counts):
+            value = counts[key] if agg == "count" else sums[key] if agg == "sum" else sums[key] / counts[key]
+            out.append((datetime.fromtimestamp(key * width / 1_000_000).isoformat(), value))
+        return out
+
+    def breakdown(
+        self,
+        by: str = "persona",
+        agg: str = "count",
+        event_type=None,
+        start: TimeArg = None,
+        end: TimeArg = None,
+        user=None,
+        persona=None,
+        top: Optional[int] = None,
+    ) -> Dict[str, float]:
+        """{type | user | persona value: count | sum | mean}, largest first."""
+        if by not in DICT_COLUMNS:
+            raise ValueError(f"Unknown breakdown column: {by}")
+        counts: Dict[str, float] = {}
+        sums: Dict[str, float] = {}
+        for cols, mask in self._scan(start, end, type=event_type, user=user, persona=persona):
+            codes, values = cols[by][mask], cols["value"][mask]
+            if agg != "count":
+                valid = ~np.isnan(values)
+                codes, values = codes[valid], values[valid]
+            size = len(cols[by + "_values"])
+            n = np.bincount(codes, minlength=size)
+            s = np.bincount(codes, weights=values, minlength=size) if agg != "count" else n
+            for i in np.flatnonzero(n):
+                key = str(cols[by + "_values"][i])
+                counts[key] = counts.get(key, 0) + int(n[i])
+                sums[key] = sums.get(key, 0.0) + float(s[i])
+        result = {
+            k: counts[k] if agg == "count" else sums[k] if agg == "sum" else sums[k] / counts[k]
+            for k in counts
+        }
+        ranked = sorted(result.items(), key=lambda kv: -kv[1])
+        return dict(ranked[:top] if top else ranked)
+
+
+if __name__ == "__main__":
+    # python -m src.empowering_agents.integrations.analytics_store ingest
+    # python -m src.empowering_agents.integrations.analytics_store report [bucket]
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "report"
+    store = EventStore()
+    if cmd == "ingest":
+        print(f"ingested {store.ingest()} events into {store.store_dir}")
+    else:
+        store.ingest()
+        print("events:", store.count())
+        print("by type:", store.breakdown("type"))
+        print("by persona:", store.breakdown("persona"))
+        for when, n in store.timeseries(sys.argv[2] if len(sys.argv) > 2 else "1d")[-14:]:
+            print(f"  {when}  {n}")
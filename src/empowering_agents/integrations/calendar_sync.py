@@ -0,0 +1,385 @@
+import os
+import time
+import threading
+import heapq
+from bisect import bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import google_calendar as gcal
+
+Interval = Tuple[datetime, datetime]
+
+
+class SyncTokenExpired(Exception):
+    """The source no longer accepts the sync token (HTTP 410); a full sync is needed."""
+
+
+def _parse_time(value: Dict[str, Any], tz: Optional[str] = None) -> Optional[datetime]:
+    """
+    An event start/end ({"dateTime"} or all-day {"date"}) as an aware UTC
+    datetime. All-day dates are midnight in the event's or calendar's time
+    zone (tz, else GOOGLE_CALENDAR_TIMEZONE), not UTC midnight.
+    """
+    if not value:
+        return None
+    if value.get("dateTime"):
+        dt = datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.astimezone(timezone.utc)
+    if value.get("date"):
+        from zoneinfo import ZoneInfo
+        zone = ZoneInfo(value.get("timeZone") or tz or os.getenv("GOOGLE_CALENDAR_TIMEZONE", "UTC"))
+        return datetime.fromisoformat(value["date"]).replace(tzinfo=zone).astimezone(timezone.utc)
+    return None
+
+
+def _is_busy(event: Dict[str, Any]) -> bool:
+    return event.get("status") != "cancelled" and event.get("transparency") != "transparent"
+
+
+def sync_window_start(now: Optional[datetime] = None) -> datetime:
+    """Events ending before this are neither fetched nor kept: a day back, so events in progress are known."""
+    return (now or datetime.now(timezone.utc)) - timedelta(days=1)
+
+
+class GoogleEventSource:
+    """
+    Pages of events().list for one calendar, with sync tokens.
+
+    All sources share the single OAuth token of google_calendar
+    (GOOGLE_TOKEN_PATH), so they can only read calendars that account can
+    see: calendar_id defaults to GOOGLE_CALENDAR_ID, else that account's
+    "primary" calendar.
+    """
+    def __init__(self, calendar_id: Optional[str] = None):
+        self.calendar_id = calendar_id or os.getenv("GOOGLE_CALENDAR_ID", "primary")
+
+    def list_events(self, sync_token: Optional[str] = None, page_token: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        service = gcal._get_service()
+        if not service:
+            return None
+        params: Dict[str, Any] = {"calendarId": self.calendar_id, "singleEvents": True, "maxResults": 250}
+        if page_token:
+            params["pageToken"] = page_token
+        if sync_token:
+            params["syncToken"] = sync_token
+        else:
+            # full sync: start a day back so events in progress are known
+            params["timeMin"] = sync_window_start().isoformat()
+        try:
+            return service.events().list(**params).execute(http=gcal._http())
+        except Exception as e:
+            if getattr(getattr(e, "resp", None), "status", None) == 410:
+                raise SyncTokenExpired() from e
+            raise
+
+
+class FakeCalendar:
+    """
+    In-memory stand-in for the Calendar events API: versioned changes,
+    paging, sync tokens and 410 on expired tokens. For tests and demos.
+    """
+    def __init__(self, page_size: int = 100, timezone_name: Optional[str] = None):
+        self.page_size = page_size
+        self.timezone_name = timezone_name
+        self.version = 0
+        self.events: Dict[str, Tuple[int, Dict[str, Any]]] = {}  # id -> (version, event)
+        self.min_token = 0
+        self.calls = 0
+
+    def put(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self.version += 1
+        event = {**event, "id": event.get("id") or f"fake{self.version}", "status": event.get("status", "confirmed")}
+        self.events[event["id"]] = (self.version, event)
+        return event
+
+    def delete(self, event_id: str):
+        self.put({**self.events[event_id][1], "status": "cancelled"})
+
+    def expire_tokens(self):
+        self.min_token = self.version + 1
+
+    def list_events(self, sync_token: Optional[str] = None, page_token: Optional[str] = None) -> Dict[str, Any]:
+        self.calls += 1
+        since = int(sync_token) if sync_token else 0
+        if sync_token and since < self.min_token:
+            raise SyncTokenExpired()
+        # a full sync omits deleted events; incremental syncs report them as cancelled
+        changed = sorted(
+            ((v, e) for v, e in self.events.values() if v > since and (sync_token or e["status"] != "cancelled")),
+            key=lambda ve: ve[0],
+        )
+        offset = int(page_token or 0)
+        page = changed[offset:offset + self.page_size]
+        result: Dict[str, Any] = {"items": [e for _, e in page]}
+        if self.timezone_name:
+            result["timeZone"] = self.timezone_name
+        if offset + self.page_size < len(changed):
+            result["nextPageToken"] = str(offset + self.page_size)
+        else:
+            result["nextSyncToken"] = str(self.version)
+        return result
+
+
+class CalendarCache:
+    """
+    One user's events, kept in sync incrementally. Busy time is held as
+    disjoint intervals sorted by start (merged lazily after changes), so a
+    free-slot query is a binary search plus a walk over the gaps it needs.
+    timezone is the calendar's (from the API), used for all-day events.
+    CalendarSync never changes a cache it has handed out: it applies
+    changes to a copy() and swaps it in. copy() is copy-on-write, so a
+    sync without changes costs nothing, and prune() drops events that
+    ended before the sync window so the cache does not grow with history.
+    """
+    def __init__(self, timezone_name: Optional[str] = None):
+        self.timezone = timezone_name
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.sync_token: Optional[str] = None
+        self.synced_at = 0.0
+        self._intervals: List[Tuple[datetime, datetime, str]] = []  # (start, end, id), sorted
+        self._starts: Dict[str, datetime] = {}  # id -> start of its interval in _intervals
+        self._busy: Optional[List[Interval]] = None
+        self._busy_ends: List[datetime] = []
+        self._ends: Dict[str, datetime] = {}  # id -> end, for every event with one
+        self._expiry: List[Tuple[datetime, str]] = []  # heap of (end, id); stale entries skipped
+        self._shared = False  # containers shared with a copy(): copy before mutating
+
+    def clear(self):
+        self.events = {}
+        self._intervals = []
+        self._starts = {}
+        self._ends = {}
+        self._expiry = []
+        self._shared = False
+        self._busy = None
+
+    def copy(self) -> "CalendarCache":
+        clone = CalendarCache(self.timezone)
+        clone.sync_token = self.sync_token
+        clone.synced_at = self.synced_at
+        clone.events, clone._intervals, clone._starts = self.events, self._intervals, self._starts
+        clone._ends, clone._expiry = self._ends, self._expiry
+        clone._busy, clone._busy_ends = self._busy, self._busy_ends  # never mutated, only replaced
+        self._shared = clone._shared = True
+        return clone
+
+    def _own(self):
+        if self._shared:
+            self.events = dict(self.events)
+            self._intervals = list(self._intervals)
+            self._starts = dict(self._starts)
+            self._ends = dict(self._ends)
+            self._expiry = list(self._expiry)
+            self._shared = False
+
+    def apply(self, items: List[Dict[str, Any]]):
+        if items:
+            self._own()
+        for event in items:
+            event_id = event.get("id")
+            if not event_id:
+                continue
+            if self.events.pop(event_id, None) is not None:
+                self._ends.pop(event_id, None)
+                self._remove_interval(event_id)
+            if event.get("status") == "cancelled":
+                continue
+            self.events[event_id] = event
+            start = _parse_time(event.get("start"), self.timezone)
+            end = _parse_time(event.get("end"), self.timezone)
+            if end:
+                self._ends[event_id] = end
+                heapq.heappush(self._expiry, (end, event_id))
+            if start and end and end > start and _is_busy(event):
+                insort(self._intervals, (start, end, event_id))
+                self._starts[event_id] = start
+            self._busy = None
+
+    def prune(self, before: datetime) -> int:
+        """Drops events that ended at or before `before`; returns how many."""
+        if not self._expiry or self._expiry[0][0] > before:
+            return 0
+        self._own()
+        dropped = 0
+        while self._expiry and self._expiry[0][0] <= before:
+            end, event_id = heapq.heappop(self._expiry)
+            if self._ends.get(event_id) != end:
+                continue  # event since moved or deleted
+            del self._ends[event_id]
+            del self.events[event_id]
+            self._remove_interval(event_id)
+            dropped += 1
+        return dropped
+
+    def _remove_interval(self, event_id: str):
+        start = self._starts.pop(event_id, None)
+        if start is None:
+            return
+        for j in range(bisect_right(self._intervals, (start,)), len(self._intervals)):
+            if self._intervals[j][2] == event_id:
+                del self._intervals[j]
+                break
+            if self._intervals[j][0] != start:
+                break
+        self._busy = None
+
+    def busy(self) -> List[Interval]:
+        """Merged, non-overlapping busy intervals sorted by start."""
+        if self._busy is None:
+            merged: List[Interval] = []
+            for start, end, _ in self._intervals:
+                if merged and start <= merged[-1][1]:
+                    if end > merged[-1][1]:
+                        merged[-1] = (merged[-1][0], end)
+                else:
+                    merged.append((start, end))
+            self._busy_ends = [end for _, end in merged]
+            self._busy = merged  # last: _busy set means _busy_ends matches it
+        return self._busy
+
+    def upcoming(self, max_results: int = 5, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        now = now or datetime.now(timezone.utc)
+        # an interval still running at now lies in a busy block ending after
+        # now, so none starts before that block: skip the past by bisection
+        busy = self.busy()
+        i = bisect_right(self._busy_ends, now)
+        if i == len(busy):
+            return []
+        out = []
+        for j in range(bisect_right(self._intervals, (busy[i][0],)), len(self._intervals)):
+            start, end, event_id = self._intervals[j]
+            if end > now:
+                e = self.events[event_id]
+                out.append({"id": event_id, "summary": e.get("summary"), "start": start.isoformat(),
+                            "end": end.isoformat(), "htmlLink": e.get("htmlLink")})
+                if len(out) >= max_results:
+                    break
+        return out
+
+    def free_slots(self, minutes: int, earliest: Optional[datetime] = None, **kwargs) -> List[Interval]:
+        busy = self.busy()
+        return find_free_slots(busy, minutes, earliest, busy_ends=self._busy_ends, **kwargs)
+
+
+def find_free_slots(
+    busy: List[Interval],
+    minutes: int,
+    earliest: Optional[datetime] = None,
+    horizon_days: int = 7,
+    day_start: Optional[int] = None,
+    day_end: Optional[int] = None,
+    tz: Optional[str] = None,
+    limit: int = 3,
+    busy_ends: Optional[List[datetime]] = None,
+) -> List[Interval]:
+    """
+    The first `limit` gaps of at least `minutes` between merged busy
+    intervals, clipped to working hours [day_start, day_end) in tz
+    (CALENDAR_DAY_START/CALENDAR_DAY_END in GOOGLE_CALENDAR_TIMEZONE by
+    default), one block per gap, earliest first.
+    """
+    from zoneinfo import ZoneInfo
+    day_start = day_start if day_start is not None else int(os.getenv("CALENDAR_DAY_START", "9"))
+    day_end = day_end if day_end is not None else int(os.getenv("CALENDAR_DAY_END", "18"))
+    zone = ZoneInfo(tz or os.getenv("GOOGLE_CALENDAR_TIMEZONE", "UTC"))
+    duration = timedelta(minutes=minutes)
+    cursor = (earliest or datetime.now(timezone.utc)).astimezone(zone)
+    horizon = cursor + timedelta(days=horizon_days)
+    ends = busy_ends if busy_ends is not None else [end for _, end in busy]
+    i = bisect_right(ends, cursor)  # first busy interval still running at cursor
+    slots: List[Interval] = []
+    while cursor < horizon and len(slots) < limit:
+        # clip the cursor to this day's working hours
+        day_open = cursor.replace(hour=day_start, minute=0, second=0, microsecond=0)
+        day_close = cursor.replace(hour=day_end, minute=0, second=0, microsecond=0)
+        if cursor < day_open:
+            cursor = day_open
+        if cursor + duration > day_close:
+            cursor = day_open + timedelta(days=1)
+            continue
+        while i < len(busy) and busy[i][1] <= cursor:
+            i += 1
+        if i < len(busy) and busy[i][0] < cursor + duration:
+            cursor = busy[i][1].astimezone(zone)  # overlaps: jump past it
+            continue
+        slots.append((cursor.astimezone(timezone.utc), (cursor + duration).astimezone(timezone.utc)))
+        # next candidate starts after the following busy interval
+        cursor = busy[i][1].astimezone(zone) if i < len(busy) else day_open + timedelta(days=1)
+    return slots
+
+
+class CalendarSync:
+    """
+    Per-user event caches kept current with sync tokens: the first sync
+    lists everything, later ones fetch only changes, and an expired token
+    (410) falls back to a full sync. Syncs closer together than
+    CALENDAR_SYNC_INTERVAL seconds reuse the cache. Thread-safe; calls
+    block, so async callers use asyncio.to_thread. Each sync builds a new
+    cache and swaps it in, so a cache returned earlier can still be read
+    (e.g. on the event loop) while a sync runs.
+
+    The default source_factory gives every user the one calendar of the
+    shared Google token (see GoogleEventSource); pass a factory returning
+    per-user sources for per-user calendars.
+    """
+    def __init__(self, source_factory: Optional[Callable[[str], Any]] = None, min_interval: Optional[float] = None):
+        self.source_factory = source_factory or (lambda user_id: GoogleEventSource())
+        self.min_interval = min_interval if min_interval is not None else float(os.getenv("CALENDAR_SYNC_INTERVAL", "30"))
+        self.caches: Dict[str, CalendarCache] = {}
+        self._sources: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._user_locks: Dict[str, threading.Lock] = {}
+
+    def sync(self, user_id: str, force: bool = False, now: Optional[datetime] = None) -> Optional[CalendarCache]:
+        """
+        The user's cache after an (incremental) sync; None when the calendar
+        is not configured. Events that ended before sync_window_start(now)
+        are dropped from it.
+        """
+        with self._lock:
+            lock = self._user_locks.setdefault(user_id, threading.Lock())
+        with lock:
+            current = self.caches.get(user_id)
+            if current and not force and time.monotonic() - current.synced_at < self.min_interval:
+                return current
+            source = self._sources.get(user_id)
+            if source is None:
+                source = self._sources[user_id] = self.source_factory(user_id)
+            cache = current.copy() if current else CalendarCache()
+            try:
+                if not self._pull(source, cache, cache.sync_token):
+                    return None
+            except SyncTokenExpired:
+                cache = CalendarCache(cache.timezone)
+                if not self._pull(source, cache, None):
+                    return None
+            cache.prune(sync_window_start(now))
+            cache.synced_at = time.monotonic()
+            self.caches[user_id] = cache  # one-step swap; readers keep their snapshot
+            return cache
+
+    @staticmethod
+    def _pull(source, cache: CalendarCache, sync_token: Optional[str]) -> bool:
+        page_token = None
+        while True:
+            page = source.list_events(sync_token=sync_token, page_token=page_token)
+            if page is None:
+                return False
+            cache.timezone = page.get("timeZone") or cache.timezone
+            cache.apply(page.get("items", []))
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                cache.sync_token = page.get("nextSyncToken", cache.sync_token)
+                return True
+
+
+_SYNC = None
+
+def get_calendar_sync() -> CalendarSync:
+    global _SYNC
+    if _SYNC is None:
+        _SYNC = CalendarSync()
+    return _SYNC
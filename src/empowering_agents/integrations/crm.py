@@ -1,13 +1,208 @@
-# Minimal CRM stub: write contacts to a local JSON store
-import json, os
-CRM_FILE = "./crm.json"
+# CRM store: contacts in SQLite, one row per (email, field)
+import json, os, sys, time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from ..utils.sqlite_utils import ThreadLocalConnections
+
+CRM_FILE = "./crm.json"  # legacy store, imported on first use
+DEFAULT_DB_PATH = "./crm.db"
+
+# value NULL is a tombstone: the field (or, for every field, the contact)
+# was removed at updated_at, so incremental exports can report it.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contact_fields (
+    email TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (email, field)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_contact_fields_updated ON contact_fields (updated_at)
+"""
+
+# databases created before tombstones had value NOT NULL; SQLite cannot drop a constraint in place
+_MIGRATE_NULLABLE_VALUE = (
+    "CREATE TABLE contact_fields_v2 (email TEXT NOT NULL, field TEXT NOT NULL, value TEXT, "
+    "updated_at REAL NOT NULL, PRIMARY KEY (email, field)) WITHOUT ROWID",
+    "INSERT INTO contact_fields_v2 SELECT email, field, value, updated_at FROM contact_fields",
+    "DROP TABLE contact_fields",
+    "ALTER TABLE contact_fields_v2 RENAME TO contact_fields",
+)
+
+_SQL_UPSERT_FIELD = (
+    "INSERT INTO contact_fields (email, field, value, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (email, field) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at "
+    "WHERE value IS NOT excluded.value"
+)
+_SQL_DELETE_FIELD = (
+    "UPDATE contact_fields SET value = NULL, updated_at = ? WHERE email = ? AND field = ? AND value IS NOT NULL"
+)
+_SQL_DELETE_CONTACT = "UPDATE contact_fields SET value = NULL, updated_at = ? WHERE email = ? AND value IS NOT NULL"
+_SQL_SELECT_CONTACT = "SELECT field, value FROM contact_fields WHERE email = ? AND value IS NOT NULL"
+_SQL_SELECT_ALL = "SELECT email, field, value FROM contact_fields WHERE value IS NOT NULL ORDER BY email, field"
+_SQL_SELECT_SINCE = (
+    "SELECT email, field, value FROM contact_fields WHERE email IN "
+    "(SELECT DISTINCT email FROM contact_fields WHERE updated_at >= ?) ORDER BY email, field"
+)
+_SQL_COUNT = "SELECT COUNT(DISTINCT email) FROM contact_fields WHERE value IS NOT NULL"
+
+Contacts = Union[Dict[str, Dict[str, Any]], Iterable[Tuple[str, Dict[str, Any]]]]
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+class CRMStore:
+    """
+    Contacts keyed by email in SQLite (WAL), one row per field, so an update
+    writes only the fields it names and lookups use the primary key.
+    A field set to None is removed, and delete() removes every field; both
+    leave tombstones so export(updated_since) reports the removals.
+    bulk_upsert() applies thousands of contacts in one transaction;
+    export() streams contacts in email order. Safe to share between
+    threads and processes (see sqlite_utils).
+
+    Emails are normalized (trimmed, lower-cased) on every call. An empty
+    store imports legacy_json (get_crm_store() passes the old crm.json);
+    legacy keys that differ only in case merge into one contact, later
+    keys winning field by field.
+    """
+    def __init__(self, db_path: Optional[str] = None, legacy_json: Optional[str] = None):
+        self.db_path = db_path or os.getenv("CRM_DB_PATH", DEFAULT_DB_PATH)
+        self._conns = ThreadLocalConnections(self.db_path)
+        with self._conns.transaction() as conn:
+            for stmt in _SCHEMA.split(";"):
+                if stmt.strip():
+                    conn.execute(stmt)
+            notnull = {row[1]: row[3] for row in conn.execute("PRAGMA table_info(contact_fields)")}
+            if notnull.get("value"):  # databases created before tombstones
+                for stmt in _MIGRATE_NULLABLE_VALUE:
+                    conn.execute(stmt)
+                for stmt in _SCHEMA.split(";"):
+                    if stmt.strip():
+                        conn.execute(stmt)
+        if legacy_json and os.path.exists(legacy_json) and self.count() == 0:
+            self.import_json(legacy_json)
+
+    @staticmethod
+    def _rows(contacts: Contacts, now: float) -> Tuple[list, list]:
+        upserts, deletes = [], []
+        items = contacts.items() if isinstance(contacts, dict) else contacts
+        for email, fields in items:
+            email = normalize_email(email)
+            for field, value in fields.items():
+                if value is None:
+                    deletes.append((now, email, field))
+                else:
+                    upserts.append((email, field, json.dumps(value, separators=(",", ":")), now))
+        return upserts, deletes
+
+    def upsert(self, email: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Set (or, with None, remove) the given fields; other fields are untouched."""
+        self.bulk_upsert([(email, fields)])
+        return self.get(email) or {}
+
+    def bulk_upsert(self, contacts: Contacts) -> int:
+        """Upsert many contacts in one transaction; returns the number of contacts."""
+        contacts = list(contacts.items()) if isinstance(contacts, dict) else list(contacts)
+        upserts, deletes = self._rows(contacts, time.time())
+        with self._conns.transaction() as conn:
+            if upserts:
+                conn.executemany(_SQL_UPSERT_FIELD, upserts)
+            if deletes:
+                conn.executemany(_SQL_DELETE_FIELD, deletes)
+        return len(contacts)
+
+    def get(self, email: str) -> Optional[Dict[str, Any]]:
+        rows = self._conns.get().execute(_SQL_SELECT_CONTACT, (normalize_email(email),)).fetchall()
+        return {field: json.loads(value) for field, value in rows} if rows else None
+
+    def delete(self, email: str):
+        """Remove the contact; export(updated_since) reports it with every field None."""
+        with self._conns.transaction() as conn:
+            conn.execute(_SQL_DELETE_CONTACT, (time.time(), normalize_email(email)))
+
+    def count(self) -> int:
+        return self._conns.get().execute(_SQL_COUNT).fetchone()[0]
+
+    def export(self, updated_since: Optional[float] = None, batch_size: int = 1000) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        (email, fields) for every contact in email order. With updated_since
+        (a time.time() value) only contacts changed since then, with removed
+        fields as None, so applying the result with bulk_upsert() replays
+        the changes, deletions included; a deleted contact has only None.
+        """
+        conn = self._conns.get()
+        cursor = conn.execute(_SQL_SELECT_ALL) if updated_since is None else conn.execute(_SQL_SELECT_SINCE, (updated_since,))
+        email, fields = None, {}
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row_email, field, value in rows:
+                if row_email != email:
+                    if email is not None:
+                        yield email, fields
+                    email, fields = row_email, {}
+                fields[field] = None if value is None else json.loads(value)
+        if email is not None:
+            yield email, fields
+
+    def export_jsonl(self, path: str) -> int:
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for email, fields in self.export():
+                f.write(json.dumps({"email": email, **fields}) + "\n")
+                count += 1
+        return count
+
+    def import_json(self, path: str, batch_size: int = 5000) -> int:
+        """Import {email: fields} from a JSON file, or {"email", ...} lines from a .jsonl file."""
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                records = (json.loads(line) for line in f if line.strip())
+                contacts: Iterable = ((r.pop("email"), r) for r in records)
+            else:
+                contacts = json.load(f).items()
+            count, batch = 0, []
+            for item in contacts:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    count += self.bulk_upsert(batch)
+                    batch = []
+            if batch:
+                count += self.bulk_upsert(batch)
+        return count
+
+    def close(self):
+        self._conns.close()
+
+
+_STORE: Optional[CRMStore] = None
+
+def get_crm_store() -> CRMStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = CRMStore(legacy_json=CRM_FILE)
+    return _STORE
 
 def upsert_contact(email: str, fields: dict):
-    data = {}
-    if os.path.exists(CRM_FILE):
-        with open(CRM_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    data[email] = {**data.get(email, {}), **fields}
-    with open(CRM_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    get_crm_store().upsert(email, fields)
     return {"ok": True}
+
+def bulk_upsert_contacts(contacts: Contacts):
+    return {"ok": True, "count": get_crm_store().bulk_upsert(contacts)}
+
+
+if __name__ == "__main__":
+    # python -m src.empowering_agents.integrations.crm import contacts.json|contacts.jsonl
+    # python -m src.empowering_agents.integrations.crm export out.jsonl
+    if len(sys.argv) != 3 or sys.argv[1] not in ("import", "export"):
+        print("usage: crm.py import <file.json|file.jsonl> | export <file.jsonl>")
+        sys.exit(1)
+    store = get_crm_store()
+    if sys.argv[1] == "import":
+        print(f"Imported {store.import_json(sys.argv[2])} contacts into {store.db_path}")
+    else:
+        print(f"Exported {store.export_jsonl(sys.argv[2])} contacts to {sys.argv[2]}")
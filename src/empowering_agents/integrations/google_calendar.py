@@ -1,69 +1,184 @@
 import os
+import threading
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional
-
-# Google API
-try:
-    from googleapiclient.discovery import build
-    from google_auth_oauthlib.flow import InstalledAppFlow
-    from google.auth.transport.requests import Request
-    from google.oauth2.credentials import Credentials
-except Exception:  # libs not installed or environment without Google packages
-    build = None
-    InstalledAppFlow = None
-    Request = None
-    Credentials = None
+from typing import Dict, Any, List, Optional, Tuple
+
+# Google API client stack; imported on first use (see _load_google_libs)
+# since importing it takes longer than the rest of the package together
+build = None
+InstalledAppFlow = None
+Request = None
+Credentials = None
+AuthorizedHttp = None
+httplib2 = None
+_GOOGLE_LIBS_LOADED = False
+
+def _load_google_libs() -> bool:
+    global build, InstalledAppFlow, Request, Credentials, AuthorizedHttp, httplib2, _GOOGLE_LIBS_LOADED
+    if not _GOOGLE_LIBS_LOADED:
+        _GOOGLE_LIBS_LOADED = True
+        try:
+            import httplib2
+            from googleapiclient.discovery import build
+            from google_auth_httplib2 import AuthorizedHttp
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            from google.auth.transport.requests import Request
+            from google.oauth2.credentials import Credentials
+        except Exception:  # libs not installed or environment without Google packages
+            pass
+    return build is not None
 
 SCOPES = ["https://www.googleapis.com/auth/calendar.events"]
 
 def _expand_user_path(p: str) -> str:
     return os.path.expanduser(os.path.expandvars(p)) if p else p
 
-def _get_creds() -> Optional["Credentials"]:
-    token_path = _expand_user_path(os.getenv("GOOGLE_TOKEN_PATH", "~/.empowering_agents/google_token.json"))
-    client_secrets = os.getenv("GOOGLE_CLIENT_SECRETS", "./client_secret.json")
-    client_secrets = _expand_user_path(client_secrets)
+# Per-process credentials and service, shared by every call (see _get_service)
+_LOCK = threading.Lock()
+_FLOW_LOCK = threading.Lock()  # at most one interactive OAuth flow; never held with _LOCK
+_CREDS = None
+_SERVICE = None
+_HTTP = threading.local()  # one authorized transport per thread; httplib2 is not thread-safe
+
+# Google allows up to 1000 calls per batch but recommends far fewer
+BATCH_SIZE = 50
+
+NOT_CONFIGURED = {"enabled": False, "reason": "Calendar not configured. Provide GOOGLE_CLIENT_SECRETS and run OAuth."}
 
-    creds = None
-    if Credentials and os.path.exists(token_path):
+def _refresh_margin() -> timedelta:
+    return timedelta(seconds=float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300")))
+
+def _needs_refresh(creds) -> bool:
+    """True when the token is missing, expired or expires within GOOGLE_TOKEN_REFRESH_MARGIN."""
+    if not creds.token:
+        return True
+    # google-auth keeps expiry as naive UTC
+    expiry = creds.expiry
+    return expiry is not None and expiry - _refresh_margin() <= datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _save_token(creds, token_path: str):
+    os.makedirs(os.path.dirname(token_path), exist_ok=True)
+    with open(token_path, "w", encoding="utf-8") as token:
+        token.write(creds.to_json())
+
+def _token_path() -> str:
+    return _expand_user_path(os.getenv("GOOGLE_TOKEN_PATH", "~/.empowering_agents/google_token.json"))
+
+def _get_creds() -> Optional["Credentials"]:
+    """
+    Cached credentials. The token file is read once per process; tokens are
+    refreshed shortly before they expire (not after a failed call) and the
+    refreshed token is written back. None when there is no usable token:
+    the interactive flow is _run_oauth_flow(), outside the lock. Call with
+    _LOCK held.
+    """
+    global _CREDS
+    token_path = _token_path()
+    creds = _CREDS
+    _load_google_libs()
+    if creds is None and Credentials and os.path.exists(token_path):
         creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    # Refresh or run flow
-    if creds and creds.expired and creds.refresh_token:
-        try:
-            creds.refresh(Request())
-        except Exception:
+    # Refresh ahead of expiry
+    if creds and _needs_refresh(creds):
+        if creds.refresh_token:
+            try:
+                creds.refresh(Request())
+                _save_token(creds, token_path)
+            except Exception:
+                creds = None
+        else:
             creds = None
-    if not creds:
-        # No stored token: run installed-app flow if secrets present
-        if not (InstalledAppFlow and os.path.exists(client_secrets)):
-            return None
-        flow = InstalledAppFlow.from_client_secrets_file(client_secrets, SCOPES)
-        creds = flow.run_local_server(port=0)
-        os.makedirs(os.path.dirname(token_path), exist_ok=True)
-        with open(token_path, "w", encoding="utf-8") as token:
-            token.write(creds.to_json())
+    _CREDS = creds
     return creds
 
-def _get_service():
-    if build is None:
+def _run_oauth_flow() -> Optional["Credentials"]:
+    """
+    Installed-app OAuth flow: opens a browser and waits for consent, so it
+    runs without _LOCK and only when GOOGLE_OAUTH_INTERACTIVE is on (turn
+    it off on servers, where nobody can answer). Callers arriving while a
+    flow runs get None (not configured) instead of queueing behind it.
+    """
+    if os.getenv("GOOGLE_OAUTH_INTERACTIVE", "true").lower() != "true":
         return None
-    creds = _get_creds()
-    if not creds:
+    client_secrets = _expand_user_path(os.getenv("GOOGLE_CLIENT_SECRETS", "./client_secret.json"))
+    if not (InstalledAppFlow and os.path.exists(client_secrets)):
+        return None
+    if not _FLOW_LOCK.acquire(blocking=False):
         return None
     try:
-        service = build("calendar", "v3", credentials=creds, cache_discovery=False)
-        return service
-    except Exception:
+        flow = InstalledAppFlow.from_client_secrets_file(client_secrets, SCOPES)
+        creds = flow.run_local_server(port=0)
+        _save_token(creds, _token_path())
+        return creds
+    finally:
+        _FLOW_LOCK.release()
+
+def _get_service():
+    """
+    The Calendar service, built once per process. Credentials are checked
+    (and refreshed if close to expiry) on every call, under a lock so
+    concurrent tool calls refresh at most once.
+    """
+    global _CREDS, _SERVICE
+    if not _load_google_libs():
         return None
+    with _LOCK:
+        previous = _CREDS
+        creds = _get_creds()
+        if not creds:
+            _SERVICE = None
+    if not creds:
+        creds = _run_oauth_flow()  # interactive: never under _LOCK
+        if not creds:
+            return None
+    with _LOCK:
+        _CREDS = creds
+        if _SERVICE is None or creds is not previous:
+            try:
+                _SERVICE = build("calendar", "v3", credentials=creds, cache_discovery=False)
+            except Exception:
+                return None
+        return _SERVICE
+
+def _http():
+    """This thread's authorized transport for the cached credentials."""
+    creds = _CREDS
+    if getattr(_HTTP, "creds", None) is not creds:
+        _HTTP.creds = creds
+        _HTTP.http = AuthorizedHttp(creds, http=httplib2.Http())
+    return _HTTP.http
+
+def reset_cache():
+    """Forget cached credentials and service (e.g. after changing GOOGLE_TOKEN_PATH)."""
+    global _CREDS, _SERVICE
+    with _LOCK:
+        _CREDS = None
+        _SERVICE = None
+
+def _event_body(summary: str, start_iso: str, end_iso: str, tz: str) -> Dict[str, Any]:
+    return {
+        "summary": summary,
+        "start": {"dateTime": start_iso, "timeZone": tz},
+        "end": {"dateTime": end_iso, "timeZone": tz},
+    }
+
+def _event_summary(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": event.get("id"),
+        "summary": event.get("summary"),
+        "htmlLink": event.get("htmlLink"),
+        "start": event.get("start"),
+        "end": event.get("end"),
+    }
 
 def list_upcoming_events(max_results: int = 5) -> Dict[str, Any]:
     service = _get_service()
     if not service:
-        return {"enabled": False, "reason": "Calendar not configured. Provide GOOGLE_CLIENT_SECRETS and run OAuth."}
+        return NOT_CONFIGURED
     now = datetime.now().isoformat() + "Z"
     events_result = service.events().list(
         calendarId="primary", timeMin=now, maxResults=max_results, singleEvents=True, orderBy="startTime"
-    ).execute()
+    ).execute(http=_http())
     events = events_result.get("items", [])
     # Return a compact summary
     def _fmt(e):
@@ -81,36 +196,80 @@ def list_upcoming_events(max_results: int = 5) -> Dict[str, Any]:
 def create_event(summary: str, start_iso: str, end_iso: str, timezone_str: Optional[str] = None) -> Dict[str, Any]:
     service = _get_service()
     if not service:
-        return {"enabled": False, "reason": "Calendar not configured. Provide GOOGLE_CLIENT_SECRETS and run OAuth."}
+        return NOT_CONFIGURED
     tz = timezone_str or os.getenv("GOOGLE_CALENDAR_TIMEZONE", "UTC")
-    body = {
-        "summary": summary,
-        "start": {"dateTime": start_iso, "timeZone": tz},
-        "end": {"dateTime": end_iso, "timeZone": tz},
-    }
+    body = _event_body(summary, start_iso, end_iso, tz)
     try:
-        event = service.events().insert(calendarId="primary", body=body).execute()
-        return {
-            "enabled": True,
-            "event": {
-                "id": event.get("id"),
-                "summary": event.get("summary"),
-                "htmlLink": event.get("htmlLink"),
-                "start": event.get("start"),
-                "end": event.get("end"),
-            },
-        }
+        event = service.events().insert(calendarId="primary", body=body).execute(http=_http())
+        return {"enabled": True, "event": _event_summary(event)}
     except Exception as e:
         return {"enabled": False, "reason": f"Insert failed: {e}"}
 
-def suggest_block_and_optionally_create(summary: str = "Focus Block", minutes: int = 30, create: bool = False) -> Dict[str, Any]:
+def upsert_events(events: List[Dict[str, Any]], timezone_str: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Create or update many events with HTTP batch requests (BATCH_SIZE calls
+    per round trip). Each event is {"summary", "start", "end"} (ISO times)
+    plus an optional "id": events with an id are updated, the rest inserted.
+    Results keep the input order; a failed call reports its own "error"
+    without failing the rest.
+    """
+    service = _get_service()
+    if not service:
+        return NOT_CONFIGURED
+    tz = timezone_str or os.getenv("GOOGLE_CALENDAR_TIMEZONE", "UTC")
+    results: List[Dict[str, Any]] = [{} for _ in events]
+
+    def _callback(request_id, response, exception):
+        i = int(request_id)
+        if exception is not None:
+            results[i] = {"error": str(exception)}
+        else:
+            results[i] = {"event": _event_summary(response)}
+
+    try:
+        for offset in range(0, len(events), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=_callback)
+            for i, e in enumerate(events[offset:offset + BATCH_SIZE], start=offset):
+                body = _event_body(e["summary"], e["start"], e["end"], e.get("timeZone", tz))
+                if e.get("id"):
+                    request = service.events().update(calendarId="primary", eventId=e["id"], body=body)
+                else:
+                    request = service.events().insert(calendarId="primary", body=body)
+                batch.add(request, request_id=str(i))
+            batch.execute(http=_http())
+    except Exception as e:
+        return {"enabled": False, "reason": f"Batch failed: {e}", "results": results}
+    return {"enabled": True, "results": results}
+
+def suggest_block_and_optionally_create(
+    summary: str = "Focus Block",
+    minutes: int = 30,
+    create: bool = False,
+    busy: Optional[List[Tuple[datetime, datetime]]] = None,
+) -> Dict[str, Any]:
+    """
+    Suggest a block starting in ~30 minutes. With busy intervals (from
+    calendar_sync.CalendarCache.busy()) the block is the first free slot in
+    working hours instead, and later free slots are listed as alternatives.
+    """
     tz = os.getenv("GOOGLE_CALENDAR_TIMEZONE", "UTC")
     now = datetime.now(timezone.utc)
     start = now + timedelta(minutes=30)  # suggest starting in ~30 minutes
+    alternatives: List[Tuple[datetime, datetime]] = []
+    if busy is not None:
+        from .calendar_sync import find_free_slots
+        slots = find_free_slots(busy, minutes, start)
+        if slots:
+            start, alternatives = slots[0][0], slots[1:]
     end = start + timedelta(minutes=minutes)
     start_iso = start.replace(microsecond=0).isoformat()
     end_iso = end.replace(microsecond=0).isoformat()
     suggestion = {"summary": summary, "start": start_iso, "end": end_iso, "timeZone": tz}
+    if alternatives:
+        suggestion["alternatives"] = [
+            {"start": a.replace(microsecond=0).isoformat(), "end": b.replace(microsecond=0).isoformat()}
+            for a, b in alternatives
+        ]
 
     enabled = os.getenv("GOOGLE_CALENDAR_ENABLED", "false").lower() == "true"
     if create and enabled:
@@ -1,4 +1,237 @@
-# Minimal notifications stub
+# Notifications: an async dispatcher with digests, dedupe, rate limits and retries
+import os, sys, json, time, random, asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
 def send_notification(user_id: str, message: str):
+    """Print right away, blocking the caller; agent code uses NotificationDispatcher.enqueue()."""
     print(f"[notify:{user_id}] {message}")
     return {"ok": True}
+
+
+@dataclass
+class Digest:
+    user_id: str
+    channel: str
+    messages: List[str]
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    attempts: int = 0
+
+
+class Channel:
+    """Delivery adapter. send() gets one digest; raising makes the dispatcher retry."""
+    async def send(self, digest: Digest):
+        raise NotImplementedError
+
+
+class StdoutChannel(Channel):
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    async def send(self, digest: Digest):
+        for message in digest.messages:
+            print(f"[notify:{digest.user_id}] {message}", file=self.stream)
+
+
+class FileChannel(Channel):
+    """Appends each digest as a JSON line; a local stand-in for email/push providers."""
+    def __init__(self, path: str = "./notifications.jsonl"):
+        self.path = path
+
+    def _append(self, line: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    async def send(self, digest: Digest):
+        line = json.dumps({"ts": digest.created_at, "user_id": digest.user_id, "messages": digest.messages}) + "\n"
+        await asyncio.to_thread(self._append, line)
+
+
+class TokenBucket:
+    """rate tokens per second, up to burst; acquire() waits for a token."""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """
+    Queue-backed delivery for agent notifications. enqueue() never waits:
+    messages for one (user, channel) are collected for digest_window seconds
+    and delivered as one digest by worker tasks. An identical message for
+    the same user and channel within dedupe_ttl seconds is dropped. Each
+    channel has a token bucket (rate/s, burst); failed sends are retried
+    max_retries times with exponential backoff and jitter, then kept in
+    `failed`. Workers start on first use in the running event loop.
+    """
+    def __init__(
+        self,
+        channels: Optional[Dict[str, Channel]] = None,
+        default_channel: Optional[str] = None,
+        workers: Optional[int] = None,
+        digest_window: Optional[float] = None,
+        max_queue: int = 1000,
+        dedupe_ttl: Optional[float] = None,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff: float = 0.5,
+    ):
+        self.channels = channels or {
+            "stdout": StdoutChannel(),
+            "file": FileChannel(os.getenv("NOTIFY_FILE_PATH", "./notifications.jsonl")),
+        }
+        self.default_channel = default_channel or os.getenv("NOTIFY_CHANNEL", "stdout")
+        self.workers = workers or int(os.getenv("NOTIFY_WORKERS", "4"))
+        self.digest_window = digest_window if digest_window is not None else float(os.getenv("NOTIFY_DIGEST_WINDOW", "2.0"))
+        self.max_queue = max_queue
+        self.dedupe_ttl = dedupe_ttl if dedupe_ttl is not None else float(os.getenv("NOTIFY_DEDUPE_TTL", "300"))
+        rate = rate or float(os.getenv("NOTIFY_RATE_PER_SEC", "5"))
+        burst = burst or int(os.getenv("NOTIFY_BURST", "10"))
+        self.buckets = {name: TokenBucket(rate, burst) for name in self.channels}
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+        self.backoff = backoff
+        self.failed: List[Tuple[Digest, str]] = []
+        self.stats_counts = {"enqueued": 0, "deduplicated": 0, "dropped": 0, "delivered": 0, "retried": 0, "failed": 0}
+        self._seen: Dict[Tuple[str, str, str], float] = {}
+        self._open: Dict[Tuple[str, str], Tuple[Digest, asyncio.TimerHandle]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # first use, or the previous loop is gone (its workers and timers with it)
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        # digests still open on the old loop can no longer be delivered
+        for digest, timer in self._open.values():
+            timer.cancel()
+            self._drop(digest)
+        self._open.clear()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def enqueue(self, user_id: str, message: str, channel: Optional[str] = None) -> bool:
+        """Queue a message for delivery; False if it was a duplicate or the queue is full."""
+        self._ensure_started()
+        channel = channel or self.default_channel
+        if channel not in self.channels:
+            raise ValueError(f"Unknown notification channel: {channel}")
+        now = time.monotonic()
+        key = (user_id, channel, message)
+        seen = self._seen.get(key)
+        if seen is not None and now - seen < self.dedupe_ttl:
+            self.stats_counts["deduplicated"] += 1
+            return False
+        if len(self._seen) > 10000:
+            self._seen = {k: t for k, t in self._seen.items() if now - t < self.dedupe_ttl}
+        self._seen[key] = now
+        self.stats_counts["enqueued"] += 1
+        open_digest = self._open.get((user_id, channel))
+        if open_digest is not None:
+            open_digest[0].messages.append(message)
+            return True
+        digest = Digest(user_id, channel, [message])
+        if self.digest_window <= 0:
+            return self._submit(digest)
+        timer = self._loop.call_later(self.digest_window, self._close_digest, (user_id, channel))
+        self._open[(user_id, channel)] = (digest, timer)
+        return True
+
+    def _close_digest(self, key: Tuple[str, str]):
+        entry = self._open.pop(key, None)
+        if entry is not None:
+            entry[1].cancel()
+            self._submit(entry[0])
+
+    def _submit(self, digest: Digest) -> bool:
+        try:
+            self._queue.put_nowait(digest)
+            return True
+        except asyncio.QueueFull:
+            self._drop(digest)
+            return False
+
+    def _drop(self, digest: Digest):
+        self.stats_counts["dropped"] += len(digest.messages)
+        # dropped messages were never delivered: let a retry through the dedupe window
+        for message in digest.messages:
+            self._seen.pop((digest.user_id, digest.channel, message), None)
+
+    async def _worker(self):
+        while True:
+            digest = await self._queue.get()
+            try:
+                await self._deliver(digest)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, digest: Digest):
+        channel = self.channels[digest.channel]
+        while True:
+            await self.buckets[digest.channel].acquire()
+            digest.attempts += 1
+            try:
+                await channel.send(digest)
+                self.stats_counts["delivered"] += 1
+                return
+            except Exception as e:
+                if digest.attempts > self.max_retries:
+                    self.failed.append((digest, str(e)))
+                    self.stats_counts["failed"] += 1
+                    return
+                self.stats_counts["retried"] += 1
+                delay = self.backoff * 2 ** (digest.attempts - 1)
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    async def flush(self):
+        """Close open digests now and wait until everything queued is delivered or failed."""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        for key in list(self._open):
+            self._close_digest(key)
+        await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_counts,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "open_digests": len(self._open),
+        }
+
+
+_DISPATCHER: Optional[NotificationDispatcher] = None
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    global _DISPATCHER
+    if _DISPATCHER is None:
+        _DISPATCHER = NotificationDispatcher()
+    return _DISPATCHER
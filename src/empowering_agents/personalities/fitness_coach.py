@@ -1,9 +1,9 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import json
 from ..core.agent import EmpoweringAgent
 
 class FitnessCoach(EmpoweringAgent):
-    def __init__(self, llm_config: Dict[str, Any]):
+    def __init__(self, llm_config: Dict[str, Any], interaction_mode: Optional[str] = None):
         personality_config = {
             "name": "Sam",
             "role": "Fitness Coach",
@@ -16,7 +16,8 @@ class FitnessCoach(EmpoweringAgent):
             agent_id="fitness_coach_v1",
             personality_config=personality_config,
             llm_config=llm_config,
-            tools=tools
+            tools=tools,
+            interaction_mode=interaction_mode
         )
 
     def _get_personality_context(self) -> str:
@@ -39,6 +40,7 @@ class FitnessCoach(EmpoweringAgent):
         return f'''
 {personality_context}
 
+{self._format_recalled(user_memory)}
 User says: "{message}"
 Intent: {json.dumps(intent)}
 
@@ -48,7 +50,7 @@ Available tool info:
 Return JSON:
 {{
   "message": "coaching reply",
-  "actions": [{{"type":"schedule_workout","details":"..."}]}],
+  "actions": [{{"type":"schedule_workout","details":"..."}}],
   "goal_updates": [],
   "personalization_learned": {{}}
 }}
@@ -1,9 +1,9 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import json
 from ..core.agent import EmpoweringAgent, UserGoal
 
 class LearningNavigator(EmpoweringAgent):
-    def __init__(self, llm_config: Dict[str, Any]):
+    def __init__(self, llm_config: Dict[str, Any], interaction_mode: Optional[str] = None):
         personality_config = {
             "name": "Alex",
             "role": "Learning Navigator",
@@ -16,7 +16,8 @@ class LearningNavigator(EmpoweringAgent):
             agent_id="learning_navigator_v1",
             personality_config=personality_config,
             llm_config=llm_config,
-            tools=tools
+            tools=tools,
+            interaction_mode=interaction_mode
         )
 
     def _get_personality_context(self) -> str:
@@ -51,7 +52,7 @@ class LearningNavigator(EmpoweringAgent):
 User style: {mem.get("user_style",{})}
 Common topics: {mem.get("common_topics",[])}
 {goals_ctx}
-
+{self._format_recalled(user_memory)}
 Intent:
 {json.dumps(intent, indent=2)}
 
@@ -0,0 +1,22 @@
+from typing import Optional
+
+_LOADED = False
+
+
+def load_env(path: Optional[str] = None):
+    """
+    Load .env into os.environ once per process (existing variables win).
+
+    Called where configuration is first needed (agent and LLM client
+    construction, analytics) rather than as an import side effect, so
+    importing the package stays cheap. python-dotenv is optional.
+    """
+    global _LOADED
+    if _LOADED and path is None:
+        return
+    _LOADED = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv(path)
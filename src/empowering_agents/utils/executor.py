@@ -0,0 +1,164 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+REJECT = "reject"
+WAIT = "wait"
+
+
+class ExecutorSaturated(RuntimeError):
+    """The executor's queue is full (policy "reject"), or waiting for room timed out."""
+
+
+class BoundedExecutor:
+    """
+    Named thread pool for blocking calls with a bounded queue.
+
+    At most max_workers calls run and max_queue more wait for a thread.
+    Beyond that, policy="reject" raises ExecutorSaturated at once and
+    policy="wait" makes the caller await room (backpressure), up to
+    queue_timeout seconds. Cancelling the awaiting task removes a call that
+    has not started yet; a call already running finishes in its thread and
+    its result is dropped. stats() reports queue depth, wait and run times.
+    Safe to share between event loops.
+    """
+    def __init__(
+        self,
+        name: str,
+        max_workers: int = 4,
+        max_queue: int = 32,
+        policy: str = WAIT,
+        queue_timeout: Optional[float] = None,
+    ):
+        if policy not in (REJECT, WAIT):
+            raise ValueError(f"Unknown executor policy: {policy}")
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._admitted = 0  # queued + running
+        self._running = 0
+        self._waiters: deque = deque()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.abandoned = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        await self._admit()
+        submitted = time.monotonic()
+
+        def call():
+            started = time.monotonic()
+            with self._lock:
+                self._running += 1
+                waited = started - submitted
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            try:
+                return fn(*args)
+            finally:
+                ran = time.monotonic() - started
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+                    self._run_total += ran
+                    self._run_max = max(self._run_max, ran)
+
+        try:
+            cfut = self._pool.submit(call)
+        except BaseException:
+            self._release(None)
+            raise
+        cfut.add_done_callback(self._release)
+        try:
+            # cancelling this await also cancels cfut if it has not started
+            return await asyncio.wrap_future(cfut)
+        except asyncio.CancelledError:
+            # outside the lock: cancel() runs _release synchronously
+            not_started = cfut.cancel()
+            with self._lock:
+                if not_started:
+                    self.cancelled += 1
+                else:
+                    self.abandoned += 1
+            raise
+
+    async def _admit(self):
+        loop = asyncio.get_running_loop()
+        deadline = None if self.queue_timeout is None else loop.time() + self.queue_timeout
+        while True:
+            with self._lock:
+                if self._admitted < self.max_workers + self.max_queue:
+                    self._admitted += 1
+                    self.submitted += 1
+                    return
+                if self.policy == REJECT:
+                    self.rejected += 1
+                    raise ExecutorSaturated(f"{self.name}: {self._admitted} calls queued or running")
+                waiter = (loop, loop.create_future())
+                self._waiters.append(waiter)
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                await asyncio.wait_for(waiter[1], timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.rejected += 1
+                raise ExecutorSaturated(f"{self.name}: no room after {self.queue_timeout}s") from None
+            finally:
+                with self._lock:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+
+    def _release(self, _cfut):
+        # runs on a worker thread (or the loop, for cancelled calls)
+        with self._lock:
+            self._admitted -= 1
+            waiters = list(self._waiters)
+            self._waiters.clear()
+        # wake everyone; they re-check for room and re-queue if they lose
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, fut)
+            except RuntimeError:
+                pass  # that loop is closed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self.completed + self._running
+            return {
+                "name": self.name,
+                "running": self._running,
+                "queue_depth": self._admitted - self._running,
+                "waiting_for_room": len(self._waiters),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "abandoned": self.abandoned,
+                "avg_wait_s": self._wait_total / started if started else 0.0,
+                "max_wait_s": self._wait_max,
+                "avg_run_s": self._run_total / self.completed if self.completed else 0.0,
+                "max_run_s": self._run_max,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+def _wake(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
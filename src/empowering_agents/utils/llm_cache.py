@@ -0,0 +1,193 @@
+import os, json, time, hashlib, asyncio, logging, tempfile, threading
+from typing import Dict, Any, Optional
+
+from .lru import LRUCache
+
+DEFAULT_CACHE_DIR = "./.llm_cache"
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(provider: str, model: str, temperature: Any, prompt: str) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw = json.dumps([provider, model, temperature, prompt_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier prompt/response cache: a bounded in-memory LRU in front of
+    a directory of small JSON files with TTL and a total size cap.
+
+    Disk reads/writes run in a worker thread so the event loop never blocks;
+    a failed disk write is logged and leaves only the in-memory entry.
+    """
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        memory_entries: int = 512,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory = LRUCache(max_entries=memory_entries, ttl=ttl)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.disk_evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()  # guards _disk_bytes across writer threads
+        self._disk_bytes = self._scan_size()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> "LLMCache":
+        cfg = config or {}
+        ttl = cfg.get("cache_ttl", os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+        return cls(
+            cache_dir=cfg.get("cache_dir", os.getenv("LLM_CACHE_DIR", DEFAULT_CACHE_DIR)),
+            memory_entries=int(cfg.get("cache_memory_entries", os.getenv("LLM_CACHE_MEMORY_ENTRIES", 512))),
+            ttl=float(ttl) if ttl not in (None, "", "0", 0) else None,
+            max_bytes=int(cfg.get("cache_max_bytes", os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))),
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _scan_size(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue  # in-flight writes from other threads/processes
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.ttl is not None and time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last-access for eviction order
+        except OSError:
+            pass
+        return entry.get("value")
+
+    def _write_disk(self, key: str, value: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"created": time.time(), "value": value})
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            with self._lock:
+                try:
+                    previous = os.path.getsize(path)
+                except OSError:
+                    previous = 0
+                os.replace(tmp, path)
+                self._disk_bytes += len(data.encode("utf-8")) - previous
+                if self._disk_bytes > self.max_bytes:
+                    self._evict_disk()
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _remove(self, path: str):
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._disk_bytes -= size
+            except OSError:
+                pass
+
+    def _evict_disk(self):
+        """Drop least recently used files until the tier is back under 90% of max_bytes.
+
+        Called with _lock held.
+        """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        self._disk_bytes = sum(e[1] for e in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if self._disk_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._disk_bytes -= size
+            self.disk_evictions += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        value = await asyncio.to_thread(self._read_disk, key)
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.set(key, value)
+            return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        self.writes += 1
+        try:
+            await asyncio.to_thread(self._write_disk, key, value)
+        except OSError as e:
+            # disk tier is best-effort: a full/readonly disk must not fail generate()
+            logger.warning("LLM cache write failed for %s: %s", key, e)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": ((self.memory_hits + self.disk_hits) / lookups) if lookups else 0.0,
+            "writes": self.writes,
+            "memory_entries": len(self.memory),
+            "disk_bytes": self._disk_bytes,
+            "disk_evictions": self.disk_evictions,
+        }
+
+
+_SHARED_CACHES: Dict[str, LLMCache] = {}
+
+
+def get_llm_cache(config: Optional[Dict[str, Any]] = None) -> LLMCache:
+    """Process-wide cache per cache directory, so all agents share hits."""
+    cache_dir = (config or {}).get("cache_dir", os.getenv("LLM_CACHE_DIR", DEFAULT_CACHE_DIR))
+    if cache_dir not in _SHARED_CACHES:
+        _SHARED_CACHES[cache_dir] = LLMCache.from_config(config)
+    return _SHARED_CACHES[cache_dir]
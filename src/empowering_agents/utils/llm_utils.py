@@ -1,21 +1,156 @@
 import os, json, asyncio
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
-import httpx
+from typing import TYPE_CHECKING, Dict, Any, Optional, Set, Tuple, AsyncIterator
+
+from .env import load_env
+from .llm_cache import LLMCache, get_llm_cache, make_cache_key
+
+if TYPE_CHECKING:
+    import httpx  # imported on first use in get_http_client (slow to import)
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# Error strings returned in-band by generate()/stream(); never cached
+_ERROR_PREFIXES = ("OpenAI error:", "OpenAI API key not set", "Ollama error:", "Unsupported LLM provider")
+
+# Process-wide connection pools, one per (provider, base_url, event loop):
+# httpx pools cannot be shared across loops (e.g. repeated asyncio.run() in
+# tests/CLIs, or one loop per worker thread). Clients left behind by a
+# closed loop are closed on the next loop that needs a client.
+_HTTP_CLIENTS: Dict[Tuple[str, str, asyncio.AbstractEventLoop], "httpx.AsyncClient"] = {}
+_CLOSING: Set[asyncio.Task] = set()  # aclose() of reaped clients, referenced until done
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx needs the optional 'h2' package for HTTP/2)
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client(provider: str, base_url: str, config: Optional[Dict[str, Any]] = None) -> "httpx.AsyncClient":
+    """
+    Return the shared, keep-alive AsyncClient for a provider/base URL.
+
+    Pool limits and HTTP/2 can be set per client config
+    (max_connections, max_keepalive_connections, keepalive_expiry, http2, timeout)
+    or via LLM_HTTP_* environment variables.
+    """
+    loop = asyncio.get_running_loop()
+    key = (provider, base_url, loop)
+    client = _HTTP_CLIENTS.get(key)
+    if client is not None and not client.is_closed:
+        return client
+    _reap_http_clients(loop)
+
+    import httpx
+
+    cfg = config or {}
+    limits = httpx.Limits(
+        max_connections=cfg.get("max_connections", _env_int("LLM_HTTP_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=cfg.get(
+            "max_keepalive_connections", _env_int("LLM_HTTP_MAX_KEEPALIVE", 20)
+        ),
+        keepalive_expiry=cfg.get("keepalive_expiry", _env_float("LLM_HTTP_KEEPALIVE_EXPIRY", 30.0)),
+    )
+    want_http2 = cfg.get("http2", os.getenv("LLM_HTTP2", "false").lower() == "true")
+    timeout = cfg.get("timeout", _env_float("LLM_HTTP_TIMEOUT", 60.0))
+    client = httpx.AsyncClient(
+        base_url=base_url,
+        limits=limits,
+        timeout=timeout,
+        http2=bool(want_http2) and _http2_available(),
+    )
+    _HTTP_CLIENTS[key] = client
+    return client
+
+
+def _reap_http_clients(loop: asyncio.AbstractEventLoop):
+    """Drop closed clients and those of closed loops; the latter are closed in the background on loop."""
+    for key, client in list(_HTTP_CLIENTS.items()):
+        if client.is_closed or key[2].is_closed():
+            del _HTTP_CLIENTS[key]
+            if not client.is_closed:
+                task = loop.create_task(client.aclose())
+                _CLOSING.add(task)
+                task.add_done_callback(_CLOSING.discard)
+
+
+async def close_http_clients():
+    """Close all pooled clients owned by the running loop (or left by closed loops). Call from app shutdown."""
+    loop = asyncio.get_running_loop()
+    for key, client in list(_HTTP_CLIENTS.items()):
+        if key[2] is loop or key[2].is_closed():
+            del _HTTP_CLIENTS[key]
+            await client.aclose()
+    closing = [t for t in _CLOSING if t.get_loop() is loop]
+    if closing:
+        await asyncio.gather(*closing, return_exceptions=True)
 
-load_dotenv()
 
 class LLMClient:
-    def __init__(self, provider: str, config: Dict[str, Any]):
+    def __init__(self, provider: str, config: Dict[str, Any], cache: Optional[LLMCache] = None):
         self.provider = provider
         self.config = config
+        # Opt-in response cache: llm_config {"cache": True} or LLM_CACHE=true
+        cfg = config or {}
+        cache_enabled = cfg.get("cache", os.getenv("LLM_CACHE", "false").lower() == "true")
+        self.cache = cache or (get_llm_cache(cfg) if cache_enabled and provider != "dummy" else None)
+        # By default only deterministic (temperature 0) calls are cached
+        self.cache_all_temperatures = cfg.get(
+            "cache_all_temperatures", os.getenv("LLM_CACHE_ALL_TEMPERATURES", "false").lower() == "true"
+        )
 
     @classmethod
     def from_env(cls, llm_config: Dict[str, Any] = None):
+        load_env()
         provider = os.getenv("LLM_PROVIDER", "dummy").lower()
         return cls(provider, llm_config or {})
 
+    def _model(self) -> str:
+        if self.provider == "ollama":
+            return os.getenv("OLLAMA_MODEL", "llama3")
+        return (self.config or {}).get("model", "gpt-4o-mini")
+
+    def _temperature(self) -> Optional[float]:
+        default = 0.3 if self.provider == "openai" else None
+        return (self.config or {}).get("temperature", default)
+
+    def _cache_key(self, prompt: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        temperature = self._temperature()
+        if temperature != 0 and not self.cache_all_temperatures:
+            return None
+        return make_cache_key(self.provider, self._model(), temperature, prompt)
+
     async def generate(self, prompt: str) -> str:
+        key = self._cache_key(prompt)
+        if key is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+        text, ok = await self._generate(prompt)
+        if key is not None and ok:
+            await self.cache.set(key, text)
+        return text
+
+    async def _generate(self, prompt: str) -> Tuple[str, bool]:
+        """Returns (text, ok); ok is False for error strings that must not be cached."""
         if self.provider == "dummy":
             # Deterministic, JSON-friendly fallback
             # Returns a very simple structured response when the prompt asks for JSON.
@@ -25,46 +160,290 @@ class LLMClient:
                     "actions": [{"type": "next_step", "details": "Start with a 25-minute focused session today."}],
                     "goal_updates": [],
                     "personalization_learned": {}
-                })
-            return "Helpful suggestion: break your goal into small daily steps."
+                }), True
+            return "Helpful suggestion: break your goal into small daily steps.", True
         if self.provider == "openai":
             key = os.getenv("OPENAI_API_KEY")
             if not key:
-                return "OpenAI API key not set."
+                return "OpenAI API key not set.", False
             # Minimal call using openai-compatible endpoint (no SDK to keep deps light)
-            url = "https://api.openai.com/v1/chat/completions"
-            model = (self.config or {}).get("model", "gpt-4o-mini")
+            model = self._model()
             try:
-                async with httpx.AsyncClient(timeout=30) as client:
-                    r = await client.post(
-                        url,
-                        headers={"Authorization": f"Bearer {key}"},
-                        json={
-                            "model": model,
-                            "messages": [{"role":"user","content": prompt}],
-                            "temperature": (self.config or {}).get("temperature", 0.3),
-                        }
-                    )
+                client = get_http_client("openai", OPENAI_BASE_URL, self.config)
+                r = await client.post(
+                    "/chat/completions",
+                    headers={"Authorization": f"Bearer {key}"},
+                    json={
+                        "model": model,
+                        "messages": [{"role":"user","content": prompt}],
+                        "temperature": self._temperature(),
+                    },
+                    timeout=(self.config or {}).get("timeout", 30),
+                )
                 data = r.json()
-                return data["choices"][0]["message"]["content"]
+                return data["choices"][0]["message"]["content"], True
             except Exception as e:
-                return f"OpenAI error: {e}"
+                return f"OpenAI error: {e}", False
         if self.provider == "ollama":
             base = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-            model = os.getenv("OLLAMA_MODEL", "llama3")
+            model = self._model()
             try:
-                async with httpx.AsyncClient(timeout=60) as client:
-                    r = await client.post(
-                        f"{base}/api/generate",
-                        json={"model": model, "prompt": prompt}
-                    )
-                # Ollama returns a streaming-like JSONL; but /api/generate returns a JSON object with 'response'
+                client = get_http_client("ollama", base, self.config)
+                r = await client.post(
+                    "/api/generate",
+                    json=self._ollama_payload(model, prompt, stream=False)
+                )
+                # With stream=False, /api/generate returns a single JSON object with 'response'
                 try:
                     data = r.json()
                     if "response" in data:
-                        return data["response"]
+                        return data["response"], True
                 except Exception:
-                    return r.text
+                    return r.text, False
+                return r.text, False
+            except Exception as e:
+                return f"Ollama error: {e}", False
+        return "Unsupported LLM provider.", False
+
+    def _ollama_payload(self, model: str, prompt: str, stream: bool) -> Dict[str, Any]:
+        payload = {"model": model, "prompt": prompt, "stream": stream}
+        if self._temperature() is not None:
+            payload["options"] = {"temperature": self._temperature()}
+        return payload
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Yield the completion incrementally as text chunks.
+
+        OpenAI is read as server-sent events, Ollama as JSON lines.
+        Errors are yielded as a final text chunk, mirroring generate().
+        """
+        key = self._cache_key(prompt)
+        if key is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+            chunks = []
+            outcome = {"ok": True}
+            async for chunk in self._stream(prompt, outcome):
+                chunks.append(chunk)
+                yield chunk
+            text = "".join(chunks)
+            # a stream that failed midway is "partial text + error": never cache it
+            if text and outcome["ok"]:
+                await self.cache.set(key, text)
+            return
+        async for chunk in self._stream(prompt):
+            yield chunk
+
+    async def _stream(self, prompt: str, outcome: Optional[Dict[str, bool]] = None) -> AsyncIterator[str]:
+        """Yields text chunks; on failure yields the error text and sets outcome["ok"] = False."""
+        outcome = outcome if outcome is not None else {}
+        outcome["ok"] = True
+        if self.provider == "dummy":
+            text, _ = await self._generate(prompt)
+            # split on spaces but keep them, so "".join(chunks) == text
+            for i, word in enumerate(text.split(" ")):
+                yield word if i == 0 else " " + word
+            return
+        if self.provider == "openai":
+            key = os.getenv("OPENAI_API_KEY")
+            if not key:
+                outcome["ok"] = False
+                yield "OpenAI API key not set."
+                return
+            model = self._model()
+            try:
+                client = get_http_client("openai", OPENAI_BASE_URL, self.config)
+                async with client.stream(
+                    "POST",
+                    "/chat/completions",
+                    headers={"Authorization": f"Bearer {key}"},
+                    json={
+                        "model": model,
+                        "messages": [{"role":"user","content": prompt}],
+                        "temperature": self._temperature(),
+                        "stream": True,
+                    },
+                    timeout=(self.config or {}).get("timeout", 30),
+                ) as r:
+                    if r.status_code != 200:
+                        # an error body is plain JSON, not an event stream
+                        body = (await r.aread()).decode("utf-8", "replace")
+                        outcome["ok"] = False
+                        yield f"OpenAI error: {r.status_code} {body[:500]}"
+                        return
+                    async for line in r.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        payload = line[len("data:"):].strip()
+                        if payload == "[DONE]":
+                            break
+                        try:
+                            delta = json.loads(payload)["choices"][0].get("delta", {})
+                        except Exception:
+                            continue
+                        if delta.get("content"):
+                            yield delta["content"]
             except Exception as e:
-                return f"Ollama error: {e}"
-        return "Unsupported LLM provider."
+                outcome["ok"] = False
+                yield f"OpenAI error: {e}"
+            return
+        if self.provider == "ollama":
+            base = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+            model = self._model()
+            try:
+                client = get_http_client("ollama", base, self.config)
+                async with client.stream(
+                    "POST", "/api/generate", json=self._ollama_payload(model, prompt, stream=True)
+                ) as r:
+                    if r.status_code != 200:
+                        body = (await r.aread()).decode("utf-8", "replace")
+                        outcome["ok"] = False
+                        yield f"Ollama error: {r.status_code} {body[:500]}"
+                        return
+                    async for line in r.aiter_lines():
+                        if not line.strip():
+                            continue
+                        try:
+                            data = json.loads(line)
+                        except Exception:
+                            continue
+                        if data.get("response"):
+                            yield data["response"]
+                        if data.get("done"):
+                            break
+            except Exception as e:
+                outcome["ok"] = False
+                yield f"Ollama error: {e}"
+            return
+        outcome["ok"] = False
+        yield "Unsupported LLM provider."
+
+
+class JSONFieldStream:
+    """
+    Pulls one top-level string field (the reply "message") out of a JSON
+    completion while it streams: feed() takes raw chunks and returns the
+    newly decoded field text. A completion that does not start with "{" is
+    passed through as plain text. finish() returns whatever the stream could
+    not show incrementally (e.g. a non-string field, or invalid JSON).
+    """
+    def __init__(self, field: str = "message"):
+        self.field = field
+        self.raw = ""
+        self.text = ""  # field text returned so far
+        self._mode: Optional[str] = None  # "plain" | "json", decided by the first non-space char
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._escaped = False
+        self._str_start = 0
+        self._last_str: Optional[str] = None
+        self._want_value = False
+        self._value_start: Optional[int] = None
+        self._decoded_to = 0  # raw offset up to which the field value has been decoded
+        self._closed = False
+
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        if self._mode is None:
+            head = self.raw.lstrip()
+            if not head:
+                return ""
+            self._mode = "json" if head.startswith("{") else "plain"
+        if self._mode == "plain":
+            new = self.raw[len(self.text):]
+            self.text = self.raw
+            return new
+        if self._value_start is None:
+            self._scan()
+        if self._value_start is None or self._closed:
+            return ""
+        return self._emit()
+
+    def _scan(self):
+        """Tokenize far enough to find where the field's string value starts."""
+        buf = self.raw
+        while self._pos < len(buf):
+            c = buf[self._pos]
+            if self._in_str:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_str = False
+                    self._last_str = buf[self._str_start:self._pos]
+            elif c == '"':
+                if self._want_value:
+                    self._value_start = self._decoded_to = self._pos + 1
+                    return
+                self._in_str = True
+                self._str_start = self._pos + 1
+            elif c in "{[":
+                self._depth += 1
+                self._last_str = None
+            elif c in "}]":
+                self._depth -= 1
+            elif c == ":":
+                self._want_value = self._depth == 1 and self._last_str == self.field
+                self._last_str = None
+            elif c == ",":
+                self._last_str = None
+            elif not c.isspace():
+                self._want_value = False
+            self._pos += 1
+
+    def _emit(self) -> str:
+        """Decode only what arrived since the last call (linear over the reply)."""
+        raw, start = self.raw, self._decoded_to
+        i, safe, end = start, start, len(raw)
+        while i < end:
+            c = raw[i]
+            if c == '"':
+                self._closed = True
+                break
+            if c == "\\":
+                if i + 1 >= end:
+                    break  # escape split across chunks: wait for the rest
+                if raw[i + 1] == "u":
+                    if i + 6 > end:
+                        break
+                    high = raw[i + 2:i + 4].lower() in ("d8", "d9", "da", "db")
+                    if high and i + 12 > end:
+                        break  # keep a surrogate pair in one piece
+                    i += 12 if high and raw[i + 6:i + 8] == "\\u" else 6
+                else:
+                    i += 2
+            else:
+                i += 1
+            safe = i
+        if safe == start:
+            return ""
+        try:
+            new = json.loads('"' + raw[start:safe] + '"')
+        except ValueError:
+            # malformed escape: stop streaming the field; finish() falls back as for invalid JSON
+            self._closed = True
+            return ""
+        self._decoded_to = safe
+        self.text += new
+        return new
+
+    def finish(self) -> str:
+        if self._mode != "json":
+            return ""
+        try:
+            data = json.loads(self.raw)
+            value = data[self.field] if isinstance(data, dict) and self.field in data else self.raw
+        except ValueError:
+            value = self.raw  # agents fall back to the raw text as the reply
+        value = value if isinstance(value, str) else json.dumps(value)
+        if value.startswith(self.text):
+            new = value[len(self.text):]
+            self.text = value
+            return new
+        return ""
+
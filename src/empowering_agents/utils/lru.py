@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Small bounded LRU map with optional per-entry TTL and hit/miss counters.
+    Not thread-safe; meant to be used from a single event loop.
+
+    Besides max_entries, the cache can be bounded by approximate size:
+    sizeof(value) is recorded on set() and the least recently used entries
+    are evicted while the total exceeds max_bytes. on_evict(key, value) is
+    called for entries pushed out by either bound (not for pop/expiry).
+    """
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._expires: Dict[Hashable, float] = {}
+        self._sizes: Dict[Hashable, int] = {}
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data and not self._expired(key)
+
+    def _expired(self, key: Hashable) -> bool:
+        exp = self._expires.get(key)
+        return exp is not None and exp <= time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._data:
+            self.misses += 1
+            return default
+        if self._expired(key):
+            self.pop(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return self._data[key]
+
+    def __getitem__(self, key: Hashable) -> Any:
+        if key not in self:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self.set(key, value)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None:
+            self._expires[key] = time.monotonic() + ttl
+        else:
+            self._expires.pop(key, None)
+        if self.sizeof is not None:
+            size = self.sizeof(value)
+            self.resident_bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self.resident_bytes > self.max_bytes and len(self._data) > 1
+        ):
+            old, old_value = self._data.popitem(last=False)
+            self._expires.pop(old, None)
+            self.resident_bytes -= self._sizes.pop(old, 0)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(old, old_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        self._expires.pop(key, None)
+        self.resident_bytes -= self._sizes.pop(key, 0)
+        return self._data.pop(key, default)
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of (key, value) pairs, oldest first; does not touch recency or counters."""
+        return [(k, v) for k, v in self._data.items() if not self._expired(k)]
+
+    def clear(self):
+        self._data.clear()
+        self._expires.clear()
+        self._sizes.clear()
+        self.resident_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "resident_bytes": self.resident_bytes,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
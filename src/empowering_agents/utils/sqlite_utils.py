@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+def connect(path: str, synchronous: str = "NORMAL", busy_timeout_ms: int = 5000) -> sqlite3.Connection:
+    """
+    Open a SQLite connection tuned for many readers + one writer across processes:
+    WAL journal, a busy timeout instead of immediate SQLITE_BUSY, and a large
+    prepared-statement cache (statements are reused by their SQL text).
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # check_same_thread=False only so close() may run from another thread;
+    # callers still keep one connection per thread (see ThreadLocalConnections)
+    conn = sqlite3.connect(
+        path, timeout=busy_timeout_ms / 1000, isolation_level=None,
+        cached_statements=256, check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    return conn
+
+
+class ThreadLocalConnections:
+    """One connection per thread (sqlite3 connections must not cross threads)."""
+    def __init__(self, path: str, synchronous: str = "NORMAL", busy_timeout_ms: int = 5000):
+        self.path = path
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path, self.synchronous, self.busy_timeout_ms)
+            self._local.conn = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE takes the write lock up front, so concurrent writers queue on busy_timeout."""
+        conn = self.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._all.clear()
+        self._local = threading.local()
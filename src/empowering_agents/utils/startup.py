@@ -0,0 +1,72 @@
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# Optional dependencies that must only be imported on first use
+HEAVY_MODULES = ("dspy", "googleapiclient", "google_auth_oauthlib", "google.oauth2", "httpx", "dotenv", "numpy")
+
+DEFAULT_TARGET = "src.empowering_agents.personalities.learning_navigator"
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(target: str = DEFAULT_TARGET, cwd: Optional[str] = None) -> Dict[str, int]:
+    """
+    Import target in a fresh interpreter with -X importtime and return
+    {module: cumulative microseconds} for every module it imported.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, cwd=cwd, check=True,
+    )
+    times: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            times[m.group(4)] = int(m.group(2))
+    return times
+
+
+def heavy_imports(times: Dict[str, int]) -> List[str]:
+    return sorted(
+        name for name in times
+        if any(name == h or name.startswith(h + ".") for h in HEAVY_MODULES)
+    )
+
+
+def check_startup(target: str = DEFAULT_TARGET, budget_ms: Optional[float] = None,
+                  cwd: Optional[str] = None, times: Optional[Dict[str, int]] = None) -> Tuple[float, List[str]]:
+    """
+    Return (import time of target in ms, problems); problems is empty when
+    the import fits IMPORT_TIME_BUDGET_MS and no HEAVY_MODULES were loaded.
+    """
+    budget_ms = budget_ms if budget_ms is not None else float(os.getenv("IMPORT_TIME_BUDGET_MS", "250"))
+    times = times if times is not None else measure_import(target, cwd)
+    total_ms = times.get(target, 0) / 1000
+    problems = []
+    if total_ms > budget_ms:
+        problems.append(f"import {target} took {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    heavy = heavy_imports(times)
+    if heavy:
+        problems.append("imported eagerly: " + ", ".join(heavy))
+    return total_ms, problems
+
+
+if __name__ == "__main__":
+    # python -m src.empowering_agents.utils.startup [module] [--top N]
+    args = sys.argv[1:]
+    top = 15
+    if "--top" in args:
+        i = args.index("--top")
+        top = int(args[i + 1])
+        del args[i:i + 2]
+    target = args[0] if args else DEFAULT_TARGET
+    times = measure_import(target)
+    for name, us in sorted(times.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"{us / 1000:8.1f} ms  {name}")
+    total_ms, problems = check_startup(target, times=times)
+    for p in problems:
+        print("FAIL:", p)
+    sys.exit(1 if problems else 0)
@@ -7,3 +7,933 @@ def test_learning_navigator_runs():
         r = await agent.interact("test_user", "Help me learn SQL in 2 months.")
         assert isinstance(r.message, str)
     asyncio.run(run())
+
+def test_llm_http_client_is_pooled():
+    from src.empowering_agents.utils.llm_utils import get_http_client, close_http_clients, _HTTP_CLIENTS
+    async def get_http_client_async(*args):
+        return get_http_client(*args)
+    async def run():
+        a = get_http_client("ollama", "http://localhost:11434")
+        b = get_http_client("ollama", "http://localhost:11434")
+        assert a is b
+        await close_http_clients()
+        assert a.is_closed
+        assert not _HTTP_CLIENTS
+    asyncio.run(run())
+    # a client left open by a finished loop is closed by the next one, not leaked
+    left_open = asyncio.run(get_http_client_async("ollama", "http://localhost:11434"))
+    async def next_loop():
+        fresh = get_http_client("ollama", "http://localhost:11434")
+        assert fresh is not left_open and len(_HTTP_CLIENTS) == 1
+        await close_http_clients()
+        assert left_open.is_closed and fresh.is_closed
+    asyncio.run(next_loop())
+
+def test_llm_cache_serves_deterministic_prompts(tmp_path):
+    from src.empowering_agents.utils.llm_cache import LLMCache
+    from src.empowering_agents.utils.llm_utils import LLMClient
+    async def run():
+        cache = LLMCache(cache_dir=str(tmp_path), memory_entries=2)
+        llm = LLMClient("ollama", {"temperature": 0}, cache=cache)
+        await cache.set(llm._cache_key("persona prompt"), "cached reply")
+        assert await llm.generate("persona prompt") == "cached reply"
+        # a fresh cache over the same directory hits the disk tier
+        cold = LLMCache(cache_dir=str(tmp_path))
+        assert await LLMClient("ollama", {"temperature": 0}, cache=cold).generate("persona prompt") == "cached reply"
+        assert cache.stats()["memory_hits"] == 1 and cold.stats()["disk_hits"] == 1
+        # non-zero temperature bypasses the cache by default
+        assert LLMClient("ollama", {"temperature": 0.7}, cache=cache)._cache_key("persona prompt") is None
+    asyncio.run(run())
+
+def test_llm_stream_failing_midway_is_not_cached(tmp_path, monkeypatch):
+    import httpx
+    from src.empowering_agents.utils import llm_utils
+    from src.empowering_agents.utils.llm_cache import LLMCache
+    async def body():
+        yield b'{"response": "partial"}\n'
+        raise httpx.ReadError("connection reset")
+    def handler(request):
+        return httpx.Response(200, content=body())
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://ollama")
+        monkeypatch.setattr(llm_utils, "get_http_client", lambda *a, **k: client)
+        cache = LLMCache(cache_dir=str(tmp_path), memory_entries=2)
+        llm = llm_utils.LLMClient("ollama", {"temperature": 0}, cache=cache)
+        text = "".join([chunk async for chunk in llm.stream("hello")])
+        assert text.startswith("partial") and "Ollama error:" in text
+        assert await cache.get(llm._cache_key("hello")) is None
+        assert cache.stats()["writes"] == 0
+        await client.aclose()
+        # an HTTP error body is surfaced instead of an empty stream
+        error = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(404, json={"error": "model 'x' not found"})), base_url="http://ollama")
+        monkeypatch.setattr(llm_utils, "get_http_client", lambda *a, **k: error)
+        text = "".join([chunk async for chunk in llm.stream("hello")])
+        assert text.startswith("Ollama error: 404") and "not found" in text
+        await error.aclose()
+    asyncio.run(run())
+
+def test_interact_stream_yields_message_text_and_releases_lock_on_close():
+    import json
+    from contextlib import aclosing
+    from src.empowering_agents.core.agent import TWO_PASS
+    from src.empowering_agents.personalities.fitness_coach import FitnessCoach
+    raw = json.dumps({"message": "Try a \"10 min\" walk.", "actions": [], "goal_updates": []})
+    async def fake_stream(prompt):
+        for i in range(0, len(raw), 4):
+            yield raw[i:i + 4]
+    async def run():
+        agent = FitnessCoach(llm_config={})
+        agent.interaction_mode = TWO_PASS
+        agent.llm.stream = fake_stream
+        text = "".join([c async for c in agent.interact_stream("stream_user", "I feel stuck")])
+        assert text == 'Try a "10 min" walk.'
+        # the consumer goes away after the first chunk: the turn still finishes and unlocks
+        async with aclosing(agent.interact_stream("stream_user", "again")) as stream:
+            first = await stream.__anext__()
+        assert not agent.locks.locked("stream_user")
+        memory = await agent.memory_system.load_user_memory("stream_user")
+        assert memory["interactions"][-1]["agent_response"] == first
+        await agent.aclose()
+    asyncio.run(run())
+    # a malformed escape ends the streamed field instead of raising out of feed()
+    from src.empowering_agents.utils.llm_utils import JSONFieldStream
+    broken = JSONFieldStream("reply")
+    assert "".join(broken.feed(c) for c in ['{"reply": "ab\\u', "zz", 'zz"}']) == "ab"
+    assert broken.finish() == ""
+
+def test_tools_run_concurrently_with_deadlines():
+    from src.empowering_agents.personalities.fitness_coach import FitnessCoach
+    async def run():
+        agent = FitnessCoach(llm_config={})
+        agent.tool_timeouts = {"calendar": 0.05}
+
+        log = []
+        async def fake_use_tool(name, user_id, intent, context):
+            log.append(name + "+")
+            try:
+                if name == "calendar":
+                    await asyncio.Event().wait()  # never answers
+                await asyncio.sleep(0.02)
+            except asyncio.CancelledError:
+                log.append(name + " cancelled")
+                raise
+            log.append(name + "-")
+            return {"tool": name}
+        agent.tool_registry.use_tool = fake_use_tool
+
+        results, timed_out = await agent._run_tools(
+            ["calendar", "knowledge_base", "progress_tracker"], "u1", {}, {}
+        )
+        # all three started before any finished, and the hung one was cut off at its deadline
+        assert log[:3] == ["calendar+", "knowledge_base+", "progress_tracker+"]
+        assert log[-1] == "calendar cancelled"
+        assert timed_out == ["calendar"]
+        assert results["knowledge_base"] == {"tool": "knowledge_base"}
+        assert results["calendar"] == {"error": "timeout"}
+    asyncio.run(run())
+
+def test_local_intent_classifier():
+    from src.empowering_agents.core.intent import IntentClassifier
+    clf = IntentClassifier()
+    r = clf.classify("Can you schedule a workout tomorrow?")
+    assert r["needs_scheduling"] and not r["needs_external_service"]
+    assert r["confidence"] >= 0.9
+    plain = clf.classify("Help me learn SQL in 2 months.")
+    assert not any(plain[k] for k in ("needs_scheduling", "needs_data_lookup", "needs_external_service"))
+    # weak cues are left to the LLM
+    assert clf.classify("what now")["confidence"] < 0.9
+    # no known words at all: the bias alone must not skip the LLM
+    assert clf.classify("set up a time for me Thursday")["confidence"] < 0.9
+    clf.fit([("push this lead to hubspot", {"needs_external_service": True})] * 20)
+    assert clf.classify("push this lead to hubspot")["needs_external_service"]
+
+def test_append_only_memory_log_replays_and_compacts(tmp_path):
+    from src.empowering_agents.core.memory import UserMemorySystem
+    async def run():
+        mem = UserMemorySystem(storage_dir=str(tmp_path), storage_mode="append", compact_every=50)
+        for i in range(120):
+            await mem.add_interaction("u1", f"message {i}", "ok")
+        await mem.update_preferences("u1", {"tone": "brief"})
+        await mem.flush()
+        assert (tmp_path / "u1.json").exists()
+        # records folded into the snapshot are gone from the log
+        log = tmp_path / "u1.log.jsonl"
+        assert not log.exists() or len(log.read_text().splitlines()) < 50
+        await mem.add_interaction("u1", "after compaction", "ok")
+        await mem.flush()
+
+        fresh = UserMemorySystem(storage_dir=str(tmp_path), storage_mode="append")
+        m = await fresh.load_user_memory("u1")
+        assert len(m["interactions"]) == 100
+        assert m["interactions"][-1]["user_message"] == "after compaction"
+        assert m["preferences"] == {"tone": "brief"}
+        assert m["summary"]["interaction_count"] == 100
+    asyncio.run(run())
+
+def test_json_snapshot_survives_a_crash_mid_write(tmp_path, monkeypatch):
+    import os
+    from src.empowering_agents.core.storage import JsonFileBackend
+    backend = JsonFileBackend(str(tmp_path))
+    backend.save_user("u1", {"user_id": "u1", "interactions": [], "preferences": {"tone": "brief"}})
+    def crash(fd):
+        raise OSError("power cut")
+    monkeypatch.setattr(os, "fsync", crash)
+    try:
+        backend.save_user("u1", {"user_id": "u1", "interactions": [], "preferences": {"tone": "long"}})
+    except OSError:
+        pass
+    monkeypatch.undo()
+    assert backend.load_user("u1")["preferences"] == {"tone": "brief"}  # old snapshot intact
+
+def test_sqlite_memory_backend_and_migration(tmp_path):
+    from src.empowering_agents.core.memory import UserMemorySystem, GoalTracker
+    from src.empowering_agents.core.storage import SQLiteBackend, migrate_json_to_sqlite
+    async def run():
+        json_mem = UserMemorySystem(storage_dir=str(tmp_path / "json"))
+        await json_mem.add_interaction("u1", "I want to study marketing", "great")
+        await json_mem.update_preferences("u1", {"tone": "brief"})
+        await json_mem.close()
+
+        db = str(tmp_path / "memory.db")
+        assert migrate_json_to_sqlite(str(tmp_path / "json"), db) == 1
+        backend = SQLiteBackend(db)
+        mem = UserMemorySystem(backend=backend)
+        m = await mem.load_user_memory("u1")
+        assert m["interactions"][0]["user_message"] == "I want to study marketing"
+        assert m["preferences"] == {"tone": "brief"}
+        assert "learning" in m["summary"]["common_topics"]
+
+        await mem.add_interaction("u1", "next", "ok")
+        goals = GoalTracker(backend=backend)
+        await goals.add_goal("u1", {"id": "g1", "description": "SQL", "current_progress": 0.2})
+        await goals.update_goal_progress("u1", "g1", 1.0)
+        await mem.flush()
+
+        reopened = SQLiteBackend(db)
+        assert len(reopened.load_user("u1")["interactions"]) == 2
+        assert await GoalTracker(backend=reopened).get_completed_goals("u1") == [
+            {"id": "g1", "description": "SQL", "current_progress": 1.0}
+        ]
+        backend.close()
+        reopened.close()
+    asyncio.run(run())
+
+def test_memory_writes_are_coalesced_off_loop(tmp_path):
+    import threading
+    from src.empowering_agents.core.memory import UserMemorySystem
+    async def run():
+        mem = UserMemorySystem(storage_dir=str(tmp_path), flush_delay=0.05)
+        batches = []
+        write_batch = mem.backend.write_batch
+        def recording_write_batch(user_id, ops, memory):
+            batches.append((threading.current_thread().name, len(ops)))
+            write_batch(user_id, ops, memory)
+        mem.backend.write_batch = recording_write_batch
+        for i in range(10):
+            await mem.add_interaction("u1", f"message {i}", "ok")
+        await mem.flush()
+        assert len(batches) == 1 and batches[0][1] == 10
+        assert batches[0][0].startswith("memory-io")
+        assert len(mem.backend.load_user("u1")["interactions"]) == 10
+        await mem.close()
+    asyncio.run(run())
+
+def test_failed_memory_writes_are_retried_and_surface_on_flush(tmp_path):
+    import pytest
+    from src.empowering_agents.core.memory import UserMemorySystem
+    async def run():
+        mem = UserMemorySystem(storage_dir=str(tmp_path))
+        mem.retry_backoff = 0.001
+        write_batch, failures = mem.backend.write_batch, [5]
+        def flaky_write_batch(user_id, ops, memory):
+            if failures[0]:
+                failures[0] -= 1
+                raise OSError("disk full")
+            write_batch(user_id, ops, memory)
+        mem.backend.write_batch = flaky_write_batch
+        await mem.add_interaction("u1", "hello", "ok")
+        await asyncio.sleep(0.05)  # the background flusher retries 3 times, then gives up
+        assert mem._pending_ops.get("u1") and not mem._flushers
+        await mem.flush()  # retried again; the 5th failure is the last
+        assert mem.backend.load_user("u1")["interactions"][0]["user_message"] == "hello"
+
+        failures[0] = 100
+        await mem.add_interaction("u1", "lost?", "ok")
+        with pytest.raises(OSError):
+            await mem.flush()
+        assert mem._pending_ops["u1"][0][1]["user_message"] == "lost?"  # still queued, not dropped
+        failures[0] = 0
+        await mem.close()
+        assert mem.backend.load_user("u1")["interactions"][-1]["user_message"] == "lost?"
+    asyncio.run(run())
+
+def test_memory_cache_is_bounded_and_writes_back_on_eviction(tmp_path):
+    from src.empowering_agents.core.memory import UserMemorySystem
+    async def run():
+        mem = UserMemorySystem(storage_dir=str(tmp_path), flush_delay=0.05, cache_max_users=2)
+        for uid in ("a", "b", "c"):
+            await mem.add_interaction(uid, f"hello from {uid}", "ok")
+        assert len(mem.user_memories) == 2 and "a" not in mem.user_memories
+        # evicted but still dirty: served from the pending write, not stale disk
+        assert (await mem.load_user_memory("a"))["interactions"][0]["user_message"] == "hello from a"
+        await mem.flush()
+        assert mem.backend.load_user("c")["interactions"][0]["user_message"] == "hello from c"
+        stats = mem.cache_stats()
+        assert stats["entries"] == 2 and stats["evictions"] >= 1 and stats["resident_bytes"] > 0
+        await mem.close()
+    asyncio.run(run())
+
+def test_incremental_summary_with_topic_automaton(tmp_path):
+    from src.empowering_agents.core.memory import UserMemorySystem
+    from src.empowering_agents.core.topics import TopicMatcher
+    matcher = TopicMatcher({"seo": ["search ranking", "seo"], "email": ["newsletter", "email"],
+                            "fitness": ["gym"], "learning": ["learn"]})
+    assert matcher.topics_in("Our SEO and newsletter plan") == {"seo", "email"}
+    assert matcher.topics_in("improve search rankings") == {"seo"}
+    async def run():
+        mem = UserMemorySystem(storage_dir=str(tmp_path), topic_matcher=matcher)
+        await mem.add_interaction("u1", "I want to learn about email campaigns", "ok")
+        for _ in range(12):
+            await mem.add_interaction("u1", "gym", "ok")
+        summary = (await mem.load_user_memory("u1"))["summary"]
+        # "learn"/"email" were seen 13 turns ago and have decayed away
+        assert summary["common_topics"] == ["fitness"]
+        assert summary["user_style"]["communication_style"] == "concise"
+        assert summary["interaction_count"] == 13
+        # a full rebuild agrees with the incremental state
+        m = await mem.load_user_memory("u1")
+        incremental = dict(m["summary"])
+        await mem._update_memory_summary("u1", m)
+        assert m["summary"] == incremental
+        await mem.close()
+    asyncio.run(run())
+
+def test_keyed_locks_serialize_per_user_and_evict():
+    from src.empowering_agents.core.locks import KeyedLockManager
+    locks = KeyedLockManager()
+    async def run():
+        active, peak, alongside_a = {}, {}, []
+        async def turn(user):
+            async with locks.lock(user):
+                async with locks.lock(user):  # reentrant within the task
+                    active[user] = active.get(user, 0) + 1
+                    peak[user] = max(peak.get(user, 0), active[user])
+                    if user != "a" and active.get("a"):
+                        alongside_a.append(user)
+                    await asyncio.sleep(0.01)
+                    active[user] -= 1
+        await asyncio.gather(*(turn(u) for u in ["a", "a", "a", "b", "c"]))
+        assert peak == {"a": 1, "b": 1, "c": 1}
+        assert alongside_a == ["b", "c"]  # entered while "a" held its lock
+        assert locks.stats()["live_locks"] == 0  # idle locks are dropped
+        assert locks.stats()["contended"] == 2
+    asyncio.run(run())
+
+
+def test_file_locks_exclude_across_managers(tmp_path):
+    from src.empowering_agents.core.locks import FileLockManager
+    # two managers = two "processes": flock() conflicts across open files
+    w1, w2 = FileLockManager(str(tmp_path), stripes=8), FileLockManager(str(tmp_path), stripes=8)
+    async def run():
+        order = []
+        async def hold(mgr, name):
+            async with mgr.lock("u1"):
+                order.append(name + "+")
+                await asyncio.sleep(0.05)
+                order.append(name + "-")
+        first = asyncio.create_task(hold(w1, "w1"))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(first, hold(w2, "w2"))
+        assert order == ["w1+", "w1-", "w2+", "w2-"]
+    asyncio.run(run())
+
+
+def test_concurrent_turns_for_one_user_keep_every_interaction(tmp_path):
+    from src.empowering_agents.core.memory import UserMemorySystem
+    from src.empowering_agents.core.locks import KeyedLockManager
+    async def run():
+        mem = UserMemorySystem(storage_dir=str(tmp_path), locks=KeyedLockManager())
+        await asyncio.gather(*(mem.add_interaction("u1", f"m{i}", "ok") for i in range(20)))
+        await mem.close()
+        fresh = UserMemorySystem(storage_dir=str(tmp_path))
+        memory = await fresh.load_user_memory("u1")
+        assert sorted(i["user_message"] for i in memory["interactions"]) == sorted(f"m{i}" for i in range(20))
+        await fresh.close()
+    asyncio.run(run())
+
+
+def test_goal_tracker_journal_restores_index(tmp_path):
+    from src.empowering_agents.core.memory import GoalTracker
+    from src.empowering_agents.core.goal_store import GoalJournal
+    async def run():
+        goals = GoalTracker(store=GoalJournal(str(tmp_path), compact_every=50))
+        await goals.add_goals([(f"u{i % 10}", {"id": f"g{i}", "current_progress": 0.0}) for i in range(100)])
+        assert await goals.update_goals([("u1", "g1", 1.0), ("u1", "missing", 1.0)]) == 1
+        await goals.update_goal_progress("u2", "g2", 0.5)
+        assert [g["id"] for g in await goals.get_completed_goals("u1")] == ["g1"]
+        assert len(await goals.get_active_goals("u1")) == 9
+        await goals.close()
+        assert (tmp_path / "goals.snapshot.json").exists()  # compacted in the background
+
+        restored = GoalTracker(store=GoalJournal(str(tmp_path)))
+        assert [g["id"] for g in await restored.get_completed_goals("u1")] == ["g1"]
+        assert (await restored.get_goal("u2", "g2"))["current_progress"] == 0.5
+        assert sum([len(await restored.get_active_goals(f"u{i}")) for i in range(10)]) == 99
+        # moving back to active is incremental too
+        await restored.update_goal_progress("u1", "g1", 0.3)
+        assert await restored.get_completed_goals("u1") == []
+        await restored.close()
+    asyncio.run(run())
+
+
+def test_default_goal_tracker_survives_restart(tmp_path, monkeypatch):
+    from src.empowering_agents.core.memory import GoalTracker, UserMemorySystem
+    monkeypatch.delenv("GOAL_STORE", raising=False)
+    monkeypatch.delenv("GOAL_JOURNAL_DIR", raising=False)
+    async def run():
+        # the default configuration: GOAL_STORE=backend over the JSON file backend
+        mem = UserMemorySystem(storage_dir=str(tmp_path))
+        goals = GoalTracker(backend=mem.backend)
+        await goals.add_goal("u1", {"id": "g1", "description": "Run 5k", "current_progress": 0.4})
+        await goals.close()
+        await mem.close()
+        restarted = GoalTracker(backend=UserMemorySystem(storage_dir=str(tmp_path)).backend)
+        assert (await restarted.get_goal("u1", "g1"))["current_progress"] == 0.4
+        assert (tmp_path / "goals").is_dir()
+        await restarted.close()
+    asyncio.run(run())
+
+
+def test_planner_runtime_shared_and_hot_reloads_hints(tmp_path):
+    import json, os
+    from src.empowering_agents.core.planning import PlannerRuntime, GoalPlanner, ActionPlanner
+    path = tmp_path / "hints.json"
+    path.write_text(json.dumps({"tone": "brief"}))
+    runtime = PlannerRuntime(str(path), check_interval=0)
+    goal_planner, action_planner = GoalPlanner(runtime=runtime), ActionPlanner(runtime=runtime)
+    assert goal_planner.compiled_hints == action_planner.compiled_hints == {"tone": "brief"}
+    version = runtime.hints_version
+    assert runtime.hints() and runtime.hints_version == version  # unchanged file is not re-read
+
+    path.write_text(json.dumps({"tone": "warm"}))
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 10**9))
+    assert goal_planner.compiled_hints == {"tone": "warm"}
+    assert runtime.hints_json() == '{"tone": "warm"}'
+    plan = asyncio.run(goal_planner.plan("learn SQL", {"timeframe": "60 days"}))
+    assert plan["timeframe"] == "60 days"
+
+
+def test_fused_plan_is_cached_on_normalized_message(tmp_path):
+    from src.empowering_agents.core.planning import PlannerRuntime, GoalPlanner
+    planner = GoalPlanner(runtime=PlannerRuntime(str(tmp_path / "none.json"), check_interval=0))
+    calls = []
+    fused = planner._plan_with_steps
+    async def counting(message, context):
+        calls.append(message)
+        await asyncio.sleep(0.01)
+        return await fused(message, context)
+    planner._plan_with_steps = counting
+    async def run():
+        a, b = await asyncio.gather(
+            planner.plan_with_steps("I want to learn SQL in 2 months!", {"timeframe": "60 days"}),
+            planner.plan_with_steps("learn sql in 2 months", {"timeframe": "60 days"}),
+        )
+        assert a == b and len(a["steps"]) == 3 and a["goal"]["timeframe"] == "60 days"
+        a["steps"].append("mutated")
+        again = await planner.plan_with_steps("Learn SQL in 2 months.", {"timeframe": "60 days"})
+        assert len(again["steps"]) == 3
+        await planner.plan_with_steps("learn sql in 2 months", {"timeframe": "30 days"})
+    asyncio.run(run())
+    assert len(calls) == 2  # one per distinct context
+
+
+def test_bounded_executor_rejects_and_cancels_queued_calls():
+    import threading
+    from src.empowering_agents.utils.executor import BoundedExecutor, ExecutorSaturated, WAIT
+    gate = threading.Event()
+    pool = BoundedExecutor("test", max_workers=1, max_queue=1, policy="reject")
+    async def run():
+        running = asyncio.ensure_future(pool.run(gate.wait))
+        queued = asyncio.ensure_future(pool.run(lambda: "queued"))
+        await asyncio.sleep(0.01)
+        assert pool.stats()["queue_depth"] == 1 and pool.stats()["running"] == 1
+        try:
+            await pool.run(lambda: "overflow")
+            assert False, "expected ExecutorSaturated"
+        except ExecutorSaturated:
+            pass
+        queued.cancel()  # abandoned before it started: frees its slot
+        await asyncio.sleep(0)
+        assert pool.stats()["cancelled"] == 1
+        gate.set()
+        assert await running is True
+        assert await pool.run(lambda: 42) == 42
+        stats = pool.stats()
+        assert (stats["rejected"], stats["completed"], stats["queue_depth"]) == (1, 2, 0)
+
+        # backpressure: waiters get in as slots free up
+        gate.clear()
+        waiting = BoundedExecutor("wait", max_workers=1, max_queue=0, policy=WAIT, queue_timeout=1)
+        first = asyncio.ensure_future(waiting.run(gate.wait))
+        second = asyncio.ensure_future(waiting.run(lambda: "second"))
+        await asyncio.sleep(0.01)
+        assert not second.done() and waiting.stats()["waiting_for_room"] == 1
+        gate.set()
+        assert await first is True and await second == "second"
+    asyncio.run(run())
+
+
+def test_package_import_is_lazy_and_within_budget():
+    import os
+    from src.empowering_agents.utils.startup import check_startup, heavy_imports, measure_import
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # wall-clock time is noisy on shared CI runners: the deterministic check is which
+    # modules got imported; the time budget only catches gross regressions
+    budget_ms = float(os.getenv("IMPORT_TIME_TEST_BUDGET_MS", "2000"))
+    for target in ("src.empowering_agents.personalities.learning_navigator",
+                   "src.empowering_agents.personalities.fitness_coach"):
+        times = measure_import(target, cwd=repo_root)
+        assert heavy_imports(times) == []
+        total_ms, problems = check_startup(target, budget_ms=budget_ms, times=times)
+        assert not problems, problems
+
+
+def test_knowledge_base_bm25_search_and_kb_tool(tmp_path, monkeypatch):
+    import os
+    import pytest
+    from src.empowering_agents.core import knowledge_base
+    from src.empowering_agents.core.knowledge_base import build_index, iter_documents, KnowledgeBase
+    from src.empowering_agents.core.tools import ToolRegistry
+    docs = tmp_path / "docs"
+    (docs / "stats").mkdir(parents=True)
+    (docs / "stats" / "correlation.md").write_text(
+        "# Correlation vs causation\nA correlation between two metrics does not prove causation. "
+        "Run a controlled experiment, such as an A/B test, to establish causality.")
+    (docs / "email.txt").write_text("Email subject lines: keep them short. Test subject lines with A/B tests.")
+    (docs / "seo.md").write_text("SEO basics: keywords, backlinks and page speed. " * 20)
+    meta = build_index(iter_documents(str(docs)), str(tmp_path / "kb"))
+    assert meta["docs"] == 3
+
+    kb = KnowledgeBase(str(tmp_path / "kb"))
+    hits = kb.search("does correlation prove causation?")
+    assert hits[0]["path"] == os.path.join("stats", "correlation.md")
+    assert hits[0]["title"] == "Correlation vs causation"
+    assert "causation" in hits[0]["snippet"]
+    assert [h["path"] for h in kb.search("subject lines")] == ["email.txt"]
+    assert kb.search("nothing matches this") == []
+    kb.search("correlation causation")
+    kb.search("Causation, correlation!")  # same terms: served from the cache
+    assert kb.cache.stats()["hits"] == 1
+
+    numpy_scores = [h["score"] for h in kb._uncached_search(["test", "a", "b"], 5)]
+    kb._np_doc_norm = None  # pure-Python scoring path
+    assert [h["score"] for h in kb._uncached_search(["test", "a", "b"], 5)] == pytest.approx(numpy_scores, rel=1e-4)
+    kb.close()
+
+    monkeypatch.setenv("KB_INDEX_DIR", str(tmp_path / "kb"))
+    monkeypatch.setattr(knowledge_base, "_KB", {})
+    result = asyncio.run(ToolRegistry(["knowledge_base"]).use_tool(
+        "knowledge_base", "u1", {"surface_intent": "Explain correlation"}, {}))
+    assert "correlation" in result["kb"].lower() and result["source"].endswith("correlation.md")
+
+    # a missing index is not remembered, and a rebuilt one is picked up
+    late = str(tmp_path / "late_kb")
+    assert knowledge_base.get_knowledge_base(late) is None
+    build_index(iter_documents(str(docs)), late)
+    first = knowledge_base.get_knowledge_base(late)
+    assert first is not None and knowledge_base.get_knowledge_base(late) is first
+    (docs / "pricing.md").write_text("Pricing pages: anchor on the annual plan.")
+    build_index(iter_documents(str(docs)), late)
+    assert knowledge_base.get_knowledge_base(late).search("annual plan pricing")[0]["path"] == "pricing.md"
+
+
+def test_recall_finds_interactions_outside_the_window(tmp_path):
+    from src.empowering_agents.core.memory import UserMemorySystem, MAX_INTERACTIONS
+    from src.empowering_agents.core.recall import RecallIndex
+    topics = ["email subject lines", "seo backlinks", "pricing page copy", "webinar funnel"]
+    async def run():
+        recall = RecallIndex(str(tmp_path / "recall"), ivf_min_size=64, save_every=16)
+        mem = UserMemorySystem(storage_dir=str(tmp_path), flush_delay=0.05, recall=recall)
+        await mem.add_interaction("u1", "How do I improve churn analysis cohorts?", "Group users by signup month.")
+        for i in range(MAX_INTERACTIONS + 80):
+            await mem.add_interaction("u1", f"question {i} about {topics[i % 4]}", "ok")
+        assert len((await mem.load_user_memory("u1"))["interactions"]) == MAX_INTERACTIONS
+        assert await mem.recall_relevant("u1", "nothing in common xyz") == []
+        hits = await mem.recall_relevant("u1", "churn cohorts", k=2)
+        assert hits[0]["user_message"].startswith("How do I improve churn") and hits[0]["score"] > 0.2
+        await mem.close()
+
+        reopened = RecallIndex(str(tmp_path / "recall"), ivf_min_size=64)
+        shard = await reopened._shard("u1")
+        assert len(shard) == 81 and shard._centroids is not None  # IVF built on reload
+        # the vector file holds the original float32 vectors, not dequantized int8 codes
+        import numpy as np
+        from src.empowering_agents.core.recall import interaction_text
+        saved = np.load(tmp_path / "recall" / "u1.npy")
+        assert np.allclose(saved, reopened.embedder.embed([interaction_text(r) for r in shard.records]), atol=1e-6)
+        assert (await reopened.recall("u1", "churn analysis cohorts"))[0]["user_message"].startswith("How do I")
+        assert "seo" in (await reopened.recall("u1", "seo backlinks"))[0]["user_message"]
+    asyncio.run(run())
+
+
+class FakeCalendarHttp:
+    """Minimal Calendar v3 endpoint (list/insert/update and /batch) for the static discovery client."""
+    def __init__(self):
+        self.events, self.requests = {}, []
+
+    def close(self):
+        pass
+
+    def _handle(self, method, path, body):
+        import json, re
+        m = re.search(r"/calendars/primary/events(?:/([^?/]+))?", path)
+        if method == "GET":
+            return 200, {"items": list(self.events.values())}
+        if method == "POST":
+            event = {**json.loads(body), "id": f"ev{len(self.events) + 1}"}
+        elif m.group(1) not in self.events:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        else:
+            event = {**json.loads(body), "id": m.group(1)}
+        self.events[event["id"]] = event
+        return 200, event
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        import json, re
+        import httplib2
+        from email.parser import Parser
+        self.requests.append((method, uri))
+        if "/batch/" not in uri:
+            status, payload = self._handle(method, uri, body)
+            return httplib2.Response({"status": status, "content-type": "application/json"}), json.dumps(payload).encode()
+        ctype = next(v for k, v in headers.items() if k.lower() == "content-type")
+        out = []
+        for part in Parser().parsestr(f"content-type: {ctype}\r\n\r\n{body}").get_payload():
+            head, part_body = (re.split(r"\r?\n\r?\n", part.get_payload(), maxsplit=1) + [""])[:2]
+            method_, path = head.split()[:2]
+            status, payload = self._handle(method_, path, part_body.strip())
+            out.append(f"--b\r\nContent-Type: application/http\r\nContent-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                       f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n")
+        return httplib2.Response({"status": 200, "content-type": 'multipart/mixed; boundary="b"'}), ("".join(out) + "--b--").encode()
+
+
+def test_google_calendar_caches_service_and_batches_upserts(tmp_path, monkeypatch):
+    import json
+    from datetime import datetime, timedelta, timezone
+    from src.empowering_agents.integrations import google_calendar as gcal
+    if not gcal._load_google_libs():
+        import pytest
+        pytest.skip("google-api-python-client not installed")
+    fake = FakeCalendarHttp()
+    monkeypatch.setattr(gcal.httplib2, "Http", lambda *a, **k: fake)
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=60)  # inside the refresh margin
+    token = tmp_path / "token.json"
+    token.write_text(json.dumps({"token": "t0", "refresh_token": "r", "client_id": "c", "client_secret": "s",
+                                 "expiry": expiry.isoformat() + "Z"}))
+    monkeypatch.setenv("GOOGLE_TOKEN_PATH", str(token))
+    refreshes, builds = [], []
+    def fake_refresh(creds, request):
+        refreshes.append(1)
+        creds.token, creds.expiry = f"t{len(refreshes)}", expiry + timedelta(hours=1)
+    monkeypatch.setattr(gcal.Credentials, "refresh", fake_refresh)
+    build = gcal.build
+    monkeypatch.setattr(gcal, "build", lambda *a, **k: builds.append(1) or build(*a, **k))
+    gcal.reset_cache()
+    try:
+        created = gcal.create_event("Focus", "2026-01-01T09:00:00Z", "2026-01-01T09:30:00Z")
+        assert created["enabled"] and created["event"]["id"] == "ev1"
+        assert gcal.list_upcoming_events()["events"][0]["summary"] == "Focus"
+        assert len(refreshes) == 1 and len(builds) == 1  # refreshed ahead of expiry, service reused
+        assert json.loads(token.read_text())["token"] == "t1"
+
+        monkeypatch.setattr(gcal, "BATCH_SIZE", 2)
+        fake.requests.clear()
+        res = gcal.upsert_events([
+            {"summary": "A", "start": "2026-01-02T09:00:00Z", "end": "2026-01-02T10:00:00Z"},
+            {"summary": "Focus moved", "start": "2026-01-01T10:00:00Z", "end": "2026-01-01T10:30:00Z", "id": "ev1"},
+            {"summary": "B", "start": "2026-01-03T09:00:00Z", "end": "2026-01-03T10:00:00Z"},
+            {"summary": "Gone", "start": "2026-01-04T09:00:00Z", "end": "2026-01-04T10:00:00Z", "id": "missing"},
+            {"summary": "C", "start": "2026-01-05T09:00:00Z", "end": "2026-01-05T10:00:00Z"},
+        ])
+        assert res["enabled"] and len(fake.requests) == 3  # five calls in three round trips
+        assert [r.get("event", {}).get("summary") for r in res["results"]] == ["A", "Focus moved", "B", None, "C"]
+        assert "404" in res["results"][3]["error"]
+        assert fake.events["ev1"]["summary"] == "Focus moved" and len(fake.events) == 4
+
+        # no token: the interactive OAuth flow runs without the shared lock, and not at all on servers
+        gcal.reset_cache()
+        monkeypatch.setenv("GOOGLE_TOKEN_PATH", str(tmp_path / "new" / "token.json"))
+        secrets = tmp_path / "client_secret.json"
+        secrets.write_text("{}")
+        monkeypatch.setenv("GOOGLE_CLIENT_SECRETS", str(secrets))
+        flows = []
+        class FakeFlow:
+            @classmethod
+            def from_client_secrets_file(cls, path, scopes):
+                return cls()
+            def run_local_server(self, port):
+                flows.append(gcal._LOCK.locked())
+                return gcal.Credentials.from_authorized_user_info(
+                    {**json.loads(token.read_text()), "expiry": (expiry + timedelta(hours=2)).isoformat() + "Z"}, gcal.SCOPES)
+        monkeypatch.setattr(gcal, "InstalledAppFlow", FakeFlow)
+        monkeypatch.setenv("GOOGLE_OAUTH_INTERACTIVE", "false")
+        assert gcal.list_upcoming_events() == gcal.NOT_CONFIGURED and flows == []
+        monkeypatch.setenv("GOOGLE_OAUTH_INTERACTIVE", "true")
+        assert gcal.list_upcoming_events()["events"]
+        assert flows == [False] and (tmp_path / "new" / "token.json").exists()
+    finally:
+        gcal.reset_cache()
+
+
+def test_calendar_sync_is_incremental_and_finds_free_slots(monkeypatch):
+    from datetime import datetime, timedelta, timezone
+    from src.empowering_agents.integrations.calendar_sync import CalendarSync, FakeCalendar, find_free_slots
+    from src.empowering_agents.integrations import google_calendar as gcal
+    monkeypatch.setenv("GOOGLE_CALENDAR_TIMEZONE", "UTC")
+    t = lambda day, hh, mm=0: datetime(2026, 1, day, hh, mm, tzinfo=timezone.utc)
+    ev = lambda day, h1, h2, **kw: {"start": {"dateTime": t(day, h1).isoformat()}, "end": {"dateTime": t(day, h2).isoformat()}, **kw}
+    fake = FakeCalendar(page_size=2)
+    standup = fake.put(ev(5, 9, 10, summary="Standup"))
+    fake.put(ev(5, 9, 11, summary="Review"))  # overlaps the standup
+    fake.put(ev(5, 12, 17, summary="Workshop"))
+    fake.put(ev(5, 11, 12, summary="Lunch?", transparency="transparent"))  # free
+    sync = CalendarSync(source_factory=lambda user_id: fake, min_interval=0)
+    cache = sync.sync("u1", now=t(5, 8))
+    assert fake.calls == 2 and len(cache.events) == 4  # two pages
+    assert cache.busy() == [(t(5, 9), t(5, 11)), (t(5, 12), t(5, 17))]
+    assert cache.free_slots(60, t(5, 8)) == [(t(5, 11), t(5, 12)), (t(5, 17), t(5, 18)), (t(6, 9), t(6, 10))]
+
+    fake.delete(standup["id"])
+    fake.put(ev(5, 17, 18, summary="Late call"))
+    calls = fake.calls
+    before = cache
+    cache = sync.sync("u1", now=t(5, 8))
+    assert fake.calls == calls + 1 and standup["id"] not in cache.events  # only the two changes
+    assert standup["id"] in before.events and cache is not before  # a handed-out cache is never mutated
+    assert cache.free_slots(90, t(5, 8), limit=2) == [(t(6, 9), t(6, 10, 30)), (t(7, 9), t(7, 10, 30))]
+
+    # a sync without changes shares the previous cache's events instead of copying them
+    assert sync.sync("u1", now=t(5, 8)).events is cache.events
+    assert [e["summary"] for e in cache.upcoming(now=t(5, 12, 30))] == ["Workshop", "Late call"]
+    assert cache.upcoming(now=t(5, 18)) == []
+    # events that ended before the sync window (a day back) are dropped
+    pruned = sync.sync("u1", now=t(6, 11, 30))
+    assert len(pruned.events) == 3 and "Late call" in [e["summary"] for e in pruned.upcoming(now=t(5, 8))]
+    assert pruned.busy() == [(t(5, 12), t(5, 18))] and len(cache.events) == 4
+
+    fake.expire_tokens()
+    assert len(sync.sync("u1", now=t(5, 8)).events) == 4  # 410 -> full resync
+    # all-day events block the whole day in the calendar's time zone
+    ny = FakeCalendar(timezone_name="America/New_York")
+    ny.put({"start": {"date": "2026-01-07"}, "end": {"date": "2026-01-08"}, "summary": "Offsite"})
+    ny_cache = CalendarSync(source_factory=lambda user_id: ny).sync("u2", now=t(5, 8))
+    assert ny_cache.busy() == [(t(7, 5), t(8, 5))]
+    assert find_free_slots([], 30, t(5, 17, 45), day_start=9, day_end=18, limit=1) == [(t(6, 9), t(6, 9, 30))]
+    now = datetime.now(timezone.utc)
+    busy_until = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=3)
+    suggestion = gcal.suggest_block_and_optionally_create(minutes=60, busy=[(now, busy_until)])["suggestion"]
+    assert datetime.fromisoformat(suggestion["start"]) == busy_until.replace(hour=9)
+    assert len(suggestion["alternatives"]) == 2
+
+
+def test_analytics_writer_batches_rotates_and_bounds_queue(tmp_path, monkeypatch):
+    import gzip, json, os, threading
+    from src.empowering_agents.integrations import analytics
+    from src.empowering_agents.integrations.analytics import AnalyticsWriter, DROP_NEWEST, DROP_OLDEST
+    path = str(tmp_path / "events" / "analytics.jsonl")
+    writer = AnalyticsWriter(path, max_batch=200, flush_interval=60, rotate_bytes=20000, compress=True)
+    writers, write = set(), writer._write
+    def tracked_write(lines):
+        writers.add(threading.current_thread().name)
+        write(lines)
+    writer._write = tracked_write
+    for i in range(2000):
+        writer.record("turn", {"i": i})
+    assert writer.flush()
+    stats = writer.stats()
+    assert stats["written"] == 2000 and stats["batches"] < 100 and stats["rotations"] >= 1
+    assert writers == {"analytics-writer"}  # no I/O on the caller's thread
+    writer.close()
+    segments = sorted(p for p in (tmp_path / "events").iterdir() if p.name.endswith(".gz"))
+    lines = [l for seg in segments for l in gzip.open(seg, "rt")]
+    lines += open(path).readlines() if os.path.exists(path) else []
+    assert [json.loads(l)["data"]["i"] for l in lines] == list(range(2000))
+
+    for policy, kept in ((DROP_NEWEST, list(range(10))), (DROP_OLDEST, list(range(5, 15)))):
+        p = str(tmp_path / f"{policy}.jsonl")
+        w = AnalyticsWriter(p, max_batch=1000, flush_interval=60, max_queue=10, overflow=policy)
+        for i in range(15):
+            w.record("e", {"i": i})
+        assert w.stats()["dropped"] == 5
+        w.close()
+        assert [json.loads(l)["data"]["i"] for l in open(p)] == kept
+
+    # an unserializable event is dropped; the writer thread keeps going
+    circular = {"i": 1}
+    circular["self"] = circular
+    w = AnalyticsWriter(str(tmp_path / "bad.jsonl"), flush_interval=60)
+    w.record("e", {"i": 0})
+    w.record("e", circular)
+    assert w.flush()
+    w.record("e", {"i": 2})
+    assert w.flush() and w.stats()["written"] == 2 and w.stats()["dropped"] == 1
+    w.close()
+
+    monkeypatch.setenv("ANALYTICS_LOG", str(tmp_path / "default.jsonl"))
+    analytics.record_event("signup", {"user": "u1"})
+    analytics.flush_events()
+    assert json.loads(open(tmp_path / "default.jsonl").read())["type"] == "signup"
+    analytics.close_writers()
+
+
+def test_analytics_store_ingests_incrementally_and_aggregates(tmp_path, monkeypatch):
+    import gzip, json, os
+    from src.empowering_agents.integrations import analytics_store
+    from src.empowering_agents.integrations.analytics_store import EventStore
+    monkeypatch.setattr(analytics_store, "CHUNK_ROWS", 40)
+    log = tmp_path / "events.jsonl"
+    def line(i):
+        return json.dumps({"ts": f"2026-03-0{1 + i // 24}T{i % 24:02d}:30:00", "type": "turn" if i % 3 else "signup",
+                           "data": {"user_id": f"u{i % 4}", "persona": "coach" if i % 2 else "navigator", "value": i}}) + "\n"
+    with gzip.open(str(log) + ".20260301-000000-000000.gz", "wt") as f:
+        f.writelines(line(i) for i in range(0, 48))  # 1-2 March
+    log.write_text("".join(line(i) for i in range(48, 60)))
+    store = EventStore(str(tmp_path / "store"), str(log))
+    assert store.ingest() == 60 and store.ingest() == 0
+
+    with open(log, "a") as f:
+        f.writelines(line(i) for i in range(60, 72))
+        f.write('{"ts": "2026-03-03T23:59')  # torn tail is left for the next ingest
+    assert store.ingest() == 12
+    with open(log, "a") as f:
+        f.write(':00", "type": "turn", "data": {}}\n')
+    os.replace(log, str(log) + ".20260304-000000-000000")  # rotated: only the new line is read
+    assert store.ingest() == 1
+
+    store = EventStore(str(tmp_path / "store"), str(log))  # reopened from the manifest
+    assert store.count() == 73 and len(store.manifest["chunks"]) >= 2
+    assert store.count("signup") == 24
+    assert store.count(start="2026-03-02T00:00:00", end="2026-03-03T00:00:00") == 24
+    assert store.count(user="u1", persona="coach") == 18
+    hours = store.timeseries("1h", start="2026-03-01T12:00:00", end="2026-03-04T00:00:00")
+    assert len(hours) == 60 and hours[-1][1] == 2  # 23:30 and 23:59 on the 3rd share a bucket
+    assert sum(v for _, v in store.timeseries("1d", agg="sum")) == sum(range(72))
+    assert store.breakdown("persona") == {"coach": 36, "navigator": 36, "": 1}
+    assert store.breakdown("user", agg="mean", event_type="signup", top=1) == {"u1": 39.0}
+
+
+def test_crm_store_bulk_upserts_partial_updates_and_exports(tmp_path, monkeypatch):
+    import json, time
+    from src.empowering_agents.integrations import crm
+    from src.empowering_agents.integrations.crm import CRMStore
+    legacy = tmp_path / "crm.json"
+    legacy.write_text(json.dumps({"Ada@Example.com": {"name": "Ada", "plan": "free"}}))
+    store = CRMStore(str(tmp_path / "crm.db"), legacy_json=str(legacy))
+    assert store.get("ada@example.com") == {"name": "Ada", "plan": "free"}  # legacy file imported
+
+    contacts = [(f"user{i}@example.com", {"name": f"User {i}", "score": i, "tags": ["lead"]}) for i in range(5000)]
+    statements = []
+    store._conns.get().set_trace_callback(statements.append)
+    assert store.bulk_upsert(contacts) == 5000
+    store._conns.get().set_trace_callback(None)
+    assert statements.count("BEGIN IMMEDIATE") == statements.count("COMMIT") == 1  # one transaction for 5000 contacts
+    assert store.count() == 5001
+
+    since = time.time()
+    assert store.upsert(" ADA@example.com ", {"plan": "pro", "name": None}) == {"plan": "pro"}
+    store.bulk_upsert({"user7@example.com": {"score": 70}, "user8@example.com": {"score": 8}})  # user8 unchanged
+    assert store.get("user7@example.com") == {"name": "User 7", "score": 70, "tags": ["lead"]}
+    assert [email for email, _ in store.export(updated_since=since)] == ["ada@example.com", "user7@example.com"]
+    store.delete("user9@example.com")
+    assert store.get("user9@example.com") is None and store.count() == 5000
+    changes = dict(store.export(updated_since=since))
+    assert changes["ada@example.com"] == {"name": None, "plan": "pro"}  # removal reported as a tombstone
+    assert changes["user9@example.com"] == {"name": None, "score": None, "tags": None}
+    store.upsert("user9@example.com", {"name": "User 9 again"})
+    assert store.get("user9@example.com") == {"name": "User 9 again"}
+
+    exported = list(store.export(batch_size=7))
+    assert all(None not in fields.values() for _, fields in exported)
+    assert len(exported) == 5001 and [e for e, _ in exported] == sorted(e for e, _ in exported)
+    out = tmp_path / "contacts.jsonl"
+    assert store.export_jsonl(str(out)) == 5001
+    copy = CRMStore(str(tmp_path / "copy.db"))
+    assert copy.import_json(str(out)) == 5001 and copy.get("user7@example.com")["score"] == 70
+    copy.close()
+    store.close()
+
+    # a database from before tombstones (value NOT NULL) is migrated in place
+    import sqlite3
+    old = sqlite3.connect(str(tmp_path / "old.db"))
+    old.execute("CREATE TABLE contact_fields (email TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (email, field)) WITHOUT ROWID")
+    old.execute("INSERT INTO contact_fields VALUES ('x@y.co', 'name', '\"X\"', 1.0)")
+    old.commit()
+    old.close()
+    migrated = CRMStore(str(tmp_path / "old.db"))
+    migrated.delete("x@y.co")
+    assert migrated.get("x@y.co") is None and dict(migrated.export(updated_since=0)) == {"x@y.co": {"name": None}}
+    migrated.close()
+
+    monkeypatch.setenv("CRM_DB_PATH", str(tmp_path / "default.db"))
+    monkeypatch.setattr(crm, "_STORE", None)
+    monkeypatch.setattr(crm, "CRM_FILE", str(tmp_path / "missing.json"))
+    assert crm.upsert_contact("a@b.co", {"source": "webinar"}) == {"ok": True}
+    assert crm.get_crm_store().get("a@b.co") == {"source": "webinar"}
+    crm.get_crm_store().close()
+
+
+def test_notification_dispatcher_digests_dedupes_limits_and_retries(tmp_path):
+    import json, time
+    from src.empowering_agents.integrations.notifications import Channel, FileChannel, NotificationDispatcher
+    class FlakyChannel(Channel):
+        def __init__(self, failures):
+            self.failures, self.sent = failures, []
+        async def send(self, digest):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("provider unavailable")
+            self.sent.append((digest.user_id, list(digest.messages), time.monotonic()))
+    async def run():
+        flaky = FlakyChannel(failures=2)
+        d = NotificationDispatcher(
+            channels={"push": flaky, "file": FileChannel(str(tmp_path / "out" / "notes.jsonl")), "broken": FlakyChannel(99)},
+            default_channel="push", workers=2, digest_window=0.05, dedupe_ttl=60, rate=20, burst=2,
+            max_retries=3, backoff=0.01,
+        )
+        start = time.monotonic()
+        assert d.enqueue("u1", "Goal reached!") and d.enqueue("u1", "Streak: 3 days")
+        assert not d.enqueue("u1", "Goal reached!")  # duplicate
+        for i in range(5):
+            d.enqueue(f"u{i + 2}", "Weekly summary ready")
+        d.enqueue("u1", "Saved to file", channel="file")
+        d.enqueue("u1", "never delivered", channel="broken")
+        assert flaky.sent == [] and flaky.failures == 2  # enqueue does not wait on delivery
+        await asyncio.sleep(0.02)
+        await d.flush()
+        assert sorted(m for _, m, _ in flaky.sent)[0] == ["Goal reached!", "Streak: 3 days"]  # one digest
+        assert len(flaky.sent) == 6
+        times = sorted(t for _, _, t in flaky.sent)
+        assert times[-1] - start >= (6 + 2 - 2) / 20 * 0.9  # burst 2, then 20/s (incl. the 2 failed attempts)
+        stats = d.stats()
+        assert stats["deduplicated"] == 1 and stats["retried"] >= 2 and stats["failed"] == 1
+        assert d.failed[0][0].messages == ["never delivered"] and d.failed[0][0].attempts == 4
+        assert json.loads((tmp_path / "out" / "notes.jsonl").read_text())["messages"] == ["Saved to file"]
+        await d.close()
+        # a message dropped on a full queue is not remembered for dedupe
+        full = NotificationDispatcher(channels={"push": FlakyChannel(0)}, workers=1, digest_window=0, max_queue=1)
+        assert full.enqueue("u1", "first", channel="push")
+        assert not full.enqueue("u1", "second", channel="push")
+        await full.flush()
+        assert full.enqueue("u1", "second", channel="push")
+        assert full.stats()["dropped"] == 1 and full.stats()["deduplicated"] == 0
+        await full.close()
+    asyncio.run(run())
+    # digests left open when their event loop ends are counted as dropped, not deduplicated
+    spanning = NotificationDispatcher(channels={"push": FlakyChannel(0)}, workers=1, digest_window=60)
+    async def enqueue(message):
+        return spanning.enqueue("u1", message, channel="push")
+    assert asyncio.run(enqueue("later"))
+    assert asyncio.run(enqueue("later"))
+    assert spanning.stats()["dropped"] == 1 and spanning.stats()["deduplicated"] == 0
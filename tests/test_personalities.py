@@ -7,3 +7,25 @@ def test_fitness_coach_runs():
         r = await agent.interact("u1", "I only have 10 minutes.")
         assert isinstance(r.message, str)
     asyncio.run(run())
+
+def test_fitness_coach_streams():
+    async def run():
+        agent = FitnessCoach(llm_config={})
+        chunks = [c async for c in agent.interact_stream("u1", "I only have 10 minutes.")]
+        assert len(chunks) > 1
+        assert agent.memory_system.user_memories["u1"]["interactions"][-1]["agent_response"]
+    asyncio.run(run())
+
+def test_single_pass_mode_uses_one_llm_call():
+    async def run():
+        agent = FitnessCoach(llm_config={}, interaction_mode="single_pass")
+        calls = []
+        generate = agent.llm.generate
+        async def counting_generate(prompt):
+            calls.append(prompt)
+            return await generate(prompt)
+        agent.llm.generate = counting_generate
+        r = await agent.interact("u1", "I only have 10 minutes.")
+        assert isinstance(r.message, str)
+        assert len(calls) == 1
+    asyncio.run(run())